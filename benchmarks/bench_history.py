@@ -0,0 +1,78 @@
+"""Benchmark building a year of smell history for a generated repository.
+
+A fixture repo gets ``--commits`` commits spread over a year, each rewriting
+``--churn`` of the files. ``iter_history`` walks them with one ``git
+diff-tree`` per commit and analyzes each distinct file version once, where
+analyzing every commit from scratch would analyze every file of every
+commit. Both counts are reported with the wall time per stage, the time of a
+second run that has nothing new to do, and of a weekly series query.
+
+    python -m benchmarks.bench_history
+    python -m benchmarks.bench_history --size medium --commits 250 --churn 0.02
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+
+from benchmarks.corpus import SIZES, make_fixture_repo
+from detector.app import collect_analysis
+from detector.cache import AnalysisCache
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", choices=sorted(SIZES), default="medium")
+    parser.add_argument("--commits", type=int, default=250, help="commits over the year")
+    parser.add_argument("--churn", type=float, default=0.02, help="share of the files each commit rewrites")
+    parser.add_argument("--workers", type=int, help="analysis processes (default ANALYSIS_WORKERS)")
+    args = parser.parse_args(argv)
+
+    root = tempfile.mkdtemp(prefix="bench-history-")
+    cwd = os.getcwd()
+    try:
+        repo_dir = os.path.join(root, "repo")
+        make_fixture_repo(repo_dir, SIZES[args.size], commits=args.commits, churn=args.churn,
+                          interval=timedelta(days=365) / args.commits)
+        os.chdir(root)  # the history clone and the report store go under .smell_cache here
+        # Imported after the chdir: the report store resolves its path on first use.
+        from detector.history import iter_history
+        from detector.report_store import report_store
+
+        def run():
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = collect_analysis(iter_history(repo_dir, "2023-12-31", args.workers,
+                                                       AnalysisCache(max_bytes=0)))
+            return time.perf_counter() - start, result["metadata"]
+
+        cold, metadata = run()
+        files = SIZES[args.size].python_files + SIZES[args.size].js_files
+        print(f"[+] {metadata['commits']} commits, {files} files each: {metadata['commits'] * files} file versions, "
+              f"{metadata['blobs']} distinct ({metadata['python_files'] + metadata['js_files']} analyzed)")
+        print(f"[+] History built in {cold:.2f}s")
+        for stage, seconds in sorted(metadata.get("timings", {}).get("stages", {}).items()):
+            print(f"    {stage:<14} {seconds:>8.2f}s")
+        analysis = metadata.get("timings", {}).get("stages", {}).get("analysis")
+        if analysis:
+            per_file = analysis / max(1, metadata["python_files"] + metadata["js_files"])
+            print(f"[+] Analyzing every commit from scratch: ~{per_file * metadata['commits'] * files:.0f}s of analysis")
+
+        warm, metadata = run()
+        print(f"[+] Second run ({metadata['new_commits']} new commits): {warm:.2f}s")
+
+        start = time.perf_counter()
+        points = report_store().series(repo_dir, smell="High Complexity Functions", interval="week")
+        print(f"[+] Weekly 'High Complexity Functions' series: {len(points)} points in "
+              f"{(time.perf_counter() - start) * 1000:.1f} ms")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
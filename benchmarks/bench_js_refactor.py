@@ -0,0 +1,104 @@
+"""Benchmark refactor_js_code against the old one-pass-per-replacement refactorings.
+
+The old refactorings ran a ``re.sub``/``str.replace`` over the whole source
+for every global variable, magic number and callback, and matched raw text,
+so "10" was also replaced inside "100", in strings and in identifiers.
+``refactor_js_code`` tokenizes once and applies all edits by offset in one
+pass. Both run over generated files with hundreds of literals; for each the
+time is reported along with how many string literals came out changed
+(the rewrite must leave all of them intact).
+
+    python -m benchmarks.bench_js_refactor
+"""
+import gc
+import random
+import re
+import time
+from dataclasses import replace
+
+from benchmarks.corpus import CorpusSpec, generate_js_file
+from detector.js_lexer import BraceIndex, IdentifierIndex, tokenize, COMMENT, NAME, NUMBER, STRING
+from refactor.js_refactor import refactor_js_code
+
+
+def js_smells(code):
+    """The refactor_js_code smells of ``code``: globals, magic numbers, unused variables and inline callbacks."""
+    tokens = [token for token in tokenize(code) if token.kind != COMMENT]
+    unused = IdentifierIndex(tokens).unused_declarations()
+    braces = BraceIndex(tokens)
+    callbacks = []
+    for i, token in enumerate(tokens[1:], 1):
+        if token.kind == NAME and token.value == "function" and tokens[i - 1].value in (",", "("):
+            close = braces.matching_brace(token.start)
+            if close != -1:
+                callbacks.append(code[token.start:close + 1])
+    return {
+        "Global Variables Found": {"details": unused},
+        "Magic Numbers Found": {"details": [t.value for t in tokens if t.kind == NUMBER and t.value not in ("0", "1")]},
+        "Unused Variables": {"details": unused},
+        "Deep Nesting": {"details": callbacks},
+    }
+
+
+def legacy_refactor(code, smells):
+    """refactor_js_code before the rewrite engine (globals, magic numbers, unused variables, callbacks, comments)."""
+    for var in smells["Global Variables Found"]["details"]:
+        code = re.sub(rf'\b{var}\b', f'window.{var}', code)
+        code = code.replace(f"var {var}", f"let {var}")
+        code = code.replace(f"const {var}", f"let {var}")
+
+    magic_numbers = smells["Magic Numbers Found"]["details"]
+    constants = {num: f"const {num}_VALUE = {num};" for num in set(magic_numbers)}
+    code = "\n".join(constants.values()) + "\n\n" + code
+    for num in set(magic_numbers):
+        code = code.replace(str(num), f"{num}_VALUE")
+
+    replacements = {var: f"// {var} (Unused variable)" for var in smells["Unused Variables"]["details"]}
+    code = IdentifierIndex.from_code(code).substitute(code, replacements)
+
+    nested_callbacks = smells["Deep Nesting"]["details"]
+    for callback in nested_callbacks:
+        code = code.replace(callback, callback.replace("function", "async function"))
+        nested_function_name = f"handleNestedCallback{nested_callbacks.index(callback)}"
+        code = code.replace(callback, nested_function_name)
+        code = f"async function {nested_function_name}() {{\n{callback}\n}};\n" + code
+
+    code = re.sub(r'//.*', '', code)
+    code = re.sub(r'/\*.*?\*/', '', code, flags=re.DOTALL)
+    return code
+
+
+def changed_strings(original, refactored):
+    """String literals of ``original`` that no longer appear in ``refactored``."""
+    strings = [token.value for token in tokenize(original) if token.kind == STRING]
+    return sum(1 for value in strings if value not in refactored)
+
+
+def measure(fn, code, smells):
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        result = fn(code, smells)
+        return time.perf_counter() - start, result
+    finally:
+        gc.enable()
+
+
+def main():
+    print(f"{'lines':>6} {'numbers':>8} {'globals':>8} {'callbacks':>10} {'legacy (s)':>11} {'rewrite (s)':>12} "
+          f"{'strings changed (legacy / rewrite)':>36}")
+    for functions in (50, 200, 600):
+        code = generate_js_file(random.Random(functions), replace(CorpusSpec(), functions=functions))
+        # Literal strings that contain numbers and "//", which raw-text passes used to rewrite.
+        code = code.replace("'{not a brace}'", "'see http://example.com/v2 or 404'")
+        smells = js_smells(code)
+        legacy_time, legacy_result = measure(legacy_refactor, code, smells)
+        rewrite_time, rewrite_result = measure(refactor_js_code, code, smells)
+        print(f"{code.count(chr(10)):>6} {len(set(smells['Magic Numbers Found']['details'])):>8} "
+              f"{len(smells['Global Variables Found']['details']):>8} {len(smells['Deep Nesting']['details']):>10} "
+              f"{legacy_time:>11.3f} {rewrite_time:>12.3f} "
+              f"{changed_strings(code, legacy_result):>27} / {changed_strings(code, rewrite_result):<6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Latency and correctness of LLM refactoring: whole file vs. chunked by function/class.
+
+No model is called. ``FakeLLM`` stands in for ChatGroq: it answers in the
+same shape (a ``<think>`` preamble, then the code in a fenced block), takes
+time proportional to the tokens it writes, and cuts its answer off at
+``max_tokens`` like the real endpoint. It echoes the code it was given, so a
+correct result is the input file itself; anything else means code was lost
+(a truncated answer) or stitched back in the wrong place.
+
+    python -m benchmarks.bench_llm_chunks
+    python -m benchmarks.bench_llm_chunks --functions 120 --token-ms 2
+"""
+import argparse
+import ast
+import random
+import re
+import time
+from dataclasses import replace
+
+from benchmarks.corpus import CorpusSpec, generate_js_file, generate_python_file
+from detector.js_analyzer import analyze_js_source
+from detector.py_analyzer import analyze_py_source
+from refactor.llm_refactor import (LLM_CONCURRENCY, build_prompt, extract_code_from_response, plan_chunks,
+                                   refactor_in_chunks)
+
+CHARS_PER_TOKEN = 4
+
+
+class FakeLLM:
+    """Echoes the prompt's code after ``first_token_ms``, plus ``token_ms`` per output token, up to ``max_tokens``."""
+
+    def __init__(self, token_ms, first_token_ms, max_tokens):
+        self.token_ms = token_ms
+        self.first_token_ms = first_token_ms
+        self.max_tokens = max_tokens
+
+    def invoke(self, prompt):
+        # refactor.txt separates the sections with a literal backslash-n.
+        code = re.search(r"### Code with smells:(.*?)(?:\\n)?### Detected Smells:", prompt, re.DOTALL).group(1)
+        code = code.strip("\n")
+        fence = "```python" if _looks_like_python(code) else "```javascript"
+        answer = f"<think>\nThe smells are local; refactor them.\n</think>\n{fence}\n{code}\n```"
+        limit = self.max_tokens * CHARS_PER_TOKEN
+        answer = answer[:limit]
+        time.sleep((self.first_token_ms + self.token_ms * len(answer) / CHARS_PER_TOKEN) / 1000)
+        return answer
+
+
+def _looks_like_python(code):
+    return re.search(r"^(def|class) ", code, re.MULTILINE) is not None
+
+
+def _correct(language, original, result):
+    if result.strip() != original.strip():
+        return False
+    if language == "python":
+        try:
+            ast.parse(result)
+        except SyntaxError:
+            return False
+    return True
+
+
+def run(language, code, template, llm, workers):
+    smells = analyze_py_source(code)[0] if language == "python" else analyze_js_source(code)[0]
+
+    start = time.perf_counter()
+    whole = extract_code_from_response(llm.invoke(build_prompt(template, code, smells)))
+    whole_seconds = time.perf_counter() - start
+
+    chunks = plan_chunks(code, language, smells)
+    if chunks is None:
+        print(f"[-] {language}: no chunk plan (file too short or no unit-level smells)")
+        return
+    start = time.perf_counter()
+    chunked, replaced = refactor_in_chunks(
+        code, language, chunks,
+        lambda unit, unit_smells: extract_code_from_response(llm.invoke(build_prompt(template, unit, unit_smells))),
+        workers)
+    chunked_seconds = time.perf_counter() - start
+
+    print(f"{language:<11} {code.count(chr(10)):>6} {len(code) // CHARS_PER_TOKEN:>7} {len(chunks):>7}"
+          f" {whole_seconds:>9.2f} {str(_correct(language, code, whole)):>8}"
+          f" {chunked_seconds:>10.2f} {str(_correct(language, code, chunked)):>10} {replaced:>9}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--functions", type=int, default=60, help="functions in each generated file")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--token-ms", type=float, default=0.5, help="simulated milliseconds per output token")
+    parser.add_argument("--first-token-ms", type=float, default=300, help="simulated latency before the first token")
+    parser.add_argument("--max-tokens", type=int, default=4096, help="output budget per answer, as in server.LLM_PARAMS")
+    parser.add_argument("--workers", type=int, default=LLM_CONCURRENCY, help="chunks in flight at once")
+    args = parser.parse_args(argv)
+
+    with open("refactor.txt", "r") as f:
+        template = f.read()
+    llm = FakeLLM(args.token_ms, args.first_token_ms, args.max_tokens)
+    spec = replace(CorpusSpec(), functions=args.functions)
+    rng = random.Random(args.seed)
+    python_code = generate_python_file(rng, spec)
+    js_code = generate_js_file(rng, spec)
+
+    print(f"{'language':<11} {'lines':>6} {'tokens':>7} {'chunks':>7} {'whole s':>9} {'correct':>8}"
+          f" {'chunked s':>10} {'correct':>10} {'replaced':>9}")
+    run("python", python_code, template, llm, args.workers)
+    run("javascript", js_code, template, llm, args.workers)
+    return 0
+
+
+if __name__ == "__main__":
+    main()
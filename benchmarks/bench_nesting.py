@@ -0,0 +1,82 @@
+"""Benchmark per-function nesting/return aggregates on deeply nested modules.
+
+Compares the old per-function recursion (``get_nesting_depth`` plus an
+``ast.walk`` per function for returns) against ``compute_function_stats``.
+The old cost grows with nesting depth times module size, the new one only
+with module size.
+
+    python -m benchmarks.bench_nesting
+"""
+import ast
+import gc
+import time
+
+from detector.py_visitor import compute_function_stats
+
+
+def generate_nested_module(total_lines, depth):
+    """Build a module of ``total_lines`` lines made of chains of ``depth`` nested functions."""
+    lines = []
+    chain = 0
+    while len(lines) < total_lines:
+        for level in range(depth):
+            pad = "    " * level
+            lines.append(f"{pad}def f{chain}_{level}(a, b):")
+            lines.append(f"{pad}    if a.x > b.y:")
+            lines.append(f"{pad}        return a")
+        lines.append("    " * depth + "return b")
+        chain += 1
+    return "\n".join(lines) + "\n"
+
+
+def legacy_function_stats(tree):
+    def get_nesting_depth(node, depth=0):
+        if isinstance(node, (ast.If, ast.For, ast.While, ast.With, ast.FunctionDef)):
+            depth += 1
+        max_depth = depth
+        for child in ast.iter_child_nodes(node):
+            max_depth = max(max_depth, get_nesting_depth(child, depth))
+        return max_depth
+
+    def count_return_statements(node):
+        return sum(1 for n in ast.walk(node) if isinstance(n, ast.Return))
+
+    deeply_nested = [(node.name, get_nesting_depth(node)) for node in ast.walk(tree)
+                     if isinstance(node, ast.FunctionDef) and get_nesting_depth(node) > 3]
+    many_returns = [(node.name, count_return_statements(node)) for node in ast.walk(tree)
+                    if isinstance(node, ast.FunctionDef) and count_return_statements(node) > 3]
+    return deeply_nested, many_returns
+
+
+def single_pass_stats(tree):
+    stats = compute_function_stats(tree)
+    functions = [node for node in ast.walk(tree) if isinstance(node, ast.FunctionDef)]
+    deeply_nested = [(node.name, stats[node].max_depth) for node in functions if stats[node].max_depth > 3]
+    many_returns = [(node.name, stats[node].returns) for node in functions if stats[node].returns > 3]
+    return deeply_nested, many_returns
+
+
+def time_it(fn, tree):
+    # Like timeit, keep the cyclic GC out of the measurement.
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        result = fn(tree)
+        return time.perf_counter() - start, result
+    finally:
+        gc.enable()
+
+
+def main():
+    print(f"{'lines':>7} {'depth':>6} {'legacy (s)':>11} {'single (s)':>11} {'us/line':>8}")
+    for total_lines, depth in [(5000, 30), (10000, 30), (20000, 30), (20000, 60), (20000, 90)]:
+        tree = ast.parse(generate_nested_module(total_lines, depth))
+        legacy_time, legacy_result = time_it(legacy_function_stats, tree)
+        new_time, new_result = time_it(single_pass_stats, tree)
+        assert legacy_result == new_result, "aggregates differ from the legacy implementation"
+        print(f"{total_lines:>7} {depth:>6} {legacy_time:>11.3f} {new_time:>11.3f} "
+              f"{new_time / total_lines * 1e6:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Benchmark how often a Python file is parsed/tokenized per analysis.
+
+The legacy path handed the source string to radon's ``cc_visit``, ``h_visit``,
+``mi_visit`` (which parses and runs Halstead, complexity and the raw counts
+again) and ``analyze``, then called ``ast.parse`` for the detectors.
+``analyze_py_source`` builds one ParsedSource and shares it. Both are run on
+the same generated modules; smells and metrics must be identical.
+
+    python -m benchmarks.bench_parse
+"""
+import ast
+import gc
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+from unittest import mock
+
+import radon.raw
+from radon.complexity import cc_visit
+from radon.metrics import h_visit, mi_visit
+
+from detector.py_analyzer import PY_DETECTORS, analyze_py_source
+from detector.py_visitor import DetectorEngine, compute_function_stats
+
+
+def generate_module(functions):
+    """A module of ``functions`` small functions with branches, loops, docstrings and comments."""
+    lines = ['"""Generated module."""', "import os", ""]
+    for i in range(functions):
+        lines += [
+            f"def handler_{i}(request, config, retries={i % 7}):",
+            f'    """Handle request {i}."""',
+            "    total = 0",
+            "    for item in request.items:",
+            "        # skip disabled items",
+            f"        if item.flags & {i % 5} and config.enabled:",
+            "            total += item.value * retries",
+            "        elif item.value > 100:",
+            "            total -= os.path.getsize(item.name)",
+            "    while total > 1000:",
+            "        total //= 2",
+            "    return total",
+            "",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def legacy_analyze(code):
+    """analyze_py_source before ParsedSource, radon checks included."""
+    smells = []
+    metrics = {}
+    complexity_results = cc_visit(code)
+    high_complexity = [(func.name, func.complexity) for func in complexity_results if func.complexity > 10]
+    if high_complexity:
+        smells.append(f"High Complexity Functions (>10): {len(high_complexity)} - {[f'{n}({c})' for n, c in high_complexity]}")
+    halstead_metrics = h_visit(code)
+    maintainability_index = mi_visit(code, halstead_metrics)
+    if maintainability_index < 20:
+        smells.append(f"Low Maintainability Index (<20): {maintainability_index:.2f}")
+    raw_metrics = radon.raw.analyze(code)
+    metrics["total_lines"] = raw_metrics.loc
+    if raw_metrics.loc > 500:
+        smells.append(f"Large File (>500 lines): {raw_metrics.loc} lines")
+
+    # The radon checks are the first three detectors; the rest ran on their own tree.
+    tree = ast.parse(code)
+    engine = DetectorEngine(detector() for detector in PY_DETECTORS[3:])
+    engine.run(SimpleNamespace(tree=tree, function_stats=compute_function_stats(tree)))
+    engine.report(smells, metrics)
+    return smells, metrics
+
+
+@contextmanager
+def count_parses():
+    """Count ``ast.parse`` calls and radon raw (tokenizer) passes made inside the block."""
+    counts = {"ast.parse": 0, "raw": 0}
+    parse = ast.parse
+    analyze = radon.raw.analyze
+
+    def counting_parse(*args, **kwargs):
+        counts["ast.parse"] += 1
+        return parse(*args, **kwargs)
+
+    def counting_analyze(*args, **kwargs):
+        counts["raw"] += 1
+        return analyze(*args, **kwargs)
+
+    with mock.patch("ast.parse", counting_parse), \
+            mock.patch("radon.raw.analyze", counting_analyze), \
+            mock.patch("radon.metrics.analyze", counting_analyze), \
+            mock.patch("detector.parsed_source.analyze", counting_analyze):
+        yield counts
+
+
+def measure(fn, modules):
+    with count_parses() as counts:
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            results = [fn(code) for code in modules]
+            elapsed = time.perf_counter() - start
+        finally:
+            gc.enable()
+    return elapsed, dict(counts), results
+
+
+def main():
+    print(f"{'files':>6} {'funcs':>6} {'legacy parses':>14} {'shared parses':>14} "
+          f"{'legacy (s)':>11} {'shared (s)':>11}")
+    for files, functions in [(50, 20), (20, 100), (5, 400)]:
+        modules = [generate_module(functions + f) for f in range(files)]
+        legacy_time, legacy_counts, legacy_results = measure(legacy_analyze, modules)
+        shared_time, shared_counts, shared_results = measure(analyze_py_source, modules)
+        assert legacy_results == shared_results, "smells/metrics differ from the legacy analysis"
+        print(f"{files:>6} {functions:>6} "
+              f"{legacy_counts['ast.parse']:>6} + {legacy_counts['raw']:>3} raw "
+              f"{shared_counts['ast.parse']:>6} + {shared_counts['raw']:>3} raw "
+              f"{legacy_time:>11.3f} {shared_time:>11.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Benchmark refactor_python_code against applying each refactoring to the source on its own.
+
+Before the pipeline every tree refactoring parsed the current code and
+regenerated it with astor, so ten smells meant ten round trips.
+``refactor_python_code`` now runs consecutive tree refactorings over one
+parsed tree and regenerates once. Both run over the same generated modules
+and smell lists; the refactored code must be identical.
+
+    python -m benchmarks.bench_refactor_pipeline
+"""
+import ast
+import gc
+import random
+import time
+from contextlib import contextmanager
+from unittest import mock
+
+import astor
+
+from benchmarks.corpus import CorpusSpec, generate_python_file
+from refactor.py_refactor import REFACTOR_FUNCTIONS, SMELL_KEYWORDS, refactor_python_code
+
+TREE_SMELLS = [
+    "High Complexity Functions (>10): 3 - ['a(12)', 'b(14)', 'c(11)']",
+    "Too Many Returns (>3): 4",
+    "Useless Exceptions: 2",
+    "Large Classes (>12 methods): 1",
+    "Deeply Nested Functions (>3 levels): 2",
+    "Large Functions (>100 lines): 1",
+    "Low Maintainability Index (<20): 12.00",
+    "Data Clumps: 2 - [('items', 'config', 'context')]",
+    "Dead Code Variables: 1 - ['unused_path']",
+    "Too Many Returns (>3): 4",
+]
+MIXED_SMELLS = TREE_SMELLS[:4] + [
+    "Shotgun Surgery (called from >5 places): 1 - [('helper_1', 7)]",
+] + TREE_SMELLS[4:8] + [
+    "Large File (>500 lines): 3000 lines",
+]
+
+
+def legacy_refactor(code, smell_list):
+    """refactor_python_code before the pipeline: one parse/regenerate round trip per tree refactoring."""
+    for smell_description in smell_list:
+        for keyword, smell_type in SMELL_KEYWORDS.items():
+            if keyword in smell_description:
+                refactor_fn = REFACTOR_FUNCTIONS.get(smell_type)
+                if refactor_fn:
+                    try:
+                        code = refactor_fn(code, smell_description)
+                    except Exception as e:
+                        print(f"Error while refactoring {smell_type}: {e}")
+                break
+    return code
+
+
+@contextmanager
+def count_round_trips():
+    """Count ``ast.parse`` and ``astor.to_source`` calls made inside the block."""
+    counts = {"parse": 0, "to_source": 0}
+    parse = ast.parse
+    to_source = astor.to_source
+
+    def counting_parse(*args, **kwargs):
+        counts["parse"] += 1
+        return parse(*args, **kwargs)
+
+    def counting_to_source(*args, **kwargs):
+        counts["to_source"] += 1
+        return to_source(*args, **kwargs)
+
+    with mock.patch("ast.parse", counting_parse), mock.patch("astor.to_source", counting_to_source):
+        yield counts
+
+
+def measure(fn, code, smells):
+    with count_round_trips() as counts:
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            result = fn(code, smells)
+            elapsed = time.perf_counter() - start
+        finally:
+            gc.enable()
+    return elapsed, dict(counts), result
+
+
+def main():
+    print(f"{'lines':>6} {'smells':>7} {'legacy parse/gen':>17} {'pipeline parse/gen':>19} "
+          f"{'legacy (s)':>11} {'pipeline (s)':>13}")
+    for functions, smells in [(100, TREE_SMELLS), (300, TREE_SMELLS), (300, MIXED_SMELLS)]:
+        code = generate_python_file(random.Random(functions), CorpusSpec(functions=functions, nesting=5))
+        legacy_time, legacy_counts, legacy_result = measure(legacy_refactor, code, smells)
+        pipeline_time, pipeline_counts, pipeline_result = measure(refactor_python_code, code, smells)
+        assert legacy_result == pipeline_result, "refactored code differs from the legacy refactoring"
+        print(f"{code.count(chr(10)):>6} {len(smells):>7} "
+              f"{legacy_counts['parse']:>8} / {legacy_counts['to_source']:>6} "
+              f"{pipeline_counts['parse']:>9} / {pipeline_counts['to_source']:>7} "
+              f"{legacy_time:>11.3f} {pipeline_time:>13.3f}")
+
+
+if __name__ == "__main__":
+    main()
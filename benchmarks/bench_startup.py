@@ -0,0 +1,77 @@
+"""Startup budget of the API server: import time of ``server`` and ``create_app()``.
+
+Each run starts a fresh interpreter with ``python -X importtime`` and sums
+the time spent importing modules. The heavy dependencies (GitPython, radon,
+astor, langchain) and the modules built on them are only imported by the
+routes that need them; the check fails when one of them is loaded at startup
+or when the median import time is over ``--budget-ms``. The time those
+deferred imports add to the first request is reported alongside.
+
+    python -m benchmarks.bench_startup
+    python -m benchmarks.bench_startup --budget-ms 400 --runs 7
+"""
+import argparse
+import importlib.util
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STARTUP = "import server; server.create_app()"
+# Imported by the routes on their first request, never at startup.
+DEFERRED = ["git", "radon", "astor", "langchain", "langchain_groq", "detector.app", "detector.incremental",
+            "detector.git_source", "detector.history", "refactor.py_refactor", "refactor.js_refactor", "refactor.llm_refactor"]
+
+
+def import_times(statement):
+    """``({module: cumulative microseconds}, total microseconds)`` of running ``statement`` in a fresh interpreter."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", statement], cwd=ROOT,
+                            capture_output=True, text=True)
+    if result.returncode:
+        raise RuntimeError(f"{statement!r} failed:\n{result.stderr[-2000:]}")
+    modules = {}
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        if not own.strip().isdigit():
+            continue  # the header line
+        total += int(own)
+        modules[name.strip()] = int(cumulative)
+    return modules, total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters to start; the median is kept")
+    parser.add_argument("--budget-ms", type=float, default=400, help="allowed median import time at startup")
+    args = parser.parse_args(argv)
+
+    totals = []
+    for _ in range(args.runs):
+        modules, total = import_times(STARTUP)
+        totals.append(total)
+    startup_ms = statistics.median(totals) / 1000
+
+    print(f"[+] Startup imports: {startup_ms:.1f} ms median over {args.runs} runs (budget {args.budget_ms:.0f} ms)")
+    top = sorted(((cumulative, name) for name, cumulative in modules.items() if "." not in name), reverse=True)[:8]
+    for cumulative, name in top:
+        print(f"    {name:<24} {cumulative / 1000:>8.1f} ms")
+
+    installed = [name for name in DEFERRED if importlib.util.find_spec(name.split(".")[0]) is not None]
+    _, deferred = import_times(f"{STARTUP}; import " + ", ".join(installed))
+    print(f"[+] Deferred to the first request: {max(0, deferred - statistics.median(totals)) / 1000:.1f} ms "
+          f"({', '.join(installed)})")
+
+    failures = [f"{name} is imported at startup" for name in DEFERRED if name in modules]
+    if startup_ms > args.budget_ms:
+        failures.append(f"startup imports take {startup_ms:.1f} ms, over the {args.budget_ms:.0f} ms budget")
+    for failure in failures:
+        print(f"[-] {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,255 @@
+"""Deterministic synthetic Python/JavaScript sources and git fixture repos.
+
+The same seed and spec always produce byte-identical files (and commits with
+the same ids), so benchmark numbers from different runs and machines measure
+the code, not the input. Files mix the constructs the detectors look at:
+nested branches and callbacks, long functions, magic numbers, duplicated
+bodies, unused variables, lambdas and try/pass blocks.
+"""
+import os
+import random
+from dataclasses import dataclass
+from datetime import datetime
+
+import git
+
+# Fixed identity and clock for fixture commits.
+AUTHOR = git.Actor("Bench Fixture", "bench@example.com")
+COMMIT_DATE = "2024-01-01T00:00:00+0000"
+
+
+@dataclass
+class CorpusSpec:
+    """Size and shape of a generated corpus.
+
+    ``functions`` is per file (each file gets between half and all of it),
+    ``nesting`` the deepest block/callback nesting inside a function and
+    ``dir_depth`` how many directory levels files are spread over.
+    """
+    python_files: int = 40
+    js_files: int = 40
+    functions: int = 12
+    nesting: int = 4
+    dir_depth: int = 2
+    seed: int = 0
+
+
+SIZES = {
+    "small": CorpusSpec(python_files=20, js_files=20, functions=8),
+    "medium": CorpusSpec(python_files=100, js_files=100, functions=15),
+    "large": CorpusSpec(python_files=500, js_files=500, functions=25, nesting=6, dir_depth=3),
+}
+
+_WORDS = ["user", "order", "item", "price", "total", "config", "cache", "event", "node", "path",
+          "result", "value", "count", "index", "buffer", "request", "response", "record", "token", "state"]
+
+
+def _name(rng):
+    first, second = rng.sample(_WORDS, 2)
+    return f"{first}_{second}"
+
+
+def _camel(rng):
+    first, second = rng.sample(_WORDS, 2)
+    return first + second.capitalize()
+
+
+def _python_block(rng, depth, nesting, indent, lines):
+    pad = "    " * indent
+    variable = rng.choice(["total", "count", "value"])
+    if depth < nesting and rng.random() < 0.7:
+        kind = rng.choice(["if", "for", "while", "with"])
+        if kind == "if":
+            lines.append(f"{pad}if {variable} > {rng.randint(2, 500)}:")
+        elif kind == "for":
+            lines.append(f"{pad}for item in items[:{rng.randint(2, 50)}]:")
+        elif kind == "while":
+            lines.append(f"{pad}while {variable} < {rng.randint(100, 900)}:")
+        else:
+            lines.append(f"{pad}with context.scope('{rng.choice(_WORDS)}'):")
+        _python_block(rng, depth + 1, nesting, indent + 1, lines)
+        if kind == "while":
+            lines.append(f"{pad}    {variable} += {rng.randint(1, 9)}")
+    choice = rng.random()
+    if choice < 0.3:
+        lines.append(f"{pad}{variable} += config.{rng.choice(_WORDS)} * {rng.randint(2, 99)}")
+    elif choice < 0.5:
+        lines.append(f"{pad}print('{rng.choice(_WORDS)}', {variable})")
+    elif choice < 0.7:
+        lines.append(f"{pad}helper_{rng.randint(0, 5)}({variable}, items)")
+    else:
+        lines.append(f"{pad}{variable} = {variable} * {rng.randint(2, 20)} + len(items)")
+
+
+def _python_function(rng, name, spec, lines):
+    params = ["items", "config", "context"] + [_name(rng) for _ in range(rng.randint(0, 4))]
+    lines.append(f"def {name}({', '.join(params)}):")
+    lines.append(f'    """{rng.choice(_WORDS).capitalize()} handler."""')
+    lines.append("    total = 0")
+    lines.append("    count = 0")
+    lines.append("    value = 1")
+    if rng.random() < 0.3:
+        lines.append(f"    unused_{rng.choice(_WORDS)} = {rng.randint(0, 9)}")
+    for _ in range(rng.randint(1, 4)):
+        _python_block(rng, 0, rng.randint(1, spec.nesting), 1, lines)
+    if rng.random() < 0.2:
+        lines.append("    try:")
+        lines.append("        value = items[0]")
+        lines.append("    except IndexError:")
+        lines.append("        pass")
+    if rng.random() < 0.2:
+        lines.append("    mapper = lambda x: [x, x + 1, x + 2, x * 2]")
+    for _ in range(rng.randint(0, 3)):
+        lines.append(f"    if total > {rng.randint(10, 1000)}:")
+        lines.append("        return total")
+    lines.append("    return total + count + value")
+    lines.append("")
+
+
+def generate_python_file(rng, spec):
+    lines = ['"""Generated module."""', "import os", "import sys", ""]
+    for i in range(6):
+        lines.append(f"def helper_{i}(a, b):")
+        lines.append(f"    return a * {i + 2} + len(b)")
+        lines.append("")
+    functions = rng.randint(max(1, spec.functions // 2), spec.functions)
+    previous = []
+    for i in range(functions):
+        start = len(lines)
+        if previous and rng.random() < 0.1:
+            # A pasted copy of the previous function under another name.
+            lines.extend(line.replace(previous[0], f"{previous[0]}_copy{i}", 1) for line in previous[1])
+            continue
+        name = f"{_name(rng)}_{i}"
+        if rng.random() < 0.25:
+            lines.append(f"class {name.title().replace('_', '')}:")
+            for m in range(rng.randint(2, 6)):
+                lines.append(f"    def method_{m}(self, items):")
+                lines.append(f"        return [x * {rng.randint(2, 9)} for x in items if x > {m}]")
+                lines.append("")
+            continue
+        _python_function(rng, name, spec, lines)
+        previous = [name, lines[start:]]
+    lines.append('if __name__ == "__main__":')
+    lines.append("    print(sys.argv)")
+    return "\n".join(lines) + "\n"
+
+
+def _js_block(rng, depth, nesting, indent, lines):
+    pad = "  " * indent
+    if depth < nesting and rng.random() < 0.7:
+        kind = rng.choice(["if", "for", "callback", "arrow"])
+        if kind == "if":
+            lines.append(f"{pad}if (total > {rng.randint(2, 500)}) {{")
+            _js_block(rng, depth + 1, nesting, indent + 1, lines)
+            lines.append(f"{pad}}}")
+        elif kind == "for":
+            lines.append(f"{pad}for (let i = 0; i < items.length; i++) {{")
+            _js_block(rng, depth + 1, nesting, indent + 1, lines)
+            lines.append(f"{pad}}}")
+        elif kind == "callback":
+            lines.append(f"{pad}fetchData('{rng.choice(_WORDS)}', function (err, data) {{")
+            _js_block(rng, depth + 1, nesting, indent + 1, lines)
+            lines.append(f"{pad}}});")
+        else:
+            lines.append(f"{pad}items.forEach((entry) => {{")
+            _js_block(rng, depth + 1, nesting, indent + 1, lines)
+            lines.append(f"{pad}}});")
+    choice = rng.random()
+    if choice < 0.3:
+        lines.append(f"{pad}total += config.{_camel(rng)} * {rng.randint(2, 99)};")
+    elif choice < 0.5:
+        lines.append(f"{pad}console.log(`{rng.choice(_WORDS)}: ${{total}}`, '{{not a brace}}');")
+    elif choice < 0.7:
+        lines.append(f"{pad}total = total.toString().replace(/[{{}}]+/g, '').length / {rng.randint(2, 9)};")
+    else:
+        lines.append(f"{pad}// update {rng.choice(_WORDS)} {{ braces in comments }}")
+        lines.append(f"{pad}total = total * {rng.randint(2, 20)} + items.length;")
+
+
+def generate_js_file(rng, spec):
+    lines = ["'use strict';", f"var {_camel(rng)}Registry = {{}};", ""]
+    functions = rng.randint(max(1, spec.functions // 2), spec.functions)
+    for i in range(functions):
+        name = f"{_camel(rng)}{i}"
+        params = ["items", "config"] + [_camel(rng) for _ in range(rng.randint(0, 3))]
+        arrow = rng.random() < 0.3
+        if arrow:
+            lines.append(f"const {name} = ({', '.join(params)}) => {{")
+        else:
+            lines.append(f"function {name}({', '.join(params)}) {{")
+        lines.append("  let total = 0;")
+        if rng.random() < 0.3:
+            lines.append(f"  const unused{_camel(rng)} = {rng.randint(0, 9)};")
+        for _ in range(rng.randint(1, 4)):
+            _js_block(rng, 0, rng.randint(1, spec.nesting), 1, lines)
+        lines.append("  return total;")
+        lines.append("};" if arrow else "}")
+        lines.append("")
+    lines.append(f"module.exports = {{ {', '.join(f'{_camel(rng)}: {i}' for i in range(3))} }};")
+    return "\n".join(lines) + "\n"
+
+
+def generate_corpus(spec):
+    """Return ``[(relative path, language, code)]`` for ``spec``, sorted by path."""
+    rng = random.Random(spec.seed)
+    files = []
+    for language, count in (("python", spec.python_files), ("javascript", spec.js_files)):
+        extension = ".py" if language == "python" else ".js"
+        generate = generate_python_file if language == "python" else generate_js_file
+        for i in range(count):
+            directories = [f"{rng.choice(_WORDS)}_{rng.randint(0, 3)}" for _ in range(rng.randint(0, spec.dir_depth))]
+            path = "/".join(directories + [f"{_name(rng)}_{i}{extension}"])
+            files.append((path, language, generate(rng, spec)))
+    files.sort()
+    return files
+
+
+def write_corpus(files, root):
+    for path, _, code in files:
+        target = os.path.join(root, *path.split("/"))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "w", encoding="utf-8", newline="\n") as f:
+            f.write(code)
+
+
+def make_fixture_repo(root, spec, commits=1, churn=0.1, interval=None):
+    """Create a git repo at ``root`` holding ``generate_corpus(spec)``; return the commit shas, oldest first.
+
+    Every commit after the first rewrites about ``churn`` of the files with
+    freshly generated content, like a stream of ordinary changes would.
+    Commits are dated COMMIT_DATE, or ``interval`` (a timedelta) apart
+    starting from it.
+    """
+    files = generate_corpus(spec)
+    repo = git.Repo.init(root)
+    rng = random.Random(spec.seed + 1)
+    shas = []
+    try:
+        with repo.config_writer() as config:
+            config.set_value("user", "name", AUTHOR.name)
+            config.set_value("user", "email", AUTHOR.email)
+        for number in range(commits):
+            changed = range(len(files))
+            if number:
+                changed = rng.sample(range(len(files)), max(1, int(len(files) * churn)))
+                for i in changed:
+                    path, language, _ = files[i]
+                    generate = generate_python_file if language == "python" else generate_js_file
+                    files[i] = (path, language, generate(rng, spec))
+            # Only the rewritten files are written and staged again.
+            write_corpus([files[i] for i in changed], root)
+            repo.index.add([files[i][0] for i in changed])
+            date = COMMIT_DATE
+            if interval is not None:
+                date = (datetime.fromisoformat(COMMIT_DATE) + interval * number).strftime("%Y-%m-%dT%H:%M:%S%z")
+            commit = repo.index.commit(f"Fixture commit {number}", author=AUTHOR, committer=AUTHOR,
+                                       author_date=date, commit_date=date)
+            shas.append(commit.hexsha)
+    finally:
+        repo.close()
+    return shas
+
+
+def corpus_lines(files):
+    return sum(code.count("\n") for _, _, code in files)
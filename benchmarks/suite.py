@@ -0,0 +1,249 @@
+"""Throughput and peak-memory benchmarks of the analyzers, the refactorers and the repo pipeline.
+
+Every component runs over the same deterministic corpus (benchmarks.corpus)
+and reports files/s, lines/s and the peak memory traced while it ran.
+Results are written as JSON; given a baseline from an earlier run, the suite
+exits with status 1 when a benchmark got slower or hungrier than the
+baseline by more than ``--threshold``.
+
+    python -m benchmarks.suite --size small --output bench.json
+    python -m benchmarks.suite --size small --baseline bench.json --threshold 0.25
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from dataclasses import asdict, replace
+
+from benchmarks.corpus import SIZES, CorpusSpec, corpus_lines, generate_corpus, make_fixture_repo, write_corpus
+from benchmarks.bench_js_refactor import js_smells
+from code_analyzer import CodeAnalyzer
+from detector.app import analyze_repo
+from detector.cache import AnalysisCache
+from detector.js_analyzer import analyze_js_code
+from detector.py_analyzer import analyze_py_code, analyze_py_source
+from refactor.js_refactor import refactor_js_code
+from refactor.py_refactor import refactor_python_code
+
+RESULTS_VERSION = 1
+
+
+class BenchContext:
+    """The generated corpus, written out once as files and as a git fixture repo."""
+
+    def __init__(self, spec, root):
+        self.spec = spec
+        self.files = generate_corpus(spec)
+        self.corpus_dir = os.path.join(root, "corpus")
+        write_corpus(self.files, self.corpus_dir)
+        self.repo_dir = os.path.join(root, "repo")
+        make_fixture_repo(self.repo_dir, spec)
+        self.work_dir = os.path.join(root, "work")
+        os.makedirs(self.work_dir)
+
+    def of_language(self, language):
+        return [(path, code) for path, file_language, code in self.files if file_language == language]
+
+    def path(self, relative):
+        return os.path.join(self.corpus_dir, *relative.split("/"))
+
+
+# Each benchmark takes the context and returns ``(work, files, lines)``:
+# ``work`` is the zero-argument callable that gets timed, everything else is setup.
+def bench_analyze_py_code(ctx):
+    paths = [ctx.path(path) for path, _ in ctx.of_language("python")]
+    return lambda: [analyze_py_code(path) for path in paths], len(paths), _lines(ctx.of_language("python"))
+
+
+def bench_analyze_js_code(ctx):
+    paths = [ctx.path(path) for path, _ in ctx.of_language("javascript")]
+    return lambda: [analyze_js_code(path) for path in paths], len(paths), _lines(ctx.of_language("javascript"))
+
+
+def bench_code_analyzer_python(ctx):
+    sources = ctx.of_language("python")
+    return lambda: [CodeAnalyzer(code, "python").analyze() for _, code in sources], len(sources), _lines(sources)
+
+
+def bench_code_analyzer_javascript(ctx):
+    sources = ctx.of_language("javascript")
+    return lambda: [CodeAnalyzer(code, "javascript").analyze() for _, code in sources], len(sources), _lines(sources)
+
+
+def bench_refactor_python_code(ctx):
+    sources = ctx.of_language("python")
+    jobs = [(code, analyze_py_source(code)[0]) for _, code in sources]
+    return lambda: [refactor_python_code(code, smells) for code, smells in jobs], len(jobs), _lines(sources)
+
+
+def bench_refactor_js_code(ctx):
+    sources = ctx.of_language("javascript")
+    jobs = [(code, js_smells(code)) for _, code in sources]
+    return lambda: [refactor_js_code(code, smells) for code, smells in jobs], len(jobs), _lines(sources)
+
+
+def bench_analyze_repo(ctx):
+    def work():
+        # One process and no cache: measures the pipeline itself, not the pool or earlier runs.
+        return analyze_repo(ctx.repo_dir, workers=1, cache=AnalysisCache(max_bytes=0))
+    return work, len(ctx.files), corpus_lines(ctx.files)
+
+
+BENCHMARKS = {
+    "analyze_py_code": bench_analyze_py_code,
+    "analyze_js_code": bench_analyze_js_code,
+    "code_analyzer.python": bench_code_analyzer_python,
+    "code_analyzer.javascript": bench_code_analyzer_javascript,
+    "refactor_python_code": bench_refactor_python_code,
+    "refactor_js_code": bench_refactor_js_code,
+    "analyze_repo": bench_analyze_repo,
+}
+
+
+def _lines(sources):
+    return sum(code.count("\n") for _, code in sources)
+
+
+@contextlib.contextmanager
+def _quiet(directory):
+    # The pipeline prints whole reports and stores them in .smell_cache/reports.sqlite3 under the cwd.
+    cwd = os.getcwd()
+    os.chdir(directory)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        os.chdir(cwd)
+
+
+def measure(work, repeat, min_time, directory):
+    """``(seconds per run, runs timed, peak bytes)`` of ``work``.
+
+    The runs are timed in ``repeat`` samples, each long enough that together
+    they take at least ``min_time``: a single run of a fast benchmark is
+    mostly timer and scheduler noise. The best sample's time per run is
+    kept, then one more run under tracemalloc gives the peak.
+    """
+    with _quiet(directory):
+        start = time.perf_counter()
+        work()
+        first = time.perf_counter() - start
+        number = max(1, math.ceil(min_time / repeat / max(first, 1e-9)))
+        # A run that is long enough on its own counts as the first sample.
+        samples = [first] if number == 1 else []
+        while len(samples) < repeat:
+            start = time.perf_counter()
+            for _ in range(number):
+                work()
+            samples.append((time.perf_counter() - start) / number)
+        tracemalloc.start()
+        try:
+            work()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return min(samples), number * repeat, peak
+
+
+def run_suite(spec, names, repeat=3, min_time=1.0):
+    root = tempfile.mkdtemp(prefix="smell-bench-")
+    try:
+        ctx = BenchContext(spec, root)
+        results = {}
+        for name in names:
+            work, files, lines = BENCHMARKS[name](ctx)
+            seconds, runs, peak = measure(work, repeat, min_time, ctx.work_dir)
+            results[name] = {
+                "files": files,
+                "lines": lines,
+                "seconds": round(seconds, 4),
+                "runs": runs,
+                "files_per_s": round(files / seconds, 2),
+                "lines_per_s": round(lines / seconds, 1),
+                "peak_mb": round(peak / (1024 * 1024), 2),
+            }
+            print(f"{name:<26} {files:>6} {lines:>8} {seconds:>9.3f} {files / seconds:>10.1f} "
+                  f"{lines / seconds:>11.0f} {peak / (1024 * 1024):>9.1f}")
+        return results
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def compare(results, baseline, threshold):
+    """Regression messages for every benchmark of ``baseline`` that is now worse than ``threshold`` allows."""
+    regressions = []
+    for name, before in baseline["benchmarks"].items():
+        after = results["benchmarks"].get(name)
+        if after is None:
+            continue
+        if after["lines_per_s"] < before["lines_per_s"] * (1 - threshold):
+            regressions.append(f"{name}: {after['lines_per_s']:.0f} lines/s, was {before['lines_per_s']:.0f}")
+        if after["peak_mb"] > before["peak_mb"] * (1 + threshold):
+            regressions.append(f"{name}: peak {after['peak_mb']:.1f} MB, was {before['peak_mb']:.1f}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", choices=sorted(SIZES), default="small")
+    parser.add_argument("--seed", type=int, help="corpus seed (default: the size's own)")
+    parser.add_argument("--nesting", type=int, help="deepest block/callback nesting in generated functions")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="run only these benchmarks")
+    parser.add_argument("--repeat", type=int, default=3, help="timed samples per benchmark; the best is kept")
+    parser.add_argument("--min-time", type=float, default=1.0,
+                        help="seconds each benchmark is timed for at least; fast ones run several times per sample")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="allowed slowdown/memory growth against the baseline (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    spec = SIZES[args.size]
+    if args.seed is not None:
+        spec = replace(spec, seed=args.seed)
+    if args.nesting is not None:
+        spec = replace(spec, nesting=args.nesting)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if CorpusSpec(**baseline["corpus"]) != spec:
+            parser.error(f"{args.baseline} was recorded on a different corpus: {baseline['corpus']}")
+
+    print(f"{'benchmark':<26} {'files':>6} {'lines':>8} {'seconds':>9} {'files/s':>10} {'lines/s':>11} {'peak MB':>9}")
+    results = {
+        "version": RESULTS_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "corpus": asdict(spec),
+        "benchmarks": run_suite(spec, args.only or list(BENCHMARKS), args.repeat, args.min_time),
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"[+] Results saved to {args.output}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"[-] {len(regressions)} regression(s) past {args.threshold:.0%}:")
+            for regression in regressions:
+                print(f"  - {regression}")
+            return 1
+        print(f"[+] No regressions against {args.baseline}.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
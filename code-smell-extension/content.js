@@ -10,10 +10,12 @@
     console.log("[EXTENSION] Analyzing repository:", repoUrl);
 
     try {
-        const response = await fetch('http://localhost:5000/analyze', {
+        // Results are streamed as NDJSON, one record per analyzed file, so
+        // icons can show up while the rest of the repository is still running.
+        const response = await fetch('http://localhost:5000/analyze/stream', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ repo_url: repoUrl })
+            body: JSON.stringify({ repo_url: repoUrl, include_code: false })
         });
 
         if (!response.ok) {
@@ -21,32 +23,21 @@
             throw new Error(error.error || "Analysis failed");
         }
 
-        const data = await response.json();
-        console.log("[EXTENSION] Analysis results:", data);
-
         const smellsByFile = {};
-
-        Object.entries(data.python || {}).forEach(([file, content]) => {
-            if ((content?.smells?.length > 0) || content?.metrics) {
-                smellsByFile[file] = {
-                    smells: content.smells || [],
-                    metrics: content.metrics || {},
-                    code: content.code || ""
-                };
-            }
-        });
-
-        Object.entries(data.javascript || {}).forEach(([file, content]) => {
-            if ((content?.smells?.length > 0) || content?.metrics) {
-                smellsByFile[file] = {
-                    smells: content.smells || [],
-                    metrics: content.metrics || {},
-                    code: content.code || ""
-                };
+        let analyzedCommit = null;
+
+        // Sources are left out of the analysis; fetch one only when it is refactored.
+        async function loadSource(fileData) {
+            if (fileData.code) return fileData.code;
+            const params = new URLSearchParams({ repo_url: repoUrl, commit: analyzedCommit, path: fileData.path });
+            const res = await fetch(`http://localhost:5000/source?${params}`);
+            if (!res.ok) {
+                const error = await res.json();
+                throw new Error(error.error || "Could not load source");
             }
-        });
-
-        console.log("[EXTENSION] Processed smells + metrics:", smellsByFile);
+            fileData.code = await res.text();
+            return fileData.code;
+        }
 
         function addSmellIconsReliable(smellsByFile) {
             const fileLinks = document.querySelectorAll('a.js-navigation-open, a.Link--primary');
@@ -63,7 +54,6 @@
                 const fileData = matchedKey ? smellsByFile[matchedKey] : null;
                 const fileSmells = fileData?.smells || [];
                 const metrics = fileData?.metrics || {};
-                const code = fileData?.code || "";
 
                 // ℹ️ Smell icon
                 if (fileSmells.length > 0 && !link.parentElement.querySelector('.smell-indicator')) {
@@ -135,9 +125,18 @@
 
                         document.body.appendChild(modal);
                         modal.querySelector('.closeModal').addEventListener('click', () => modal.remove());
-                        modal.querySelector('.refactorBtn').addEventListener('click', () => {
+                        modal.querySelector('.refactorBtn').addEventListener('click', async () => {
                             // const refactorTab = window.open('http://127.0.0.1:3000/refactor/refactor.html', '_blank');
                             const refactorTab = window.open('http://localhost:8000/refactor.html', '_blank');     // correct accordingly
+
+                            let code;
+                            try {
+                                code = await loadSource(fileData);
+                            } catch (err) {
+                                console.error("[EXTENSION] Error:", err);
+                                refactorTab?.close();
+                                return;
+                            }
                         
                             // Wait for the new tab to load before sending the message
                             const codePayload = { filename: fileName, code, fileSmells };
@@ -215,8 +214,6 @@
             });
         }
 
-        addSmellIconsReliable(smellsByFile);
-
         let lastUrl = location.href;
         new MutationObserver(() => {
             const currentUrl = location.href;
@@ -226,6 +223,57 @@
             }
         }).observe(document, { subtree: true, childList: true });
 
+        // Redraw at most every 250ms while records keep arriving.
+        let refreshTimer = null;
+        const scheduleRefresh = () => {
+            if (refreshTimer) return;
+            refreshTimer = setTimeout(() => {
+                refreshTimer = null;
+                addSmellIconsReliable(smellsByFile);
+            }, 250);
+        };
+
+        const handleRecord = (record) => {
+            if (record.type === 'file') {
+                if ((record.smells?.length > 0) || record.metrics) {
+                    smellsByFile[record.file] = {
+                        path: record.path,
+                        smells: record.smells || [],
+                        metrics: record.metrics || {},
+                        code: record.code || ""
+                    };
+                    scheduleRefresh();
+                }
+            } else if (record.type === 'file_error') {
+                console.warn("[EXTENSION] Could not analyze", record.path, record.error);
+            } else if (record.type === 'start') {
+                analyzedCommit = record.metadata.commit;
+                console.log("[EXTENSION] Analysis started:", record.metadata);
+            } else if (record.type === 'done') {
+                console.log("[EXTENSION] Analysis complete:", record.metadata);
+            } else if (record.type === 'error') {
+                throw new Error(record.error);
+            }
+        };
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffered = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffered += decoder.decode(value, { stream: true });
+            const lines = buffered.split('\n');
+            buffered = lines.pop();
+            lines.filter(line => line.trim()).forEach(line => handleRecord(JSON.parse(line)));
+        }
+        if (buffered.trim()) handleRecord(JSON.parse(buffered));
+
+        clearTimeout(refreshTimer);
+        refreshTimer = null;
+        addSmellIconsReliable(smellsByFile);
+        console.log("[EXTENSION] Processed smells + metrics:", smellsByFile);
+
     } catch (err) {
         console.error("[EXTENSION] Error:", err);
     }
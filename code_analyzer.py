@@ -1,8 +1,10 @@
 import ast
+import hashlib
 import re
 from typing import Dict, List, Tuple, Any
 import astor
 from collections import defaultdict
+from detector.js_lexer import BraceIndex, IdentifierIndex
 
 class CodeAnalyzer:
     def __init__(self, code: str, language: str):
@@ -10,6 +12,8 @@ class CodeAnalyzer:
         self.language = language
         self.tree = ast.parse(code) if language == 'python' else None
         self.smells = {}
+        self._brace_index = None
+        self._identifier_index = None
         
     def analyze(self) -> Dict[str, Any]:
         """Analyze the code and return detected smells with refactoring suggestions."""
@@ -123,9 +127,9 @@ class CodeAnalyzer:
             for node in ast.walk(self.tree):
                 if isinstance(node, ast.FunctionDef):
                     body_str = "".join(ast.dump(stmt) for stmt in node.body)
-                    function_bodies[body_str].append(node)
+                    function_bodies[hashlib.blake2b(body_str.encode(), digest_size=16).digest()].append(node)
             
-            for body, funcs in function_bodies.items():
+            for funcs in function_bodies.values():
                 if len(funcs) > 1:
                     func_code = astor.to_source(funcs[0])
                     self.smells[f"duplicate_code_{funcs[0].name}"] = {
@@ -198,11 +202,7 @@ class CodeAnalyzer:
                         }
         else:
             # JavaScript unused variables analysis
-            var_decls = re.findall(r'(?:var|let|const)\s+(\w+)', self.code)
-            unused_vars = []
-            for var in var_decls:
-                if len(re.findall(r'\b' + re.escape(var) + r'\b', self.code)) == 1:
-                    unused_vars.append(var)
+            unused_vars = self._identifiers().unused_declarations()
             if unused_vars:
                 self.smells["unused_variables"] = {
                     "type": "unused_variables",
@@ -212,7 +212,7 @@ class CodeAnalyzer:
     
     def _analyze_global_variables(self):
         """Analyze JavaScript code for global variables."""
-        global_vars = re.findall(r'(?:var|let|const)\s+(\w+)', self.code)
+        global_vars = list(self._identifiers().declarations)
         if global_vars:
             self.smells["global_variables"] = {
                 "type": "global_variables",
@@ -269,17 +269,22 @@ class CodeAnalyzer:
                 unused.append(arg.arg)
         return unused
     
+    def _identifiers(self) -> IdentifierIndex:
+        """Identifier occurrences of the JavaScript code, indexed once and shared by the checks."""
+        if self._identifier_index is None:
+            self._identifier_index = IdentifierIndex.from_code(self.code)
+        return self._identifier_index
+    
     def _find_matching_brace(self, code: str, start: int) -> int:
-        """Find the matching closing brace for a given opening brace."""
-        count = 0
-        for i in range(start, len(code)):
-            if code[i] == '{':
-                count += 1
-            elif code[i] == '}':
-                count -= 1
-                if count == 0:
-                    return i
-        return -1
+        """Find the closing brace matching the first opening brace at or after ``start``.
+
+        Uses a brace index of the code built once, so repeated lookups don't rescan the file.
+        """
+        if code is not self.code:
+            return BraceIndex.from_code(code).matching_brace(start)
+        if self._brace_index is None:
+            self._brace_index = BraceIndex.from_code(self.code)
+        return self._brace_index.matching_brace(start)
     
     def _suggest_complexity_refactoring(self, node: ast.FunctionDef, original_code: str) -> Dict[str, str]:
         """Generate specific refactoring suggestions for complex functions."""
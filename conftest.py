@@ -0,0 +1 @@
+# Makes the repository root importable (detector, refactor, benchmarks) for the tests under tests/.
@@ -3,14 +3,23 @@ import shutil
 import git
 import tempfile
 import stat
-import json
-from pathlib import Path
-from detector.py_analyzer import analyze_py_code
-from detector.js_analyzer import analyze_js_code
-from refactor.py_refactor import refactor_python_code
-from refactor.js_refactor import refactor_js_code
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path, PurePosixPath
+from detector.cache import AnalysisCache
+from detector.clones import find_clones, CLONE_DETECTION
+from detector.near_duplicates import find_near_duplicates, NEAR_DUPLICATE_DETECTION
+from detector.report_store import report_store
+from detector.git_source import clone_objects, prefetch_blobs, read_blob, source_blobs
+from detector.py_analyzer import analyze_py_source, ANALYZER_VERSION as PY_ANALYZER_VERSION
+from detector.js_analyzer import analyze_js_source, ANALYZER_VERSION as JS_ANALYZER_VERSION
+from detector.timing import Timings, record_analysis, report_timings
 
 REPO_DIR = "temp_repo"
+ANALYZER_VERSIONS = {"python": PY_ANALYZER_VERSION, "javascript": JS_ANALYZER_VERSION}
+# Processes used to analyze files; 1 (or less) analyzes in the calling process.
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", os.cpu_count() or 1))
+# Analyze a full working-tree clone instead of reading blobs from the git object database.
+ANALYSIS_CHECKOUT = os.getenv("ANALYSIS_CHECKOUT", "0") == "1"
 
 def clone_github_repo(repo_url):
     temp_dir = tempfile.mkdtemp()
@@ -23,91 +32,306 @@ def clone_github_repo(repo_url):
     print("[+] Clone complete.")
     return temp_dir
 
-def analyze_repo(repo_url):
-    repo_path = clone_github_repo(repo_url)
+def remove_repo(repo_path):
+    shutil.rmtree(repo_path, onerror=lambda _, path, __: os.chmod(path, stat.S_IWRITE))
+
+def checkout_sources(repo_url, timings=None):
+    """Clone with a working tree and return ``(sources, commit)``.
+
+    ``sources`` lists ``(path, language, content)`` for the .py/.js files.
+    """
+    timings = Timings(enabled=False) if timings is None else timings
+    with timings.stage("clone"):
+        repo_path = clone_github_repo(repo_url)
     if not repo_path:
         raise ValueError(f"Failed to clone repository: {repo_url}")
+    try:
+        with git.Repo(repo_path) as repo:
+            commit = repo.head.commit.hexsha
+        sources = []
+        for language, pattern in (("python", "*.py"), ("javascript", "*.js")):
+            with timings.stage("discovery"):
+                files = sorted(Path(repo_path).rglob(pattern))
+            with timings.stage("read"):
+                for file in files:
+                    if not file.is_file():
+                        continue
+                    try:
+                        sources.append((file.relative_to(repo_path).as_posix(), language, file.read_bytes()))
+                    except OSError as e:
+                        print(f"[-] Error reading file {file.name}: {str(e)}")
+        return sources, commit
+    finally:
+        # Clean up temp repo
+        with timings.stage("cleanup"):
+            remove_repo(repo_path)
 
-    python_files = list(Path(repo_path).rglob("*.py"))
-    js_files = list(Path(repo_path).rglob("*.js"))
-    
-    print(f"[+] {len(python_files)} Python files found.")
-    print(f"[+] {len(js_files)} JavaScript files found.")
-    
-    report = {}
-    for file in python_files:
+def object_sources(repo_url, timings=None):
+    """Return ``(sources, commit)`` for the .py/.js blobs at the remote HEAD.
+
+    Uses a shallow, blob-filtered bare clone and reads the blobs straight from
+    the object database, so no working tree is ever written to disk.
+    """
+    timings = Timings(enabled=False) if timings is None else timings
+    temp_dir = tempfile.mkdtemp()
+    print(f"[+] Fetching objects of {repo_url} into {temp_dir} ...")
+    try:
         try:
-            smells, metrics = analyze_py_code(file)
-            report[file.name] = {
-                "smells": smells,
-                "metrics": metrics,
-                "code": file.read_text(encoding="utf-8", errors="ignore")
-            }
+            with timings.stage("clone"):
+                repo = clone_objects(repo_url, temp_dir)
         except Exception as e:
-            print(f"[-] Error analyzing Python file {file.name}: {str(e)}")
+            print(f"[-] Error cloning repo: {str(e)}")
+            raise ValueError(f"Failed to clone repository: {repo_url}")
+        try:
+            commit = repo.head.commit
+            with timings.stage("discovery"):
+                blobs = source_blobs(commit)
+            with timings.stage("read"):
+                prefetch_blobs(repo, commit, blobs)
+                sources = [(path, language, read_blob(blob)) for path, language, blob in blobs]
+        finally:
+            repo.close()
+        print("[+] Fetch complete.")
+        return sources, commit.hexsha
+    finally:
+        with timings.stage("cleanup"):
+            remove_repo(temp_dir)
+
+def analyze_source(language, code):
+    """Analyze one file's source, returning ``(data, error)`` so failures stay per file.
 
+    With timing on, ``data["timings"]`` holds the seconds spent per detector.
+    """
+    analyzer = analyze_py_source if language == "python" else analyze_js_source
+    timings = Timings()
+    try:
+        smells, metrics = analyzer(code, timings if timings.enabled else None)
+    except Exception as e:
+        return None, str(e)
+    data = {"smells": smells, "metrics": metrics}
+    if timings.enabled:
+        data["timings"] = dict(timings.seconds)
+    return data, None
+
+def decode_source(content):
+    # Same text the analyzers used to get from open(..., errors='ignore').
+    return content.decode("utf-8", errors="ignore").replace("\r\n", "\n").replace("\r", "\n")
+
+def iter_cached(jobs, workers=None, cache=None, timings=None):
+    """Analyze ``(language, content bytes)`` jobs, serving unchanged contents from ``cache``.
+
+    Yields ``(index, data, error)`` as soon as each job is done: cache hits
+    first, then analyzed files in completion order. ``data["code"]`` holds the
+    decoded source. Per-detector seconds of the analyzed files are added to
+    ``timings`` as ``detector.<language>.<detector>``.
+    """
+    cache = AnalysisCache() if cache is None else cache
+    pending = []
+    for i, (language, content) in enumerate(jobs):
+        code = decode_source(content)
+        key = cache.key(language, ANALYZER_VERSIONS[language], content)
+        cached = cache.get(key)
+        if cached is not None:
+            cached["code"] = code
+            yield i, cached, None
+        else:
+            pending.append((i, key, language, code))
+
+    for j, (data, error) in iter_sources([(language, code) for _, _, language, code in pending], workers):
+        i, key, language, code = pending[j]
+        if error is None:
+            file_timings = data.pop("timings", None)
+            if file_timings and timings is not None:
+                timings.add(file_timings, prefix=f"detector.{language}.")
+            cache.put(key, data)
+            data["code"] = code
+        yield i, data, error
+    if cache.writes:
+        cache.prune()
+
+def iter_sources(jobs, workers=None):
+    """Run analyze_source over ``(language, code)`` jobs, in parallel when allowed.
+
+    Yields ``(index, (data, error))`` in completion order. The largest files
+    are submitted first so a slow file doesn't end up alone at the tail of
+    the run.
+    """
+    workers = ANALYSIS_WORKERS if workers is None else workers
+    if workers <= 1 or len(jobs) <= 1:
+        for i, (language, code) in enumerate(jobs):
+            yield i, analyze_source(language, code)
+        return
+
+    schedule = sorted(range(len(jobs)), key=lambda i: len(jobs[i][1]), reverse=True)
+    pool = ProcessPoolExecutor(max_workers=min(workers, len(jobs)))
+    try:
+        futures = {pool.submit(analyze_source, *jobs[i]): i for i in schedule}
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:  # worker died (e.g. BrokenProcessPool)
+                result = (None, str(e))
+            yield futures[future], result
+    finally:
+        # Also reached when a consumer stops early (e.g. a streaming client left).
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def file_entry(path, language, data=None, error=None):
+    entry = {"language": language, "path": path, "file": PurePosixPath(path).name}
+    if error is not None:
+        kind = "Python" if language == "python" else "JS"
+        print(f"[-] Error analyzing {kind} file {entry['file']}: {error}")
+        entry["error"] = error
+    else:
+        entry.update(data)
+    return entry
+
+def build_report(entries, include_code=True):
+    """Turn file entries into the ``python``/``javascript`` report dicts, ordered by path.
+
+    Without ``include_code`` each file carries its ``path`` instead of its
+    source, which can be fetched separately by commit and path.
+    """
+    report = {}
     smell_report = {}
-    for file in js_files:
-        try:
-            smells, metrics = analyze_js_code(file)
-            smell_report[file.name] = {
-                "smells": smells,
-                "metrics": metrics,
-                "code": file.read_text(encoding="utf-8", errors="ignore")
+    for entry in sorted(entries, key=lambda entry: PurePosixPath(entry["path"])):
+        target = report if entry["language"] == "python" else smell_report
+        if include_code:
+            target[entry["file"]] = {
+                "smells": entry["smells"],
+                "metrics": entry["metrics"],
+                "code": entry["code"]
             }
-        except Exception as e:
-            print(f"[-] Error analyzing JS file {file.name}: {str(e)}")
+        else:
+            target[entry["file"]] = {
+                "path": entry["path"],
+                "smells": entry["smells"],
+                "metrics": entry["metrics"]
+            }
+    return report, smell_report
 
-    # Clean up temp repo
-    shutil.rmtree(repo_path, onerror=lambda _, path, __: os.chmod(path, stat.S_IWRITE))
+def repo_duplicates(entries, workers=None, cache=None, timings=None):
+    """Repository-wide passes over all analyzed files, run after the per-file analysis.
 
-    combined_report = {
-        "python": report,
-        "javascript": smell_report
-    }
+    Returns ``{"clones": [...], "near_duplicates": [...]}``: copy-pasted code
+    (detector.clones) and near-duplicate Python functions
+    (detector.near_duplicates). Each list is empty when its pass is turned off.
+    """
+    workers = ANALYSIS_WORKERS if workers is None else workers
+    timings = Timings(enabled=False) if timings is None else timings
+    # Own cache instance so the analysis hit/miss stats stay about analysis.
+    cache = AnalysisCache() if cache is None else AnalysisCache(cache.directory, cache.max_bytes)
+    files = [(entry["path"], entry["language"], entry["code"])
+             for entry in sorted(entries, key=lambda entry: PurePosixPath(entry["path"]))]
+    with timings.stage("clones"):
+        clones = find_clones(files, workers, cache) if CLONE_DETECTION else []
+    with timings.stage("near_duplicates"):
+        near_duplicates = find_near_duplicates(files, workers, cache) if NEAR_DUPLICATE_DETECTION else []
+    print(f"[+] {len(clones)} clone pairs and {len(near_duplicates)} near-duplicate function pairs found.")
+    return {"clones": clones, "near_duplicates": near_duplicates}
+
+def finish_timings(timings, metadata):
+    """Record a finished run's timings in the /metrics histograms and its totals in ``metadata``."""
+    if timings.enabled:
+        record_analysis(timings)
+        metadata["timings"] = report_timings(timings)
 
-    # Save report to JSON
-    output_file = "code_smells_report.json"
-    with open(output_file, "w", encoding="utf-8") as json_file:
-        json.dump(combined_report, json_file, indent=4)
-    
-    print(f"\n[+] Code smells report saved to {output_file}")
+def collect_analysis(events):
+    """Drain an analysis event stream and return its final result."""
+    for event, payload in events:
+        if event == "done":
+            return payload
+
+def save_report(repo_url, commit, entries, duplicates, metadata):
+    """Queue the report for the report store (see detector.report_store) and print it.
+
+    ``entries`` are the file entries of the analyzed and the failed files.
+    """
+    store = report_store()
+    store.save(repo_url, commit, entries, duplicates, metadata)
+    print(f"\n[+] Code smells report of {commit[:10]} queued for {store.path}")
 
     # Print results to console
+    entries = sorted((entry for entry in entries if "error" not in entry), key=lambda entry: PurePosixPath(entry["path"]))
     print("\n[Python Code Smells]")
-    for filename, data in report.items():
-        print(f"\nFile: {filename}")
+    for data in entries:
+        if data["language"] != "python":
+            continue
+        print(f"\nFile: {data['file']}")
         print("Detected Smells:")
         for smell in data["smells"]:
             print(f"  - {smell}")
         print("Metrics:")
         for key, value in data["metrics"].items():
             print(f"  {key}: {value}")
-        # print("Code:")
-        # print(data["code"])
 
     print("\n[JavaScript Code Smells]")
-    for filename, data in smell_report.items():
+    for data in entries:
+        if data["language"] != "javascript":
+            continue
         print("\n==========")
-        print(f"File: {filename}")
+        print(f"File: {data['file']}")
         print("Detected Smells:")
         for smell in data["smells"]:
             print(f"  - {smell}")
         print("Metrics:")
         for key, value in data["metrics"].items():
             print(f"  {key}: {value}")
-        # print("Code:")
-        # print(data["code"])
-
-    return {
-        "python": report,
-        "javascript": smell_report,
-        "metadata": {
-            "python_files": len(python_files),
-            "js_files": len(js_files),
-            "repo": repo_url
-        }
+
+def iter_repo_analysis(repo_url, workers=None, cache=None, checkout=None):
+    """Analyze ``repo_url`` and yield ``(event, payload)`` pairs as the work progresses.
+
+    * ``("start", metadata)`` once the files are known,
+    * ``("file", entry)`` / ``("file_error", entry)`` for every file, in
+      completion order (see file_entry),
+    * ``("done", result)`` last, with the same result analyze_repo returns:
+      the ``python``/``javascript`` reports, repo-wide ``clones`` and
+      ``near_duplicates`` (see repo_duplicates) and ``metadata``.
+    """
+    checkout = ANALYSIS_CHECKOUT if checkout is None else checkout
+    timings = Timings()
+    sources, commit = checkout_sources(repo_url, timings) if checkout else object_sources(repo_url, timings)
+    python_count = sum(1 for _, language, _ in sources if language == "python")
+    js_count = len(sources) - python_count
+
+    print(f"[+] {python_count} Python files found.")
+    print(f"[+] {js_count} JavaScript files found.")
+
+    metadata = {
+        "python_files": python_count,
+        "js_files": js_count,
+        "repo": repo_url,
+        "commit": commit
     }
+    yield "start", dict(metadata)
+
+    cache = AnalysisCache() if cache is None else cache
+    entries = []
+    errors = []
+    jobs = [(language, content) for _, language, content in sources]
+    for i, data, error in timings.iterate("analysis", iter_cached(jobs, workers, cache, timings)):
+        path, language, _ = sources[i]
+        entry = file_entry(path, language, data, error)
+        if error is None:
+            entries.append(entry)
+            yield "file", entry
+        else:
+            errors.append(entry)
+            yield "file_error", entry
+
+    report, smell_report = build_report(entries)
+    duplicates = repo_duplicates(entries, workers, cache, timings)
+
+    metadata["cache"] = cache.stats()
+    metadata["clone_pairs"] = len(duplicates["clones"])
+    metadata["near_duplicate_pairs"] = len(duplicates["near_duplicates"])
+    with timings.stage("report_write"):
+        save_report(repo_url, commit, entries + errors, duplicates, metadata)
+    finish_timings(timings, metadata)
+    yield "done", {"python": report, "javascript": smell_report, **duplicates, "metadata": metadata}
+
+def analyze_repo(repo_url, workers=None, cache=None, checkout=None):
+    return collect_analysis(iter_repo_analysis(repo_url, workers, cache, checkout))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,95 @@
+import hashlib
+import json
+import os
+import tempfile
+
+CACHE_DIR = os.getenv("ANALYSIS_CACHE_DIR", os.path.join(".smell_cache", "analysis"))
+# Size bound of the cache directory; 0 turns the cache off.
+CACHE_MAX_BYTES = int(float(os.getenv("ANALYSIS_CACHE_MAX_MB", "512")) * 1024 * 1024)
+
+
+class AnalysisCache:
+    """Content-addressed on-disk cache of per-file analysis results.
+
+    Entries are keyed by the file's bytes plus the analyzer version, so a
+    file is re-analyzed only when it or the detectors/thresholds change, no
+    matter which repo or path it comes from. Each entry is a small JSON file;
+    its mtime is bumped on every hit and ``prune`` drops the least recently
+    used entries once the directory grows past ``max_bytes``.
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.enabled = max_bytes > 0
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    @staticmethod
+    def key(language, version, content):
+        digest = hashlib.sha256(f"{language}:{version}:".encode())
+        digest.update(content)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def put(self, key, data):
+        if not self.enabled:
+            return
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp_path, path)
+            self.writes += 1
+        except OSError as e:
+            print(f"[-] Could not write analysis cache entry: {e}")
+
+    def prune(self):
+        """Evict least recently used entries until the cache fits in max_bytes."""
+        if not self.enabled or not os.path.isdir(self.directory):
+            return
+        entries = []
+        total = 0
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, entry.path))
+                total += st.st_size
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
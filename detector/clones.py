@@ -0,0 +1,250 @@
+"""Repository-wide copy-paste detection.
+
+Every file is reduced to a normalized token stream (identifiers and literals
+replaced by placeholders, comments dropped), and its k-gram hashes are
+winnowed down to a few fingerprints. Fingerprints are spilled to
+hash-partitioned temp files, so only one partition is in memory at a time
+no matter how big the repository is. Files sharing fingerprints become clone
+pairs with file:line ranges.
+"""
+import io
+import keyword
+import os
+import shutil
+import struct
+import tempfile
+import tokenize as py_tokenize
+import zlib
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import combinations
+
+from detector.cache import AnalysisCache
+from detector.js_lexer import tokenize as js_tokenize, NAME, NUMBER, STRING, TEMPLATE, REGEX, COMMENT
+
+CLONE_DETECTION = os.getenv("CLONE_DETECTION", "1") != "0"
+# Tokens per hashed window. Together with the winnowing window this sets the
+# guarantee: every shared run of K_GRAM + WINNOW_WINDOW - 1 tokens is found.
+K_GRAM = int(os.getenv("CLONE_KGRAM", "25"))
+WINNOW_WINDOW = int(os.getenv("CLONE_WINDOW", "26"))
+# Shorter clones (in lines, on either side) are not reported.
+MIN_CLONE_LINES = int(os.getenv("CLONE_MIN_LINES", "6"))
+MAX_CLONE_PAIRS = int(os.getenv("CLONE_MAX_PAIRS", "1000"))
+# A fingerprint found in more places than this is boilerplate (license
+# headers, import blocks) and would only produce noise and O(n^2) pairs.
+MAX_OCCURRENCES = 20
+# Matches of one pair whose line ranges are at most this far apart are merged.
+MERGE_GAP = 2
+PARTITIONS = 64
+# Bump when the normalization or the fingerprinting changes: fingerprints are cached on it.
+CLONES_VERSION = f"1:{K_GRAM}:{WINNOW_WINDOW}"
+
+_MOD = (1 << 61) - 1
+_BASE = 1000003
+_RECORD = struct.Struct("<QIII")  # hash, file index, first line, last line
+
+JS_KEYWORDS = frozenset("""
+    break case catch class const continue debugger default delete do else export extends
+    finally for function if import in instanceof let new return super switch this throw
+    try typeof var void while with yield async await of static get set null true false undefined
+""".split())
+_FSTRING_START = getattr(py_tokenize, "FSTRING_START", None)
+_FSTRING_PARTS = {getattr(py_tokenize, name) for name in ("FSTRING_MIDDLE", "FSTRING_END") if hasattr(py_tokenize, name)}
+_PY_SKIPPED = {py_tokenize.COMMENT, py_tokenize.NL, py_tokenize.ENCODING, py_tokenize.ENDMARKER} | _FSTRING_PARTS
+
+
+def python_tokens(code):
+    """Normalized ``(symbol, line)`` tokens of Python source; stops quietly at a tokenize error."""
+    tokens = []
+    try:
+        for tok in py_tokenize.generate_tokens(io.StringIO(code).readline):
+            if tok.type in _PY_SKIPPED:
+                continue
+            if tok.type == py_tokenize.NAME:
+                symbol = tok.string if keyword.iskeyword(tok.string) else "$id"
+            elif tok.type == py_tokenize.NUMBER:
+                symbol = "$num"
+            elif tok.type == py_tokenize.STRING or tok.type == _FSTRING_START:
+                symbol = "$str"
+            elif tok.type == py_tokenize.NEWLINE:
+                symbol = ";"
+            elif tok.type == py_tokenize.INDENT:
+                symbol = "{"
+            elif tok.type == py_tokenize.DEDENT:
+                symbol = "}"
+            else:
+                symbol = tok.string
+            tokens.append((symbol, tok.start[0]))
+    except (py_tokenize.TokenError, SyntaxError):
+        pass
+    return tokens
+
+
+def js_tokens(code):
+    """Normalized ``(symbol, line)`` tokens of JavaScript source."""
+    tokens = []
+    for token in js_tokenize(code):
+        if token.kind == COMMENT:
+            continue
+        if token.kind == NAME:
+            symbol = token.value if token.value in JS_KEYWORDS else "$id"
+        elif token.kind == NUMBER:
+            symbol = "$num"
+        elif token.kind in (STRING, TEMPLATE):
+            symbol = "$str"
+        elif token.kind == REGEX:
+            symbol = "$re"
+        else:
+            symbol = token.value
+        tokens.append((symbol, token.line))
+    return tokens
+
+
+def fingerprint_source(language, code):
+    """Winnowed fingerprints of one file as ``[hash, first line, last line]`` lists.
+
+    k-gram hashes are computed with a rolling polynomial hash, then the
+    rightmost minimum of every WINNOW_WINDOW consecutive hashes is kept.
+    """
+    tokens = python_tokens(code) if language == "python" else js_tokens(code)
+    if len(tokens) < K_GRAM:
+        return []
+    symbol_ids = {}
+    ids = [symbol_ids.setdefault(symbol, zlib.crc32(symbol.encode("utf-8"))) for symbol, _ in tokens]
+
+    top = pow(_BASE, K_GRAM - 1, _MOD)
+    h = 0
+    for value in ids[:K_GRAM]:
+        h = (h * _BASE + value) % _MOD
+    hashes = [h]
+    for i in range(K_GRAM, len(ids)):
+        h = ((h - ids[i - K_GRAM] * top) * _BASE + ids[i]) % _MOD
+        hashes.append(h)
+
+    selected = []
+    window = deque()  # indices of hashes, increasing, with non-decreasing values from the right
+    last = -1
+    for i, h in enumerate(hashes):
+        while window and hashes[window[-1]] >= h:
+            window.pop()
+        window.append(i)
+        if window[0] <= i - WINNOW_WINDOW:
+            window.popleft()
+        if i >= WINNOW_WINDOW - 1 or i == len(hashes) - 1:
+            best = window[0]
+            if best != last:
+                selected.append([hashes[best], tokens[best][1], tokens[best + K_GRAM - 1][1]])
+                last = best
+    return selected
+
+
+def _fingerprint_job(job):
+    return fingerprint_source(*job)
+
+
+def map_cached(function, kind, version, files, workers, cache):
+    """Yield ``(index, function((language, code)))`` for ``(path, language, code)`` files.
+
+    Results are cached by content under ``kind``/``version``; the rest are
+    computed on a process pool when ``workers`` > 1. ``function`` must be a
+    module-level function taking one ``(language, code)`` tuple and
+    returning something JSON-serializable.
+    """
+    pending = []
+    for i, (_, language, code) in enumerate(files):
+        key = cache.key(f"{kind}:{language}", version, code.encode("utf-8"))
+        cached = cache.get(key)
+        if cached is not None:
+            yield i, cached
+        else:
+            pending.append((i, key))
+
+    jobs = [(files[i][1], files[i][2]) for i, _ in pending]
+    if workers <= 1 or len(jobs) <= 1:
+        results = map(function, jobs)
+        pool = None
+    else:
+        pool = ProcessPoolExecutor(max_workers=min(workers, len(jobs)))
+        results = pool.map(function, jobs, chunksize=16)
+    try:
+        for (i, key), result in zip(pending, results):
+            cache.put(key, result)
+            yield i, result
+    finally:
+        if pool is not None:
+            pool.shutdown(wait=True, cancel_futures=True)
+    if cache.writes:
+        cache.prune()
+
+
+def _merge_matches(matches):
+    """Merge the matched fingerprint ranges of one file pair into maximal ``(a_start, a_end, b_start, b_end)`` regions.
+
+    Code repeated inside a file also matches at other offsets, so a match
+    extends whichever still-open region it continues, not just the last one.
+    """
+    regions = []
+    active = []  # indices into regions that can still grow
+    for a_start, a_end, b_start, b_end in sorted(matches):
+        active = [r for r in active if regions[r][1] + MERGE_GAP >= a_start]
+        for r in reversed(active):
+            ra_start, ra_end, rb_start, rb_end = regions[r]
+            if rb_start <= b_start <= rb_end + MERGE_GAP:
+                regions[r] = (ra_start, max(ra_end, a_end), rb_start, max(rb_end, b_end))
+                break
+        else:
+            active.append(len(regions))
+            regions.append((a_start, a_end, b_start, b_end))
+    return regions
+
+
+def find_clones(files, workers=1, cache=None):
+    """Find code cloned between (or within) ``files``, a list of ``(path, language, code)``.
+
+    Returns up to MAX_CLONE_PAIRS clone pairs, longest first, as
+    ``{"a": {"path", "start_line", "end_line"}, "b": {...}, "lines": n}``.
+    """
+    cache = AnalysisCache() if cache is None else cache
+    spill_dir = tempfile.mkdtemp(prefix="clones-")
+    try:
+        partitions = [open(os.path.join(spill_dir, f"{p}.bin"), "wb") for p in range(PARTITIONS)]
+        try:
+            for i, fingerprints in map_cached(_fingerprint_job, "clones", CLONES_VERSION, files, workers, cache):
+                for h, first, last in fingerprints:
+                    partitions[h % PARTITIONS].write(_RECORD.pack(h, i, first, last))
+        finally:
+            for partition in partitions:
+                partition.close()
+
+        pair_matches = defaultdict(list)
+        for p in range(PARTITIONS):
+            with open(os.path.join(spill_dir, f"{p}.bin"), "rb") as f:
+                data = f.read()
+            places = defaultdict(list)
+            for h, i, first, last in _RECORD.iter_unpack(data):
+                places[h].append((i, first, last))
+            del data
+            for occurrences in places.values():
+                if len(occurrences) < 2 or len(occurrences) > MAX_OCCURRENCES:
+                    continue
+                for a, b in combinations(sorted(occurrences), 2):
+                    if a[0] == b[0] and a[2] >= b[1]:
+                        continue  # overlapping ranges in the same file
+                    pair_matches[(a[0], b[0])].append((a[1], a[2], b[1], b[2]))
+    finally:
+        shutil.rmtree(spill_dir, ignore_errors=True)
+
+    clones = []
+    for (a, b), matches in pair_matches.items():
+        for a_start, a_end, b_start, b_end in _merge_matches(matches):
+            lines = min(a_end - a_start, b_end - b_start) + 1
+            if lines < MIN_CLONE_LINES:
+                continue
+            clones.append({
+                "a": {"path": files[a][0], "start_line": a_start, "end_line": a_end},
+                "b": {"path": files[b][0], "start_line": b_start, "end_line": b_end},
+                "lines": lines
+            })
+    clones.sort(key=lambda clone: (-clone["lines"], clone["a"]["path"], clone["a"]["start_line"],
+                                   clone["b"]["path"], clone["b"]["start_line"]))
+    return clones[:MAX_CLONE_PAIRS]
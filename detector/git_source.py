@@ -0,0 +1,89 @@
+import os
+from pathlib import Path, PurePosixPath
+
+import git
+
+LANGUAGES = {".py": "python", ".js": "javascript"}
+# Partial-clone filter for object-database clones. Trees come down with the
+# clone, blobs are fetched afterwards for the .py/.js files only.
+BLOB_FILTER = os.getenv("GIT_BLOB_FILTER", "blob:none")
+# Object ids per prefetch request, to stay well below command-line limits.
+PREFETCH_BATCH = 1000
+
+
+def language_of(path):
+    return LANGUAGES.get(PurePosixPath(path).suffix)
+
+
+def clone_objects(repo_url, target_dir):
+    """Shallow, blob-filtered bare clone of ``repo_url``: history and file contents are left on the server."""
+    options = {"bare": True, "depth": 1, "single_branch": True}
+    if BLOB_FILTER:
+        options["filter"] = BLOB_FILTER
+    if os.path.isdir(repo_url):
+        # git ignores --depth/--filter for plain local paths, but not for file:// URLs.
+        repo_url = Path(repo_url).resolve().as_uri()
+    return git.Repo.clone_from(repo_url, target_dir, **options)
+
+
+def clone_history(repo_url, target_dir, since):
+    """Blob-filtered bare clone of ``repo_url`` holding the commits made ``since`` (any date git understands)."""
+    options = {"bare": True, "single_branch": True, "shallow_since": since}
+    if BLOB_FILTER:
+        options["filter"] = BLOB_FILTER
+    if os.path.isdir(repo_url):
+        repo_url = Path(repo_url).resolve().as_uri()
+    return git.Repo.clone_from(repo_url, target_dir, **options)
+
+
+def fetch_history(repo, since):
+    """Fetch the remote's HEAD and its commits made ``since`` into a history clone and return the HEAD commit."""
+    repo.git.fetch(f"--shallow-since={since}", "--no-tags", "origin", "HEAD")
+    return repo.commit("FETCH_HEAD")
+
+
+def fetch_head(repo):
+    """Shallow-fetch the remote's HEAD into an object-database clone and return its commit."""
+    repo.git.fetch("--depth=1", "--no-tags", "origin", "HEAD")
+    return repo.commit("FETCH_HEAD")
+
+
+def source_blobs(commit):
+    """Return ``(path, language, blob)`` for every .py/.js blob in the commit's tree, sorted by path."""
+    blobs = [(item.path, language_of(item.path), item) for item in commit.tree.traverse()
+             if item.type == "blob" and language_of(item.path)]
+    blobs.sort(key=lambda entry: PurePosixPath(entry[0]))
+    return blobs
+
+
+def prefetch_blobs(repo, commit, blobs):
+    """Download the given blobs in a few batched requests instead of one lazy fetch per blob.
+
+    Only needed for partial clones; objects that are already local are
+    skipped. Failures are not fatal because git still fetches a missing blob
+    on demand when it is read.
+    """
+    if not repo.git.config("--get", "remote.origin.promisor", with_exceptions=False):
+        return
+    missing = set()
+    for line in repo.git.rev_list("--objects", "--missing=print", commit.hexsha).splitlines():
+        if line.startswith("?"):
+            missing.add(line[1:].strip())
+    fetch_blobs(repo, [blob.hexsha for _, _, blob in blobs if blob.hexsha in missing])
+
+
+def fetch_blobs(repo, shas):
+    """Download the blobs with the given ids into a partial clone, ``PREFETCH_BATCH`` per request."""
+    wanted = list(shas)
+    for start in range(0, len(wanted), PREFETCH_BATCH):
+        try:
+            repo.git(c="fetch.negotiationAlgorithm=noop").fetch(
+                "origin", "--no-tags", "--no-write-fetch-head", "--recurse-submodules=no",
+                f"--filter={BLOB_FILTER}", *wanted[start:start + PREFETCH_BATCH])
+        except git.GitCommandError as e:
+            print(f"[-] Blob prefetch failed, falling back to on-demand fetches: {str(e)}")
+            return
+
+
+def read_blob(blob):
+    return blob.data_stream.read()
@@ -0,0 +1,222 @@
+import os
+import re
+import threading
+
+import git
+
+from detector.app import ANALYZER_VERSIONS, finish_timings, iter_cached, remove_repo
+from detector.cache import AnalysisCache
+from detector.git_source import clone_history, fetch_blobs, fetch_history, language_of, read_blob
+from detector.incremental import repo_state_dir
+from detector.report_store import report_store, stored_result
+from detector.timing import Timings
+
+# Default window of /history, in any form git's --since accepts ("2024-06-01", "6 months ago", ...).
+HISTORY_SINCE = os.getenv("HISTORY_SINCE", "1 year ago")
+# Newest first-parent commits kept from the window; older ones are left out.
+HISTORY_MAX_COMMITS = int(os.getenv("HISTORY_MAX_COMMITS", "2000"))
+# Blobs read and analyzed at a time, so long histories don't hold every source in memory.
+HISTORY_BATCH = 500
+SINCE = re.compile(r"[0-9A-Za-z][0-9A-Za-z :.,+-]*")
+# File modes of regular files and symlinks; submodules (160000) have no blob.
+BLOB_MODES = ("100", "120")
+
+_locks_guard = threading.Lock()
+_history_locks = {}
+
+
+def _history_lock(repo_url):
+    with _locks_guard:
+        return _history_locks.setdefault(repo_url, threading.Lock())
+
+
+def analyzer_key(language):
+    return f"{language}:{ANALYZER_VERSIONS[language]}"
+
+
+def sync_history(repo_url, history_dir, since):
+    """Clone the commits of ``repo_url`` made ``since`` once, then fetch new ones on later calls."""
+    if os.path.isdir(history_dir):
+        try:
+            repo = git.Repo(history_dir)
+            print(f"[+] Fetching history of {repo_url} since {since} ...")
+            return repo, fetch_history(repo, since)
+        except Exception as e:
+            print(f"[-] Could not update the history clone, cloning again: {str(e)}")
+            remove_repo(history_dir)
+    print(f"[+] Cloning history of {repo_url} since {since} into {history_dir} ...")
+    repo = clone_history(repo_url, history_dir, since)
+    return repo, repo.head.commit
+
+
+def first_parent_commits(repo, head, since, max_commits=HISTORY_MAX_COMMITS):
+    """``[(sha, committed_at, position)]`` of the mainline commits made ``since``, oldest first; HEAD when there are none.
+
+    ``position`` counts the commit's first-parent ancestors in the clone, which
+    orders the commits even where their times don't (same second, rebases,
+    skewed clocks). The clone only ever gets deeper, and a deeper run re-dates
+    every commit, so positions from different runs stay comparable.
+    """
+    mainline = repo.git.rev_list("--first-parent", head.hexsha).split()
+    positions = {sha: len(mainline) - index for index, sha in enumerate(mainline)}
+    log = repo.git.log("--first-parent", f"--since={since}", "--format=%H %ct", head.hexsha)
+    commits = [(sha, int(committed_at)) for sha, committed_at in (line.split() for line in log.splitlines())]
+    if not commits:
+        commits = [(head.hexsha, head.committed_date)]
+    return [(sha, committed_at, positions[sha]) for sha, committed_at in commits[:max_commits][::-1]]
+
+
+def tree_sources(repo, commit):
+    """``{path: (language, blob sha)}`` of the .py/.js files in ``commit``."""
+    files = {}
+    for item in repo.git.ls_tree("-r", "-z", commit).split("\0"):
+        if not item:
+            continue
+        meta, path = item.split("\t", 1)
+        mode, kind, sha = meta.split()
+        language = language_of(path)
+        if language and kind == "blob" and mode.startswith(BLOB_MODES):
+            files[path] = (language, sha)
+    return files
+
+
+def tree_changes(repo, old_commit, new_commit):
+    """``[(path, language, blob sha)]`` of the .py/.js files that differ; the sha is None for removed files."""
+    fields = repo.git.diff_tree("-r", "-z", "--no-renames", "--no-commit-id", old_commit, new_commit).split("\0")
+    changes = []
+    for meta, path in zip(fields[0::2], fields[1::2]):
+        _, new_mode, _, sha, status = meta.split()
+        language = language_of(path)
+        if not language:
+            continue
+        if status == "D" or not new_mode.startswith(BLOB_MODES):
+            changes.append((path, language, None))
+        else:
+            changes.append((path, language, sha))
+    return changes
+
+
+def iter_history(repo_url, since=None, workers=None, cache=None):
+    """Record per-file smell and metric snapshots of the mainline commits of ``repo_url`` made ``since``.
+
+    The commits are walked oldest first by diffing each tree against the
+    previous one, so a commit costs one ``git diff-tree``. Files are tracked
+    by blob id and every distinct .py/.js blob is analyzed once, by this run
+    or an earlier one (see ReportStore.blob_results). Contents are fetched
+    only for those blobs, in batches. Commits already in the history are
+    skipped; the others get a dated report in the report store, which
+    ReportStore.series turns into time series.
+
+    Yields the events JobManager tracks: ``("start", metadata)`` with the
+    number of blobs to analyze as ``python_files``/``js_files``, ``("file", ...)``
+    or ``("file_error", ...)`` per analyzed blob, then ``("done", {"metadata": ...})``.
+    """
+    since = since or HISTORY_SINCE
+    if not SINCE.fullmatch(since):
+        raise ValueError(f"Invalid 'since': {since!r}")
+    with _history_lock(repo_url):
+        state_dir = repo_state_dir(repo_url)
+        history_dir = os.path.join(state_dir, "history.git")
+        os.makedirs(state_dir, exist_ok=True)
+
+        timings = Timings()
+        try:
+            with timings.stage("clone"):
+                repo, head = sync_history(repo_url, history_dir, since)
+        except Exception as e:
+            print(f"[-] Error cloning repo: {str(e)}")
+            raise ValueError(f"Failed to clone repository: {repo_url}")
+
+        try:
+            yield from _iter_history(repo_url, repo, head, since, workers, cache, timings)
+        finally:
+            repo.close()
+
+
+def _iter_history(repo_url, repo, head, since, workers, cache, timings):
+    store = report_store()
+    with timings.stage("discovery"):
+        commits = first_parent_commits(repo, head, since)
+        dated = store.dated_commits(repo_url)
+        reported = {entry["commit"] for entry in store.commits(repo_url)}
+        # State of the first commit, then only what each commit changed.
+        first_files = tree_sources(repo, commits[0][0])
+        changes = [tree_changes(repo, old[0], new[0]) for old, new in zip(commits, commits[1:])]
+
+    # Every blob the walked commits contain, by language.
+    blobs = {}
+    for path, (language, sha) in first_files.items():
+        blobs[sha] = language
+    for commit_changes in changes:
+        for path, language, sha in commit_changes:
+            if sha is not None:
+                blobs[sha] = language
+
+    results = {}
+    for language in ANALYZER_VERSIONS:
+        shas = [sha for sha, blob_language in blobs.items() if blob_language == language]
+        results.update(store.blob_results(analyzer_key(language), shas))
+    to_analyze = [(sha, language) for sha, language in blobs.items() if sha not in results]
+    python_count = sum(1 for _, language in to_analyze if language == "python")
+    new_commits = [sha for sha, _, _ in commits if sha not in dated]
+    print(f"[+] {len(commits)} commits since {since}, {len(new_commits)} not in the history yet; "
+          f"{len(to_analyze)} of {len(blobs)} distinct files to analyze.")
+
+    metadata = {
+        "repo": repo_url,
+        "since": since,
+        "commit": head.hexsha,
+        "commits": len(commits),
+        "new_commits": len(new_commits),
+        "blobs": len(blobs),
+        "python_files": python_count,
+        "js_files": len(to_analyze) - python_count
+    }
+    yield "start", dict(metadata)
+
+    cache = AnalysisCache() if cache is None else cache
+    for start in range(0, len(to_analyze), HISTORY_BATCH):
+        batch = to_analyze[start:start + HISTORY_BATCH]
+        with timings.stage("read"):
+            fetch_blobs(repo, [sha for sha, _ in batch])
+            jobs = [(language, read_blob(git.Blob(repo, bytes.fromhex(sha)))) for sha, language in batch]
+        analyzed = []
+        for i, data, error in timings.iterate("analysis", iter_cached(jobs, workers, cache, timings)):
+            sha, language = batch[i]
+            results[sha] = stored_result(data, error)
+            analyzed.append((sha, analyzer_key(language), results[sha]))
+            if error is None:
+                yield "file", {"blob": sha, "language": language}
+            else:
+                yield "file_error", {"blob": sha, "language": language, "error": error}
+        store.save_blob_results(analyzed)
+
+    with timings.stage("report_write"):
+        new = set(new_commits)
+        files = {path: (language, sha) for path, (language, sha) in first_files.items()}
+        # Commits that keep their report; their dates are refreshed so positions stay consistent.
+        dates = {}
+        for index, (commit, committed_at, position) in enumerate(commits):
+            if index:
+                for path, language, sha in changes[index - 1]:
+                    if sha is None:
+                        files.pop(path, None)
+                    else:
+                        files[path] = (language, sha)
+            if commit not in new or commit in reported:
+                # Already in the history, or analyzed before through /analyze: keep that report, only date it.
+                dates[commit] = (committed_at, position)
+                continue
+            python_files = sum(1 for language, _ in files.values() if language == "python")
+            store.save_files(repo_url, commit,
+                             [(path, language, results[sha]) for path, (language, sha) in sorted(files.items())],
+                             {"clones": [], "near_duplicates": []},
+                             {"python_files": python_files, "js_files": len(files) - python_files, "repo": repo_url,
+                              "commit": commit, "history": True},
+                             (committed_at, position))
+        store.save_commit_dates(repo_url, dates)
+        store.flush()
+
+    metadata["cache"] = cache.stats()
+    finish_timings(timings, metadata)
+    yield "done", {"metadata": metadata}
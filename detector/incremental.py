@@ -0,0 +1,250 @@
+import hashlib
+import json
+import os
+import shutil
+import stat
+import tempfile
+import threading
+
+import git
+
+from detector.app import (ANALYZER_VERSIONS, build_report, collect_analysis, decode_source, file_entry, finish_timings,
+                          iter_cached, repo_duplicates, save_report)
+from detector.cache import AnalysisCache
+from detector.git_source import clone_objects, fetch_head, prefetch_blobs, read_blob, source_blobs
+from detector.timing import Timings
+
+# Persistent object-database clones and last-analysis state, one directory per repo_url.
+STATE_DIR = os.getenv("REPO_STATE_DIR", os.path.join(".smell_cache", "repos"))
+INCREMENTAL_ANALYSIS = os.getenv("INCREMENTAL_ANALYSIS", "1") != "0"
+# Keeps the last analyzed commit reachable so shallow fetches and gc don't drop it.
+ANALYZED_REF = "refs/code-smells/analyzed"
+
+_locks_guard = threading.Lock()
+_repo_locks = {}
+
+
+def _repo_lock(repo_url):
+    with _locks_guard:
+        return _repo_locks.setdefault(repo_url, threading.Lock())
+
+
+def repo_state_dir(repo_url):
+    return os.path.join(STATE_DIR, hashlib.sha1(repo_url.encode("utf-8")).hexdigest()[:16])
+
+
+def _remove_tree(path):
+    shutil.rmtree(path, onerror=lambda _, p, __: os.chmod(p, stat.S_IWRITE))
+
+
+def sync_objects(repo_url, objects_dir):
+    """Clone ``repo_url`` once as a bare object database, then shallow-fetch its HEAD on later calls."""
+    if os.path.isdir(objects_dir):
+        try:
+            repo = git.Repo(objects_dir)
+            print(f"[+] Fetching {repo_url} into {objects_dir} ...")
+            return repo, fetch_head(repo)
+        except Exception as e:
+            print(f"[-] Could not update existing clone, cloning again: {str(e)}")
+            _remove_tree(objects_dir)
+    print(f"[+] Fetching objects of {repo_url} into {objects_dir} ...")
+    repo = clone_objects(repo_url, objects_dir)
+    print("[+] Fetch complete.")
+    return repo, repo.head.commit
+
+
+def changed_paths(old_commit, new_commit):
+    """Return (changed, removed) paths between two commits; renames count as both."""
+    changed, removed = set(), set()
+    # Without rename detection git never needs blob contents to diff two trees.
+    for diff in old_commit.diff(new_commit, no_renames=True):
+        if diff.change_type in ("D", "R"):
+            removed.add(diff.a_path)
+        if diff.change_type != "D":
+            changed.add(diff.b_path)
+    return changed, removed
+
+
+def load_state(state_file):
+    try:
+        with open(state_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_state(state_file, state):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(state_file), suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(state, f, separators=(",", ":"))
+    os.replace(tmp_path, state_file)
+
+
+def iter_repo_analysis_incremental(repo_url, workers=None, cache=None):
+    """Analyze ``repo_url``, re-running detectors only on files changed since the last call.
+
+    A bare, blob-filtered clone and the per-file results of the previous
+    analysis are kept under STATE_DIR. On the next call the new HEAD is diffed
+    against the commit that was analyzed last: added/modified .py/.js files
+    are re-analyzed, deleted ones dropped and everything else reused. Files
+    that failed last time are analyzed again, and so is everything when
+    ANALYZER_VERSIONS changed. Sources are read from the object database;
+    nothing is checked out.
+
+    Yields the same events as ``iter_repo_analysis``; reused files come first.
+    The final result also records the analyzed commit in ``metadata``.
+    """
+    with _repo_lock(repo_url):
+        state_dir = repo_state_dir(repo_url)
+        objects_dir = os.path.join(state_dir, "objects.git")
+        state_file = os.path.join(state_dir, "state.json")
+        os.makedirs(state_dir, exist_ok=True)
+
+        timings = Timings()
+        try:
+            with timings.stage("clone"):
+                repo, head = sync_objects(repo_url, objects_dir)
+        except Exception as e:
+            print(f"[-] Error cloning repo: {str(e)}")
+            raise ValueError(f"Failed to clone repository: {repo_url}")
+
+        try:
+            yield from _iter_objects_analysis(repo_url, repo, head, state_file, workers, cache, timings)
+        finally:
+            repo.close()
+
+
+def analyze_repo_incremental(repo_url, workers=None, cache=None):
+    return collect_analysis(iter_repo_analysis_incremental(repo_url, workers, cache))
+
+
+def read_source(repo_url, commit, path):
+    """Return ``(blob sha, bytes)`` of ``path`` at ``commit`` from the repo's object-database clone.
+
+    The clone is created, and an unknown commit shallow-fetched, on demand, so
+    this also serves commits analyzed with INCREMENTAL_ANALYSIS=0. Raises
+    FileNotFoundError when the commit or the path doesn't exist.
+    """
+    state_dir = repo_state_dir(repo_url)
+    objects_dir = os.path.join(state_dir, "objects.git")
+    if not os.path.isdir(objects_dir):
+        with _repo_lock(repo_url):
+            if not os.path.isdir(objects_dir):
+                os.makedirs(state_dir, exist_ok=True)
+                try:
+                    repo, _ = sync_objects(repo_url, objects_dir)
+                except Exception as e:
+                    print(f"[-] Error cloning repo: {str(e)}")
+                    raise ValueError(f"Failed to clone repository: {repo_url}")
+                repo.close()
+
+    with git.Repo(objects_dir) as repo:
+        tree = _commit_tree(repo, commit)
+        try:
+            blob = tree / path
+        except KeyError:
+            raise FileNotFoundError(f"{path} does not exist at {commit}")
+        if blob.type != "blob":
+            raise FileNotFoundError(f"{path} is not a file at {commit}")
+        # Blobs outside the analyzed .py/.js set are fetched lazily from the promisor remote.
+        return blob.hexsha, read_blob(blob)
+
+
+def _commit_tree(repo, commit):
+    try:
+        return repo.commit(commit).tree
+    except (ValueError, git.BadName, git.BadObject, git.GitCommandError):
+        pass
+    try:
+        repo.git.fetch("--depth=1", "--no-tags", "--no-write-fetch-head", "origin", commit)
+        return repo.commit(commit).tree
+    except (ValueError, git.BadName, git.BadObject, git.GitCommandError):
+        raise FileNotFoundError(f"Unknown commit: {commit}")
+
+
+def _iter_objects_analysis(repo_url, repo, head, state_file, workers, cache, timings):
+    state = load_state(state_file) or {}
+    # Files that failed are analyzed again: the failure may have been a crashed worker, not the file.
+    files = {path: stored for path, stored in state.get("files", {}).items() if "error" not in stored}
+    base_commit = None
+    if state.get("analyzer_versions") != ANALYZER_VERSIONS:
+        # Stored results come from other detectors or thresholds.
+        if state.get("commit"):
+            print("[-] Analyzers changed since the last analysis, analyzing everything.")
+    elif state.get("repo_url") == repo_url and state.get("commit"):
+        try:
+            base_commit = repo.commit(state["commit"])
+            base_commit.tree  # shallow clones may have lost it; make sure it is readable
+        except (ValueError, git.BadName, git.BadObject, git.GitCommandError):
+            base_commit = None
+            print(f"[-] Last analyzed commit {state['commit']} is gone, analyzing everything.")
+
+    with timings.stage("discovery"):
+        blobs = source_blobs(head)
+        if base_commit is None:
+            files = {}
+        elif base_commit != head:
+            changed, removed = changed_paths(base_commit, head)
+            for path in changed | removed:
+                files.pop(path, None)
+
+    with timings.stage("read"):
+        prefetch_blobs(repo, head, blobs)
+        contents = {path: read_blob(blob) for path, _, blob in blobs}
+    to_analyze = [(path, language) for path, language, _ in blobs if path not in files]
+    python_count = sum(1 for _, language, _ in blobs if language == "python")
+    print(f"[+] Re-analyzing {len(to_analyze)} changed files at {head.hexsha[:10]} "
+          f"(last analyzed: {base_commit.hexsha[:10] if base_commit else 'none'}).")
+
+    metadata = {
+        "python_files": python_count,
+        "js_files": len(blobs) - python_count,
+        "repo": repo_url,
+        "commit": head.hexsha,
+        "base_commit": base_commit.hexsha if base_commit else None,
+        "reanalyzed_files": len(to_analyze)
+    }
+    yield "start", dict(metadata)
+
+    entries = []
+    errors = []
+    for path, language, _ in blobs:
+        stored = files.get(path)
+        if stored is None:
+            continue
+        data = {"smells": stored["smells"], "metrics": stored["metrics"], "code": decode_source(contents[path])}
+        entry = file_entry(path, language, data)
+        entries.append(entry)
+        yield "file", entry
+
+    cache = AnalysisCache() if cache is None else cache
+    jobs = [(language, contents[path]) for path, language in to_analyze]
+    for i, data, error in timings.iterate("analysis", iter_cached(jobs, workers, cache, timings)):
+        path, language = to_analyze[i]
+        entry = file_entry(path, language, data, error)
+        if error is not None:
+            errors.append(entry)
+            yield "file_error", entry
+            continue
+        files[path] = {"language": language, "smells": data["smells"], "metrics": data["metrics"]}
+        entries.append(entry)
+        yield "file", entry
+
+    # Only paths still in the tree are kept, so stale entries can't pile up.
+    files = {path: files[path] for path, _, _ in blobs if path in files}
+    with timings.stage("state_write"):
+        save_state(state_file, {"repo_url": repo_url, "commit": head.hexsha, "analyzer_versions": ANALYZER_VERSIONS,
+                                 "files": files})
+        repo.git.update_ref(ANALYZED_REF, head.hexsha)
+
+    report, smell_report = build_report(entries)
+    # Fingerprints of unchanged files come from the cache, so this only re-reads changed ones.
+    duplicates = repo_duplicates(entries, workers, cache, timings)
+
+    metadata["cache"] = cache.stats()
+    metadata["clone_pairs"] = len(duplicates["clones"])
+    metadata["near_duplicate_pairs"] = len(duplicates["near_duplicates"])
+    with timings.stage("report_write"):
+        save_report(repo_url, head.hexsha, entries + errors, duplicates, metadata)
+    finish_timings(timings, metadata)
+    yield "done", {"python": report, "javascript": smell_report, **duplicates, "metadata": metadata}
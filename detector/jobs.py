@@ -0,0 +1,110 @@
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# Analyses running at the same time; further jobs wait in the queue.
+JOB_WORKERS = int(os.getenv("ANALYSIS_JOB_WORKERS", "2"))
+# Queued + running jobs accepted before submit() starts refusing new ones.
+JOB_QUEUE_LIMIT = int(os.getenv("ANALYSIS_JOB_QUEUE_LIMIT", "100"))
+# Seconds a finished job (and its report) is kept around for polling.
+JOB_RESULT_TTL = int(os.getenv("ANALYSIS_JOB_RESULT_TTL", "3600"))
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class AnalysisJob:
+    """State of one queued/running/finished repository analysis."""
+
+    def __init__(self, repo_url, options=None):
+        self.id = uuid.uuid4().hex
+        self.repo_url = repo_url
+        self.options = options or {}
+        self.status = "queued"
+        self.files_total = None
+        self.files_done = 0
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.error = None
+        self.result = None
+
+    @property
+    def active(self):
+        return self.status in ("queued", "running")
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "repo_url": self.repo_url,
+            "status": self.status,
+            "progress": {"files_done": self.files_done, "files_total": self.files_total},
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "error": self.error
+        }
+
+
+class JobManager:
+    """Runs analyses in the background on a bounded thread pool.
+
+    ``analyze`` is called with a repo URL and the options given to submit,
+    and must return an analysis event stream (see
+    detector.app.iter_repo_analysis); its events drive the job's progress and
+    the "done" payload becomes the job's result. Submitting a repo with the
+    same options as a queued or running job returns that job.
+    """
+
+    def __init__(self, analyze, workers=JOB_WORKERS, queue_limit=JOB_QUEUE_LIMIT, result_ttl=JOB_RESULT_TTL):
+        self.analyze = analyze
+        self.queue_limit = queue_limit
+        self.result_ttl = result_ttl
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="analysis-job")
+        self._lock = threading.Lock()
+        self._jobs = {}
+
+    def submit(self, repo_url, **options):
+        with self._lock:
+            self._expire()
+            for job in self._jobs.values():
+                if job.active and job.repo_url == repo_url and job.options == options:
+                    return job
+            if sum(1 for job in self._jobs.values() if job.active) >= self.queue_limit:
+                raise JobQueueFull(f"Too many analysis jobs queued (limit {self.queue_limit})")
+            job = AnalysisJob(repo_url, options)
+            self._jobs[job.id] = job
+        self._pool.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _expire(self):
+        cutoff = time.time() - self.result_ttl
+        for job_id in [job.id for job in self._jobs.values() if job.finished and job.finished < cutoff]:
+            del self._jobs[job_id]
+
+    def _run(self, job):
+        job.status = "running"
+        job.started = time.time()
+        try:
+            for event, payload in self.analyze(job.repo_url, **job.options):
+                if event == "start":
+                    job.files_total = payload["python_files"] + payload["js_files"]
+                elif event in ("file", "file_error"):
+                    job.files_done += 1
+                elif event == "done":
+                    job.result = payload
+            job.status = "done"
+        except Exception as e:
+            print(f"[-] Analysis job {job.id} failed: {traceback.format_exc()}")
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished = time.time()
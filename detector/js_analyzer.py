@@ -1,134 +1,220 @@
 import re
 from collections import defaultdict
 
-def analyze_js_code(file_path):
-    smells = []
-    function_details = []
-    global_variables = []
+from detector.js_lexer import tokenize, BraceIndex, IdentifierIndex, NAME, NUMBER, PUNCT, COMMENT
 
+# Bump whenever smells, metrics or thresholds change: cached results are keyed on it.
+ANALYZER_VERSION = "3"
+
+SNAKE_CASE = re.compile(r'[a-z]+(?:_[a-z]+)+')
+CAMEL_CASE = re.compile(r'[a-z]+(?:[A-Z][a-zA-Z0-9]*)+')
+OPENING = frozenset("([{")
+CLOSING = frozenset(")]}")
+
+def analyze_js_code(file_path):
     with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
         code = f.read()
+    return analyze_js_source(code)
+
+def _no_lap(name=None):
+    pass
+
+def _is_punct(token, value):
+    return token.kind == PUNCT and token.value == value
+
+def _skip_parens(tokens, i):
+    """Index just past the ")" matching the "(" at ``i``, and the number of top-level arguments in between."""
+    depth = 0
+    args = 0
+    pending = False
+    for j in range(i, len(tokens)):
+        token = tokens[j]
+        if token.kind == PUNCT and token.value in OPENING:
+            depth += 1
+            if depth == 1:
+                continue
+        elif token.kind == PUNCT and token.value in CLOSING:
+            depth -= 1
+            if depth == 0:
+                return j + 1, args + pending
+        if depth == 1 and _is_punct(token, ","):
+            args += pending
+            pending = False
+        else:
+            pending = True
+    return len(tokens), args + pending
+
+def analyze_js_source(code, timings=None):
+    """Detect smells from a single token stream, so strings and comments are never mistaken for code.
+
+    ``timings`` (detector.timing.Timings) gets the seconds spent in each check.
+    """
+    lap = timings.lap if timings is not None else _no_lap
+    lap()
+    smells = []
+    function_details = []
 
     lines = code.splitlines()
     num_lines = len(lines)
+    tokens = tokenize(code)
+    code_tokens = [token for token in tokens if token.kind != COMMENT]
+    n = len(code_tokens)
+
+    line_tokens = defaultdict(list)
+    for token in code_tokens:
+        line_tokens[token.line].append(token.value)
+    lap("tokenize")
 
     # --- Global Variables ---
-    var_decls = re.findall(r'(?:var|let|const)\s+(\w+)', code)
-    for var in var_decls:
-        if re.findall(rf'\b{re.escape(var)}\b', code) == [var]:
-            global_variables.append(var)
+    identifiers = IdentifierIndex(code_tokens)
+    global_variables = identifiers.unused_declarations()
     if global_variables:
         smells.append(f"Global Variables Found: {len(global_variables)} variables")
-
-    # --- Long Function & Too Many Parameters ---
-    function_defs = re.finditer(r'function\s+\w*\s*\((.*?)\)\s*\{', code, re.DOTALL)
-    for match in function_defs:
-        start = match.start()
-        params = match.group(1).split(',')
-        param_count = len([p.strip() for p in params if p.strip()])
-        if param_count > 4:
-            smells.append(f"Too Many Parameters (>4): {param_count} parameters")
-
-        open_braces = 0
-        end = start
-        for i in range(start, len(code)):
-            if code[i] == '{':
-                open_braces += 1
-            elif code[i] == '}':
-                open_braces -= 1
-                if open_braces == 0:
-                    end = i
-                    break
-        func_code = code[start:end]
-        func_lines = func_code.count('\n') + 1
-        function_details.append(func_lines)
+    lap("global_variables")
+
+    # --- Long Function, Too Many Parameters & Callback Hell (nested anonymous functions) ---
+    # A function body is the "{" after a function header; where it ends is a
+    # lookup in the brace index instead of a scan.
+    braces = BraceIndex(code_tokens)
+    callbacks = []              # token index of each anonymous "function (...) {" body, in source order
+    empty_catches = 0
+    console_logs = 0
+    long_chains = 0
+    chain_end = 0
+    i = 0
+    while i < n:
+        token = code_tokens[i]
+        if token.kind == NAME:
+            if token.value == "function":
+                j = i + 1
+                if j < n and _is_punct(code_tokens[j], "*"):
+                    j += 1
+                anonymous = not (j < n and code_tokens[j].kind == NAME)
+                if not anonymous:
+                    j += 1
+                if j < n and _is_punct(code_tokens[j], "("):
+                    j, param_count = _skip_parens(code_tokens, j)
+                    if j < n and _is_punct(code_tokens[j], "{"):
+                        if param_count > 4:
+                            smells.append(f"Too Many Parameters (>4): {param_count} parameters")
+                        close = braces.closing(j)
+                        # A body that is never closed counts as 1 line.
+                        function_details.append(code_tokens[close].line - token.line + 1 if close is not None else 1)
+                        if anonymous:
+                            callbacks.append(j)
+            elif token.value == "catch":
+                j = i + 1
+                if j < n and _is_punct(code_tokens[j], "("):
+                    j, _ = _skip_parens(code_tokens, j)
+                if j + 1 < n and _is_punct(code_tokens[j], "{") and _is_punct(code_tokens[j + 1], "}"):
+                    empty_catches += 1
+            elif (token.value == "console" and i + 2 < n and _is_punct(code_tokens[i + 1], ".")
+                  and code_tokens[i + 2].kind == NAME and code_tokens[i + 2].value == "log"):
+                console_logs += 1
+
+            if i >= chain_end:
+                j = i
+                while j + 2 < n and _is_punct(code_tokens[j + 1], ".") and code_tokens[j + 2].kind == NAME:
+                    j += 2
+                if (j - i) // 2 >= 3:
+                    long_chains += 1
+                chain_end = j + 1
+        i += 1
+
+    # Brace pairs nest, so the bodies still open at a body's "{" are its enclosing callbacks.
+    max_callback_depth = 0
+    open_bodies = []
+    for start in sorted(callbacks):  # callbacks in default parameters are found after their function's body
+        while open_bodies and open_bodies[-1] < start:
+            open_bodies.pop()
+        close = braces.closing(start)
+        open_bodies.append(n if close is None else close)
+        max_callback_depth = max(max_callback_depth, len(open_bodies))
+
+    for func_lines in function_details:
         if func_lines > 50:
             smells.append(f"Long Function (>50 lines): {func_lines} lines")
+    lap("functions")
 
     # --- Large File ---
     if num_lines > 300:
         smells.append(f"Large File (>300 lines): {num_lines} lines")
 
     # --- Console Log Overuse ---
-    console_logs = re.findall(r'\bconsole\.log\b', code)
-    if len(console_logs) >= 10:
-        smells.append(f"Console Log Overuse (≥10 logs): {len(console_logs)} logs")
+    if console_logs >= 10:
+        smells.append(f"Console Log Overuse (≥10 logs): {console_logs} logs")
 
     # --- Deep Nesting ---
-    nesting_level = 0
-    max_nesting = 0
-    for line in lines:
-        nesting_level += line.count('{') - line.count('}')
-        max_nesting = max(max_nesting, nesting_level)
+    max_nesting = max((token.depth for token in code_tokens if _is_punct(token, "{")), default=0)
     if max_nesting >= 4:
         smells.append(f"Deep Nesting (>=4 levels): {max_nesting} levels")
+    lap("deep_nesting")
 
     # --- Magic Numbers ---
-    magic_numbers = re.findall(r'[^a-zA-Z](\d+)[^a-zA-Z]', code)
-    magic_numbers = [num for num in magic_numbers if num not in ['0', '1']]
+    magic_numbers = [token.value for token in code_tokens
+                     if token.kind == NUMBER and token.value not in ('0', '1')]
     if magic_numbers:
         smells.append(f"Magic Numbers Found: {len(magic_numbers)} occurrences")
+    lap("magic_numbers")
 
     # --- Duplicate Code Blocks (3+ lines repeated) ---
+    # Lines are compared by their tokens, so indentation and comments don't matter.
+    last_line = max(line_tokens, default=0)
+    normalized = [" ".join(line_tokens.get(number, ())) for number in range(1, last_line + 1)]
     block_counts = defaultdict(int)
-    for i in range(len(lines) - 2):
-        block = tuple(lines[i:i+3])
-        if all(line.strip() for line in block):  # non-empty lines
+    for i in range(len(normalized) - 2):
+        block = tuple(normalized[i:i+3])
+        if all(block):  # lines with code
             block_counts[block] += 1
     duplicate_blocks = [block for block, count in block_counts.items() if count > 1]
     if duplicate_blocks:
         smells.append(f"Duplicate Code Blocks: {len(duplicate_blocks)} blocks repeated")
+    lap("duplicate_code")
 
     # --- Unused Variables ---
-    unused_vars = []
-    for var in var_decls:
-        if len(re.findall(r'\b' + re.escape(var) + r'\b', code)) == 1:
-            unused_vars.append(var)
+    # Same test as the Global Variables check: declared, never referenced again.
+    unused_vars = global_variables
     if unused_vars:
         smells.append(f"Unused Variables: {len(unused_vars)} variables")
 
     # --- Long Chained Calls ---
-    long_chains = re.findall(r'\w+(?:\.\w+){3,}', code)
     if long_chains:
-        smells.append(f"Long Chained Calls Found: {len(long_chains)} chains")
+        smells.append(f"Long Chained Calls Found: {long_chains} chains")
 
     # --- Inconsistent Naming ---
-    snake_case = set(re.findall(r'\b[a-z]+(?:_[a-z]+)+\b', code))
-    camel_case = set(re.findall(r'\b[a-z]+(?:[A-Z][a-zA-Z0-9]*)+\b', code))
+    snake_case = {name for name in identifiers.names() if SNAKE_CASE.fullmatch(name)}
+    camel_case = {name for name in identifiers.names() if CAMEL_CASE.fullmatch(name)}
     if snake_case and camel_case:
         smells.append(f"Inconsistent Naming Found: Mixed camelCase and snake_case ({len(snake_case)} snake, {len(camel_case)} camel)")
+    lap("naming")
 
-    # --- Callback Hell (4+ nested function definitions) ---
-    nested_callback_depth = 0
-    max_callback_depth = 0
-    for line in lines:
-        if re.search(r'function\s*\(', line) and '=>' not in line:
-            nested_callback_depth += 1
-            max_callback_depth = max(max_callback_depth, nested_callback_depth)
-        if '}' in line:
-            nested_callback_depth = max(0, nested_callback_depth - 1)
+    # --- Callback Hell (4+ nested anonymous functions; named functions and arrows don't count) ---
     if max_callback_depth >= 4:
         smells.append(f"Callback Hell Detected: {max_callback_depth} nested functions")
 
     # --- Low Comment Density ---
-    comments = [line for line in lines if line.strip().startswith('//') or '/*' in line or '*/' in line]
-    comment_ratio = len(comments) / num_lines if num_lines else 0
+    comment_lines = set()
+    for token in tokens:
+        if token.kind == COMMENT:
+            comment_lines.update(range(token.line, token.line + token.value.count("\n") + 1))
+    comment_ratio = len(comment_lines) / num_lines if num_lines else 0
     if comment_ratio < 0.02:
-        smells.append(f"Low Comment Density (<2%): {len(comments)} comments")
+        smells.append(f"Low Comment Density (<2%): {len(comment_lines)} comments")
+    lap("comment_density")
 
     # --- Empty Catch Blocks ---
-    empty_catches = re.findall(r'catch\s*\(.*?\)\s*\{\s*\}', code, re.DOTALL)
     if empty_catches:
-        smells.append(f"Empty Catch Blocks Found: {len(empty_catches)} blocks")
+        smells.append(f"Empty Catch Blocks Found: {empty_catches} blocks")
 
     # --- Unnecessary Semicolons ---
-    unnecessary_semis = [line for line in lines if line.strip() == ';']
+    unnecessary_semis = [number for number, values in line_tokens.items() if values == [';']]
     if unnecessary_semis:
         smells.append(f"Unnecessary Semicolons: {len(unnecessary_semis)} found")
+    lap("semicolons")
 
     return list(set(smells)), {
         'total_lines': num_lines,
-        'num_console_logs': len(console_logs),
+        'num_console_logs': console_logs,
         'num_functions': len(function_details),
         'function_lengths': function_details,
         'max_nesting_level': max_nesting,
@@ -0,0 +1,225 @@
+"""Single-pass JavaScript tokenizer used by the JS detectors.
+
+It only knows as much of the grammar as the smells need: identifiers,
+numbers, strings, template literals, regex literals, comments and
+punctuation. That is enough to keep braces, numbers and names that live
+inside strings or comments away from the detectors.
+"""
+import re
+from bisect import bisect_left
+from collections import defaultdict, namedtuple
+
+NAME = "name"
+NUMBER = "number"
+STRING = "string"
+TEMPLATE = "template"
+REGEX = "regex"
+COMMENT = "comment"
+PUNCT = "punct"
+
+# ``line`` is 1-based. ``depth`` is the brace depth the token sits at; a "{"
+# and its "}" share the depth of the block they open (so top-level braces
+# are at 1). Template literal "${ ... }" delimiters do not count as braces.
+Token = namedtuple("Token", "kind value start line depth")
+
+_PUNCTUATORS = sorted([
+    ">>>=", "...", "===", "!==", "**=", "<<=", ">>=", ">>>", "&&=", "||=", "??=",
+    "=>", "==", "!=", "<=", ">=", "&&", "||", "??", "?.", "++", "--", "+=", "-=", "*=",
+    "/=", "%=", "&=", "|=", "^=", "**", "<<", ">>",
+    "{", "}", "(", ")", "[", "]", ";", ",", "<", ">", "+", "-", "*", "/", "%", "&", "|",
+    "^", "!", "~", "?", ":", "=", ".", "@", "#",
+], key=len, reverse=True)
+
+_TOKEN = re.compile("|".join([
+    r"(?P<ws>\s+)",
+    r"(?P<comment>//[^\n]*|/\*[\s\S]*?(?:\*/|\Z))",
+    r"""(?P<string>'(?:[^'\\\n]|\\[\s\S])*'?|"(?:[^"\\\n]|\\[\s\S])*"?)""",
+    r"(?P<number>(?:0[xX][0-9a-fA-F_]+|0[oO][0-7_]+|0[bB][01_]+"
+    r"|(?:\d[\d_]*\.?[\d_]*|\.\d[\d_]*)(?:[eE][+-]?\d[\d_]*)?)n?)",
+    r"(?P<name>(?:[^\W\d]|\$)[\w$]*)",
+    r"(?P<template>`)",
+    r"(?P<punct>" + "|".join(re.escape(p) for p in _PUNCTUATORS) + ")",
+    r"(?P<other>[\s\S])",
+]))
+# A template literal chunk, from its opening "`" (or the "}" closing a
+# substitution) up to the closing "`" or the next "${".
+_TEMPLATE_CHUNK = re.compile(r"[`}](?:[^`\\$]|\\[\s\S]|\$(?!\{))*(?:`|\$\{|\Z)")
+_REGEX = re.compile(r"/(?![*/])(?:[^/\\\[\n]|\\.|\[(?:[^\]\\\n]|\\.)*\])+/[A-Za-z]*")
+
+# After these a "/" starts a regex literal rather than a division.
+_REGEX_AFTER_NAMES = frozenset([
+    "return", "typeof", "instanceof", "in", "of", "new", "delete", "void",
+    "throw", "case", "do", "else", "yield", "await",
+])
+_DIVISION_AFTER_PUNCT = frozenset([")", "]", "}", "++", "--"])
+DECLARATION_KEYWORDS = frozenset(["var", "let", "const"])
+
+
+def _regex_allowed(previous):
+    if previous is None:
+        return True
+    if previous.kind == NAME:
+        return previous.value in _REGEX_AFTER_NAMES
+    if previous.kind == PUNCT:
+        return previous.value not in _DIVISION_AFTER_PUNCT
+    return False
+
+
+def tokenize(code):
+    """Return the list of tokens of ``code``, comments included, whitespace dropped.
+
+    Never raises: unterminated strings, comments and templates end at the end
+    of their line/the file and unknown characters become PUNCT tokens.
+    """
+    tokens = []
+    append = tokens.append
+    pos = 0
+    line = 1
+    depth = 0
+    previous = None       # last non-comment token, to tell regexes from divisions
+    templates = []        # open "{" count inside each pending "${" substitution
+    end = len(code)
+
+    if code.startswith("#!"):
+        pos = code.find("\n")
+        pos = end if pos == -1 else pos
+        append(Token(COMMENT, code[:pos], 0, 1, 0))
+
+    while pos < end:
+        match = _TOKEN.match(code, pos)
+        kind = match.lastgroup
+        value = match.group()
+
+        if kind == "ws":
+            line += value.count("\n")
+            pos = match.end()
+            continue
+
+        if kind == "template" or (kind == "punct" and value == "}" and templates and templates[-1] == 0):
+            if kind == "punct":
+                templates.pop()
+                kind = TEMPLATE
+            value = _TEMPLATE_CHUNK.match(code, pos).group()
+            if value.endswith("${"):
+                templates.append(0)
+            token = Token(TEMPLATE, value, pos, line, depth)
+        elif kind == "punct":
+            if value == "/" or value == "/=":
+                regex = _REGEX.match(code, pos) if _regex_allowed(previous) else None
+                if regex:
+                    value = regex.group()
+                    kind = REGEX
+            if value == "{":
+                depth += 1
+                if templates:
+                    templates[-1] += 1
+                token = Token(PUNCT, value, pos, line, depth)
+            elif value == "}":
+                token = Token(PUNCT, value, pos, line, depth)
+                depth = max(0, depth - 1)
+                if templates:
+                    templates[-1] -= 1
+            else:
+                token = Token(kind, value, pos, line, depth)
+        elif kind == "other":
+            token = Token(PUNCT, value, pos, line, depth)
+        else:
+            token = Token(kind, value, pos, line, depth)
+
+        append(token)
+        if kind != COMMENT:
+            previous = token
+        if kind in (COMMENT, STRING, TEMPLATE, "other"):
+            line += value.count("\n")
+        pos += len(value)
+    return tokens
+
+
+class BraceIndex:
+    """Matching "{"/"}" pairs of a token stream, found in one linear pass.
+
+    Braces inside strings, templates, regexes and comments are never tokens,
+    so they can't unbalance the pairs. Unclosed "{" and stray "}" tokens are
+    left unmatched.
+    """
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pairs = {}         # token index of "{" -> token index of its "}"
+        self._opens = []        # token indices of all "{", in source order
+        stack = []
+        for i, token in enumerate(tokens):
+            if token.kind != PUNCT:
+                continue
+            if token.value == "{":
+                self._opens.append(i)
+                stack.append(i)
+            elif token.value == "}" and stack:
+                self.pairs[stack.pop()] = i
+        self._open_offsets = [tokens[i].start for i in self._opens]
+
+    @classmethod
+    def from_code(cls, code):
+        return cls(tokenize(code))
+
+    def closing(self, index):
+        """Token index of the "}" closing the "{" at token ``index``, or None."""
+        return self.pairs.get(index)
+
+    def matching_brace(self, offset):
+        """Offset of the "}" closing the first "{" at or after character ``offset``, or -1."""
+        k = bisect_left(self._open_offsets, offset)
+        if k == len(self._opens):
+            return -1
+        close = self.pairs.get(self._opens[k])
+        return -1 if close is None else self.tokens[close].start
+
+
+class IdentifierIndex:
+    """Where every identifier occurs in a token stream, built in one linear pass.
+
+    Only NAME tokens are indexed, so names in strings and comments don't
+    count as uses. ``declarations`` lists, in source order, the names that
+    directly follow ``var``/``let``/``const``.
+    """
+
+    def __init__(self, tokens):
+        self.positions = defaultdict(list)     # name -> character offsets, ascending
+        self.declarations = []
+        declaring = False
+        for token in tokens:
+            if token.kind == COMMENT:
+                continue
+            if token.kind == NAME:
+                self.positions[token.value].append(token.start)
+                if declaring:
+                    self.declarations.append(token.value)
+                declaring = token.value in DECLARATION_KEYWORDS
+            else:
+                declaring = False
+
+    @classmethod
+    def from_code(cls, code):
+        return cls(tokenize(code))
+
+    def count(self, name):
+        return len(self.positions.get(name, ()))
+
+    def names(self):
+        return self.positions.keys()
+
+    def unused_declarations(self):
+        """Declared names that never occur again, once per declaration (like the regex checks did)."""
+        return [name for name in self.declarations if len(self.positions[name]) == 1]
+
+    def substitute(self, code, replacements):
+        """Return ``code`` with every occurrence of the names in ``replacements`` (name -> text) replaced in one pass."""
+        edits = sorted((start, name) for name in replacements for start in self.positions.get(name, ()))
+        parts = []
+        last = 0
+        for start, name in edits:
+            parts.append(code[last:start])
+            parts.append(replacements[name])
+            last = start + len(name)
+        parts.append(code[last:])
+        return "".join(parts)
@@ -0,0 +1,250 @@
+"""Near-duplicate Python functions across a repository.
+
+Function bodies are normalized before comparing them: names bound inside the
+function (parameters, locals, loop and exception variables) become
+positional placeholders and literals are reduced to their type, while free
+names such as builtins, globals and attribute names are kept. Renaming a
+variable or changing a constant therefore doesn't hide a copy.
+
+* ``structural_hash`` is a short digest of the normalized body; equal hashes
+  are identical functions up to renaming.
+* Near-duplicates are found with MinHash over k-shingles of the normalized
+  node sequence and LSH banding, so only functions sharing a band are ever
+  compared instead of all pairs.
+"""
+import ast
+import hashlib
+import os
+import zlib
+from collections import defaultdict
+from itertools import combinations
+
+from detector.cache import AnalysisCache
+from detector.clones import map_cached
+
+NEAR_DUPLICATE_DETECTION = os.getenv("NEAR_DUPLICATE_DETECTION", "1") != "0"
+# Estimated Jaccard similarity of the shingle sets above which two functions are reported.
+SIMILARITY_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.8"))
+# Functions whose normalized body has fewer labels (about 2.5 per AST node)
+# are too small to be worth reporting.
+MIN_FUNCTION_LABELS = int(os.getenv("NEAR_DUPLICATE_MIN_SIZE", "40"))
+MAX_NEAR_DUPLICATE_PAIRS = int(os.getenv("NEAR_DUPLICATE_MAX_PAIRS", "1000"))
+SHINGLE_SIZE = 5
+# 16 bands of 4 rows: pairs at 0.8 similarity become candidates with ~99.98%
+# probability, pairs at 0.3 with ~12%.
+BANDS = 16
+ROWS = 4
+SIGNATURE_SIZE = BANDS * ROWS
+# LSH buckets bigger than this hold boilerplate (getters, stubs) and are skipped.
+MAX_BUCKET_SIZE = 50
+# Bump when normalization or signatures change: signatures are cached on it.
+SIGNATURES_VERSION = f"1:{SHINGLE_SIZE}:{SIGNATURE_SIZE}"
+
+_MASK64 = (1 << 64) - 1
+_BIN_BITS = 6  # log2(SIGNATURE_SIZE)
+_VALUE_MASK = (1 << (64 - _BIN_BITS)) - 1
+_BASE = 1000003
+_TOP = pow(_BASE, SHINGLE_SIZE, 1 << 64)  # weight of the label leaving the shingle window
+
+
+def _bound_names(function):
+    """Names a function binds itself, in first-binding order, parameters first."""
+    names = {}
+    args = function.args
+    for arg in args.posonlyargs + args.args + [args.vararg] + args.kwonlyargs + [args.kwarg]:
+        if arg is not None:
+            names.setdefault(arg.arg, len(names))
+    for node in ast.walk(function):
+        if node is function:
+            continue
+        if isinstance(node, ast.Name) and not isinstance(node.ctx, ast.Load):
+            names.setdefault(node.id, len(names))
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.setdefault(node.name, len(names))
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            names.setdefault(node.name, len(names))
+        elif isinstance(node, ast.alias):
+            names.setdefault((node.asname or node.name).split(".")[0], len(names))
+        elif isinstance(node, ast.arg):
+            names.setdefault(node.arg, len(names))
+    return names
+
+
+def _label(node, names):
+    if isinstance(node, ast.Name):
+        return f"Name:v{names[node.id]}" if node.id in names else f"Name:{node.id}"
+    if isinstance(node, ast.arg):
+        return f"arg:v{names[node.arg]}" if node.arg in names else "arg"
+    if isinstance(node, ast.Constant):
+        return f"Constant:{type(node.value).__name__}"
+    if isinstance(node, ast.Attribute):
+        return f"Attribute:{node.attr}"
+    if isinstance(node, ast.keyword):
+        return f"keyword:{node.arg}"
+    return type(node).__name__
+
+
+def normalized_labels(function):
+    """Pre-order labels of the function body with field and end-of-node markers, so the shape is unambiguous."""
+    names = _bound_names(function)
+    labels = []
+    stack = list(reversed(function.body))
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            labels.append(item)
+            continue
+        labels.append(_label(item, names))
+        stack.append(")")
+        children = []
+        for field, value in ast.iter_fields(item):
+            if isinstance(value, list):
+                nodes = [v for v in value if isinstance(v, ast.AST)]
+                if nodes:
+                    children.append(f"[{field}")
+                    children.extend(nodes)
+            elif isinstance(value, ast.AST) and not isinstance(value, ast.expr_context):
+                children.append(value)
+        stack.extend(reversed(children))
+    return labels
+
+
+def structural_hash(function):
+    """Fixed-size digest of the normalized body: equal for functions identical up to renaming and literals."""
+    return hashlib.blake2b("\x00".join(normalized_labels(function)).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _mix(x):
+    # splitmix64 finalizer: spreads polynomial shingle hashes over all 64 bits.
+    x = (x ^ (x >> 30)) * 0xBF58476D1CE4E5B9 & _MASK64
+    x = (x ^ (x >> 27)) * 0x94D049BB133111EB & _MASK64
+    return x ^ (x >> 31)
+
+
+def minhash(labels):
+    """One-permutation MinHash signature of the label k-shingles, densified by rotation.
+
+    Each shingle is hashed once; its top bits pick one of SIGNATURE_SIZE bins
+    and the bin keeps the minimum of the remaining bits. Empty bins borrow
+    the next non-empty bin's value, so equal signature positions still
+    estimate Jaccard similarity.
+    """
+    label_ids = {}
+    ids = [label_ids.setdefault(label, zlib.crc32(label.encode("utf-8"))) for label in labels]
+    bins = [None] * SIGNATURE_SIZE
+    shingle_hashes = []
+    rolling = 0
+    for i, value in enumerate(ids):
+        rolling = (rolling * _BASE + value) & _MASK64
+        if i >= SHINGLE_SIZE:
+            rolling = (rolling - ids[i - SHINGLE_SIZE] * _TOP) & _MASK64
+        if i >= SHINGLE_SIZE - 1:
+            shingle_hashes.append(rolling)
+    if not shingle_hashes:
+        shingle_hashes.append(rolling)
+    for h in shingle_hashes:
+        h = _mix(h)
+        b = h >> (64 - _BIN_BITS)
+        value = h & _VALUE_MASK
+        if bins[b] is None or value < bins[b]:
+            bins[b] = value
+    for b in range(SIGNATURE_SIZE):
+        if bins[b] is None:
+            for distance in range(1, SIGNATURE_SIZE):
+                donor = bins[(b + distance) % SIGNATURE_SIZE]
+                if donor is not None:
+                    bins[b] = (donor + distance * 0x9E3779B97F4A7C15) & _MASK64
+                    break
+    return bins
+
+
+def function_signatures(job):
+    """``[name, first line, last line, structural hash, signature hex]`` for every large enough function of a Python file."""
+    language, code = job
+    if language != "python":
+        return []
+    try:
+        tree = ast.parse(code)
+    except (SyntaxError, ValueError):
+        return []
+    functions = []
+    for node in ast.walk(tree):
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            continue
+        labels = normalized_labels(node)
+        if len(labels) < MIN_FUNCTION_LABELS:
+            continue
+        digest = hashlib.blake2b("\x00".join(labels).encode("utf-8"), digest_size=16).hexdigest()
+        signature = b"".join(value.to_bytes(8, "little") for value in minhash(labels)).hex()
+        functions.append([node.name, node.lineno, node.end_lineno, digest, signature])
+    return functions
+
+
+def _similarity(a, b):
+    """Share of equal signature positions, the MinHash estimate of Jaccard similarity."""
+    return sum(1 for k in range(0, SIGNATURE_SIZE * 8, 8) if a[k:k + 8] == b[k:k + 8]) / SIGNATURE_SIZE
+
+
+def find_near_duplicates(files, workers=1, cache=None):
+    """Find near-duplicate functions in ``files``, a list of ``(path, language, code)``.
+
+    Returns up to MAX_NEAR_DUPLICATE_PAIRS pairs, most similar first, as
+    ``{"a": {"path", "function", "start_line", "end_line"}, "b": {...}, "similarity": s}``.
+    Functions identical up to renaming have similarity 1.0.
+    """
+    cache = AnalysisCache() if cache is None else cache
+    functions = []      # (path, name, first line, last line)
+    signatures = []     # 8-byte signature rows, as bytes
+    by_hash = defaultdict(list)
+    for i, found in map_cached(function_signatures, "functions", SIGNATURES_VERSION, files, workers, cache):
+        path = files[i][0]
+        for name, first, last, digest, signature in found:
+            by_hash[digest].append(len(functions))
+            functions.append((path, name, first, last))
+            signatures.append(bytes.fromhex(signature))
+
+    pairs = {}
+    # Identical up to renaming: only the first function of a group takes part in LSH.
+    representatives = []
+    for group in by_hash.values():
+        representatives.append(group[0])
+        for a, b in combinations(group[:MAX_BUCKET_SIZE], 2):
+            pairs[(a, b)] = 1.0
+
+    row_bytes = ROWS * 8
+    for band in range(BANDS):
+        buckets = defaultdict(list)
+        for f in representatives:
+            buckets[signatures[f][band * row_bytes:(band + 1) * row_bytes]].append(f)
+        for members in buckets.values():
+            if len(members) < 2 or len(members) > MAX_BUCKET_SIZE:
+                continue
+            for a, b in combinations(members, 2):
+                if (a, b) in pairs:
+                    continue
+                similarity = _similarity(signatures[a], signatures[b])
+                if similarity >= SIMILARITY_THRESHOLD:
+                    pairs[(a, b)] = similarity
+
+    result = []
+    for (a, b), similarity in pairs.items():
+        if _nested(functions[a], functions[b]):
+            continue
+        result.append({
+            "a": _function_ref(functions[a]),
+            "b": _function_ref(functions[b]),
+            "similarity": round(similarity, 3)
+        })
+    result.sort(key=lambda pair: (-pair["similarity"], pair["a"]["path"], pair["a"]["start_line"],
+                                  pair["b"]["path"], pair["b"]["start_line"]))
+    return result[:MAX_NEAR_DUPLICATE_PAIRS]
+
+
+def _nested(a, b):
+    # A function and a function defined inside it aren't duplicates of each other.
+    return a[0] == b[0] and (a[2] <= b[2] <= a[3] or b[2] <= a[2] <= b[3])
+
+
+def _function_ref(function):
+    path, name, first, last = function
+    return {"path": path, "function": name, "start_line": first, "end_line": last}
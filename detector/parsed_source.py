@@ -0,0 +1,101 @@
+"""A Python file parsed once and shared by every check that needs it.
+
+radon's string entry points (``cc_visit``, ``h_visit``, ``mi_visit``) each
+parse the source again, and ``mi_visit`` also re-runs Halstead, complexity
+and the raw line counts. ``ParsedSource`` parses the file once and feeds the
+same tree to radon's AST entry points; every result is computed on first use
+and kept for the rest of the analysis.
+"""
+import ast
+from bisect import bisect_right
+
+from radon.metrics import h_visit_ast, mi_compute
+from radon.raw import analyze
+from radon.visitors import ComplexityVisitor
+
+from detector.py_visitor import compute_function_stats
+
+
+class ParsedSource:
+    """Lazily derived views of one Python source file.
+
+    ``tree`` raises SyntaxError like ``ast.parse`` for code that doesn't parse.
+    """
+
+    def __init__(self, code):
+        self.code = code
+        self._tree = None
+        self._complexity = None
+        self._halstead = None
+        self._raw = None
+        self._function_stats = None
+        self._line_offsets = None
+
+    @property
+    def tree(self):
+        if self._tree is None:
+            self._tree = ast.parse(self.code)
+        return self._tree
+
+    @property
+    def complexity(self):
+        """radon's ComplexityVisitor over the tree: ``blocks`` and ``total_complexity``."""
+        if self._complexity is None:
+            self._complexity = ComplexityVisitor.from_ast(self.tree)
+        return self._complexity
+
+    @property
+    def halstead(self):
+        """radon Halstead report (``total`` and per-function ``functions``)."""
+        if self._halstead is None:
+            self._halstead = h_visit_ast(self.tree)
+        return self._halstead
+
+    @property
+    def raw(self):
+        """radon raw metrics (loc, lloc, sloc, comments, multi, blank, ...)."""
+        if self._raw is None:
+            self._raw = analyze(self.code)
+        return self._raw
+
+    def maintainability_index(self, count_multi=True):
+        """Same value as ``radon.metrics.mi_visit(code, count_multi)``, from the shared results."""
+        raw = self.raw
+        comment_lines = raw.comments + (raw.multi if count_multi else 0)
+        comments = comment_lines / float(raw.sloc) * 100 if raw.sloc != 0 else 0
+        return mi_compute(self.halstead.total.volume, self.complexity.total_complexity, raw.lloc, comments)
+
+    @property
+    def function_stats(self):
+        """FunctionStats of every FunctionDef, see detector.py_visitor.compute_function_stats."""
+        if self._function_stats is None:
+            self._function_stats = compute_function_stats(self.tree)
+        return self._function_stats
+
+    @property
+    def line_offsets(self):
+        """Character offset at which each line starts; ``line_offsets[0]`` is line 1."""
+        if self._line_offsets is None:
+            offsets = [0]
+            position = self.code.find("\n")
+            while position != -1:
+                offsets.append(position + 1)
+                position = self.code.find("\n", position + 1)
+            self._line_offsets = offsets
+        return self._line_offsets
+
+    def offset(self, line, column=0):
+        """Character offset of a 1-based ``line`` and 0-based ``column``, as found on AST nodes.
+
+        AST columns count UTF-8 bytes; this converts them to characters.
+        """
+        start = self.line_offsets[line - 1]
+        if column:
+            end = self.code.find("\n", start)
+            text = self.code[start:] if end == -1 else self.code[start:end]
+            column = len(text.encode("utf-8")[:column].decode("utf-8", errors="ignore"))
+        return start + column
+
+    def line_of(self, offset):
+        """1-based line of a character offset."""
+        return bisect_right(self.line_offsets, offset)
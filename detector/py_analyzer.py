@@ -1,140 +1,321 @@
 import ast
-from radon.complexity import cc_visit
-from radon.metrics import h_visit, mi_visit
-from radon.raw import analyze
-from collections import defaultdict
+import hashlib
+from collections import Counter, defaultdict
+from detector.parsed_source import ParsedSource
+from detector.py_visitor import Detector, DetectorEngine
 
-def analyze_py_code(file_path):
-    smells = []
-    metrics = {}
+# Bump whenever smells, metrics or thresholds change: cached results are keyed on it.
+ANALYZER_VERSION = "3"
 
-    with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-        code = f.read()
 
-    complexity_results = cc_visit(code)
-    high_complexity = [(func.name, func.complexity) for func in complexity_results if func.complexity > 10]
-    if high_complexity:
-        smells.append(f"High Complexity Functions (>10): {len(high_complexity)} - {[f'{n}({c})' for n, c in high_complexity]}")
-
-    halstead_metrics = h_visit(code)
-    maintainability_index = mi_visit(code, halstead_metrics)
-    if maintainability_index < 20:
-        smells.append(f"Low Maintainability Index (<20): {maintainability_index:.2f}")
-
-    raw_metrics = analyze(code)
-    metrics["total_lines"] = raw_metrics.loc
-    if raw_metrics.loc > 500:
-        smells.append(f"Large File (>500 lines): {raw_metrics.loc} lines")
-
-    tree = ast.parse(code)
-
-    def get_nesting_depth(node, depth=0):
-        if isinstance(node, (ast.If, ast.For, ast.While, ast.With, ast.FunctionDef)):
-            depth += 1
-        max_depth = depth
-        for child in ast.iter_child_nodes(node):
-            max_depth = max(max_depth, get_nesting_depth(child, depth))
-        return max_depth
-
-    deeply_nested = [(node.name, get_nesting_depth(node)) for node in ast.walk(tree)
-                     if isinstance(node, ast.FunctionDef) and get_nesting_depth(node) > 3]
-    if deeply_nested:
-        smells.append(f"Deeply Nested Functions (>3): {len(deeply_nested)} - {[f'{n}({d})' for n, d in deeply_nested]}")
-
-    large_funcs = [(node.name, len(node.body)) for node in ast.walk(tree)
-                   if isinstance(node, ast.FunctionDef) and len(node.body) > 100]
-    if large_funcs:
-        smells.append(f"Large Functions (>100 lines): {len(large_funcs)} - {[f'{n}({l})' for n, l in large_funcs]}")
-
-    feature_envy = []
-    for node in ast.walk(tree):
-        if isinstance(node, ast.FunctionDef):
-            calls = [n for n in ast.walk(node) if isinstance(n, ast.Attribute)]
-            external = [n for n in calls if isinstance(n.value, ast.Name)]
-            if len(external) > 5:
-                feature_envy.append((node.name, len(external)))
-    if feature_envy:
-        smells.append(f"Feature Envy (>5 external calls): {len(feature_envy)} - {[f'{n}({c})' for n, c in feature_envy]}")
-
-    function_params = []
-    for node in ast.walk(tree):
-        if isinstance(node, ast.FunctionDef):
-            params = tuple(arg.arg for arg in node.args.args)
-            function_params.append(params)
-    repeated_params = {p for p in function_params if function_params.count(p) > 1}
-    if repeated_params:
-        smells.append(f"Data Clumps (Repeated params): {len(repeated_params)} sets - {list(map(list, repeated_params))}")
-
-    assigned_vars = set()
-    used_vars = set()
-    for node in ast.walk(tree):
+# radon-based checks: they only read the shared ParsedSource, no nodes.
+class HighComplexityFunctions(Detector):
+    def report(self, smells, metrics):
+        high_complexity = [(func.name, func.complexity) for func in self.engine.source.complexity.blocks
+                           if func.complexity > 10]
+        if high_complexity:
+            smells.append(f"High Complexity Functions (>10): {len(high_complexity)} - {[f'{n}({c})' for n, c in high_complexity]}")
+
+
+class LowMaintainabilityIndex(Detector):
+    def report(self, smells, metrics):
+        maintainability_index = self.engine.source.maintainability_index(count_multi=True)
+        if maintainability_index < 20:
+            smells.append(f"Low Maintainability Index (<20): {maintainability_index:.2f}")
+
+
+class LargeFile(Detector):
+    def report(self, smells, metrics):
+        loc = self.engine.source.raw.loc
+        metrics["total_lines"] = loc
+        if loc > 500:
+            smells.append(f"Large File (>500 lines): {loc} lines")
+
+
+class DeeplyNestedFunctions(Detector):
+    node_types = (ast.FunctionDef,)
+
+    def __init__(self):
+        self.found = []
+
+    def visit(self, node):
+        depth = self.engine.function_stats(node).max_depth
+        if depth > 3:
+            self.found.append((node.name, depth))
+
+    def report(self, smells, metrics):
+        if self.found:
+            smells.append(f"Deeply Nested Functions (>3): {len(self.found)} - {[f'{n}({d})' for n, d in self.found]}")
+
+
+class LargeFunctions(Detector):
+    node_types = (ast.FunctionDef,)
+
+    def __init__(self):
+        self.found = []
+
+    def visit(self, node):
+        body_length = self.engine.function_stats(node).body_length
+        if body_length > 100:
+            self.found.append((node.name, body_length))
+
+    def report(self, smells, metrics):
+        if self.found:
+            smells.append(f"Large Functions (>100 lines): {len(self.found)} - {[f'{n}({l})' for n, l in self.found]}")
+
+
+class FeatureEnvy(Detector):
+    node_types = (ast.FunctionDef,)
+
+    def __init__(self):
+        self.found = []
+
+    def visit(self, node):
+        external = self.engine.function_stats(node).external_attrs
+        if external > 5:
+            self.found.append((node.name, external))
+
+    def report(self, smells, metrics):
+        if self.found:
+            smells.append(f"Feature Envy (>5 external calls): {len(self.found)} - {[f'{n}({c})' for n, c in self.found]}")
+
+
+class DataClumps(Detector):
+    node_types = (ast.FunctionDef,)
+
+    def __init__(self):
+        self.function_params = []
+
+    def visit(self, node):
+        self.function_params.append(tuple(arg.arg for arg in node.args.args))
+
+    def report(self, smells, metrics):
+        counts = Counter(self.function_params)
+        repeated_params = {p for p in self.function_params if counts[p] > 1}
+        if repeated_params:
+            smells.append(f"Data Clumps (Repeated params): {len(repeated_params)} sets - {list(map(list, repeated_params))}")
+
+
+class DeadCodeVariables(Detector):
+    node_types = (ast.Assign, ast.Name)
+
+    def __init__(self):
+        self.assigned_vars = set()
+        self.used_vars = set()
+
+    def visit(self, node):
+        if isinstance(node, ast.Assign):
+            for target in node.targets:
+                if isinstance(target, ast.Name):
+                    self.assigned_vars.add(target.id)
+        else:
+            self.used_vars.add(node.id)
+
+    def report(self, smells, metrics):
+        dead_vars = self.assigned_vars - self.used_vars
+        if dead_vars:
+            smells.append(f"Dead Code Variables (Unused): {len(dead_vars)} - {list(dead_vars)}")
+
+
+class ShotgunSurgery(Detector):
+    node_types = (ast.Call,)
+
+    def __init__(self):
+        self.function_calls = defaultdict(int)
+
+    def visit(self, node):
+        if isinstance(node.func, ast.Name):
+            self.function_calls[node.func.id] += 1
+
+    def report(self, smells, metrics):
+        frequent_calls = [(name, count) for name, count in self.function_calls.items() if count > 10]
+        if frequent_calls:
+            smells.append(f"Shotgun Surgery (Function called >10 times): {len(frequent_calls)} - {frequent_calls}")
+
+
+class LongLambdas(Detector):
+    node_types = (ast.Lambda,)
+
+    def __init__(self):
+        self.found = []
+
+    def visit(self, node):
+        if isinstance(node.body, (ast.List, ast.Tuple)) and len(node.body.elts) > 3:
+            self.found.append(node.lineno)
+
+    def report(self, smells, metrics):
+        if self.found:
+            smells.append(f"Long Lambdas (>3 elements): {len(self.found)} - lines {self.found}")
+
+
+class UselessExceptions(Detector):
+    node_types = (ast.Try,)
+
+    def __init__(self):
+        self.found = []
+
+    def visit(self, node):
+        if any(isinstance(handler.body[0], ast.Pass) if handler.body else True for handler in node.handlers):
+            self.found.append(node.lineno)
+
+    def report(self, smells, metrics):
+        if self.found:
+            smells.append(f"Useless Exceptions (Try-Pass): {len(self.found)} - lines {self.found}")
+
+
+class DuplicateCode(Detector):
+    node_types = (ast.FunctionDef,)
+
+    def __init__(self):
+        self.function_bodies = defaultdict(list)
+
+    def visit(self, node):
+        # Exact bodies only: copies with renamed locals or changed literals are near_duplicates' job.
+        # Keyed by a digest so large dumps are not kept around for the whole file.
+        body_str = "".join(ast.dump(stmt) for stmt in node.body)
+        self.function_bodies[hashlib.blake2b(body_str.encode(), digest_size=16).digest()].append(node.name)
+
+    def report(self, smells, metrics):
+        duplicates = [funcs for funcs in self.function_bodies.values() if len(funcs) > 1]
+        if duplicates:
+            smells.append(f"Duplicate Code (Identical functions): {len(duplicates)} sets - {duplicates}")
+
+
+class LargeClasses(Detector):
+    node_types = (ast.ClassDef,)
+
+    def __init__(self):
+        self.found = []
+
+    def visit(self, node):
+        methods = sum(isinstance(n, ast.FunctionDef) for n in node.body)
+        if methods > 10:
+            self.found.append((node.name, methods))
+
+    def report(self, smells, metrics):
+        if self.found:
+            smells.append(f"Large Classes (>10 methods): {len(self.found)} - {[f'{n}({m})' for n, m in self.found]}")
+
+
+class TooManyReturns(Detector):
+    node_types = (ast.FunctionDef,)
+
+    def __init__(self):
+        self.found = []
+
+    def visit(self, node):
+        returns = self.engine.function_stats(node).returns
+        if returns > 3:
+            self.found.append((node.name, returns))
+
+    def report(self, smells, metrics):
+        if self.found:
+            smells.append(f"Too Many Returns (>3): {len(self.found)} - {[f'{n}({c})' for n, c in self.found]}")
+
+
+class GlobalVariables(Detector):
+    node_types = (ast.Assign, ast.Name)
+
+    def __init__(self):
+        self.assigned_vars = set()
+        self.loaded_names = {}
+
+    def visit(self, node):
         if isinstance(node, ast.Assign):
             for target in node.targets:
                 if isinstance(target, ast.Name):
-                    assigned_vars.add(target.id)
-        elif isinstance(node, ast.Name):
-            used_vars.add(node.id)
-    dead_vars = assigned_vars - used_vars
-    if dead_vars:
-        smells.append(f"Dead Code Variables (Unused): {len(dead_vars)} - {list(dead_vars)}")
-
-    function_calls = defaultdict(int)
-    for node in ast.walk(tree):
-        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name):
-            function_calls[node.func.id] += 1
-    frequent_calls = [(name, count) for name, count in function_calls.items() if count > 10]
-    if frequent_calls:
-        smells.append(f"Shotgun Surgery (Function called >10 times): {len(frequent_calls)} - {frequent_calls}")
-
-    long_lambdas = [node.lineno for node in ast.walk(tree)
-                    if isinstance(node, ast.Lambda) and isinstance(node.body, (ast.List, ast.Tuple)) and len(node.body.elts) > 3]
-    if long_lambdas:
-        smells.append(f"Long Lambdas (>3 elements): {len(long_lambdas)} - lines {long_lambdas}")
-
-    useless_exceptions = [node.lineno for node in ast.walk(tree)
-                          if isinstance(node, ast.Try) and any(
-                              isinstance(handler.body[0], ast.Pass) if handler.body else True for handler in node.handlers)]
-    if useless_exceptions:
-        smells.append(f"Useless Exceptions (Try-Pass): {len(useless_exceptions)} - lines {useless_exceptions}")
-
-    function_bodies = defaultdict(list)
-    for node in ast.walk(tree):
+                    self.assigned_vars.add(target.id)
+        elif isinstance(node.ctx, ast.Load):
+            self.loaded_names.setdefault(node.id, None)
+
+    def report(self, smells, metrics):
+        # Assignments anywhere in the module count, so filtering has to wait
+        # until the whole tree has been seen.
+        global_vars = set(name for name in self.loaded_names if name not in self.assigned_vars)
+        if global_vars:
+            smells.append(f"Global Variables (Not in function/class): {len(global_vars)} - {list(global_vars)}")
+
+
+class TooManyParameters(Detector):
+    node_types = (ast.FunctionDef,)
+
+    def __init__(self):
+        self.found = []
+
+    def visit(self, node):
+        if len(node.args.args) > 5:
+            self.found.append((node.name, len(node.args.args)))
+
+    def report(self, smells, metrics):
+        if self.found:
+            smells.append(f"Too Many Parameters (>5): {len(self.found)} - {[f'{n}({c})' for n, c in self.found]}")
+
+
+# Extra Metrics
+class FunctionMetrics(Detector):
+    node_types = (ast.FunctionDef, ast.Call)
+
+    def __init__(self):
+        self.function_lengths = []
+        self.num_prints = 0
+
+    def visit(self, node):
         if isinstance(node, ast.FunctionDef):
-            body_str = "".join(ast.dump(stmt) for stmt in node.body)
-            function_bodies[body_str].append(node.name)
-    duplicates = [funcs for funcs in function_bodies.values() if len(funcs) > 1]
-    if duplicates:
-        smells.append(f"Duplicate Code (Identical functions): {len(duplicates)} sets - {duplicates}")
-
-    large_classes = [(node.name, sum(isinstance(n, ast.FunctionDef) for n in node.body))
-                     for node in ast.walk(tree) if isinstance(node, ast.ClassDef)
-                     and sum(isinstance(n, ast.FunctionDef) for n in node.body) > 10]
-    if large_classes:
-        smells.append(f"Large Classes (>10 methods): {len(large_classes)} - {[f'{n}({m})' for n, m in large_classes]}")
-
-    def count_return_statements(node):
-        return sum(1 for n in ast.walk(node) if isinstance(n, ast.Return))
-
-    many_returns = [(node.name, count_return_statements(node)) for node in ast.walk(tree)
-                    if isinstance(node, ast.FunctionDef) and count_return_statements(node) > 3]
-    if many_returns:
-        smells.append(f"Too Many Returns (>3): {len(many_returns)} - {[f'{n}({c})' for n, c in many_returns]}")
-
-    global_vars = [node.id for node in ast.walk(tree)
-                   if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load) and node.id not in assigned_vars]
-    if global_vars:
-        smells.append(f"Global Variables (Not in function/class): {len(set(global_vars))} - {list(set(global_vars))}")
-
-    too_many_args = [(node.name, len(node.args.args)) for node in ast.walk(tree)
-                     if isinstance(node, ast.FunctionDef) and len(node.args.args) > 5]
-    if too_many_args:
-        smells.append(f"Too Many Parameters (>5): {len(too_many_args)} - {[f'{n}({c})' for n, c in too_many_args]}")
-
-    # Extra Metrics
-    metrics["num_functions"] = sum(1 for node in ast.walk(tree) if isinstance(node, ast.FunctionDef))
-    metrics["function_lengths"] = [len(node.body) for node in ast.walk(tree) if isinstance(node, ast.FunctionDef)]
-    metrics["num_prints"] = sum(1 for node in ast.walk(tree)
-                                if isinstance(node, ast.Call) and getattr(node.func, 'id', '') == 'print')
+            self.function_lengths.append(len(node.body))
+        elif getattr(node.func, 'id', '') == 'print':
+            self.num_prints += 1
+
+    def report(self, smells, metrics):
+        metrics["num_functions"] = len(self.function_lengths)
+        metrics["function_lengths"] = self.function_lengths
+        metrics["num_prints"] = self.num_prints
+
+
+# Detectors run by analyze_py_code, in the order their smells are reported.
+# Each one gets the nodes it asks for from a single shared walk of the tree.
+PY_DETECTORS = [
+    HighComplexityFunctions,
+    LowMaintainabilityIndex,
+    LargeFile,
+    DeeplyNestedFunctions,
+    LargeFunctions,
+    FeatureEnvy,
+    DataClumps,
+    DeadCodeVariables,
+    ShotgunSurgery,
+    LongLambdas,
+    UselessExceptions,
+    DuplicateCode,
+    LargeClasses,
+    TooManyReturns,
+    GlobalVariables,
+    TooManyParameters,
+    FunctionMetrics,
+]
+
+
+def analyze_py_code(file_path):
+    with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+        code = f.read()
+    return analyze_py_source(code)
+
+
+def analyze_py_source(code, timings=None):
+    """Smells and metrics of one Python source; ``timings`` (detector.timing.Timings) gets per-detector seconds."""
+    smells = []
+    metrics = {}
+
+    # Parsed once; radon and the AST detectors all share the same tree.
+    source = ParsedSource(code)
+    if timings is not None:
+        # Built up front so the first detector to use them isn't charged for them.
+        with timings.stage("parse"):
+            source.tree
+        with timings.stage("function_stats"):
+            source.function_stats
+    engine = DetectorEngine((detector() for detector in PY_DETECTORS), timings)
+    engine.run(source)
+    engine.report(smells, metrics)
 
     return smells, metrics
 
@@ -0,0 +1,128 @@
+import ast
+import time
+from collections import namedtuple
+
+NESTING_NODES = (ast.If, ast.For, ast.While, ast.With, ast.FunctionDef)
+
+# Per-function aggregates over the function's whole subtree (itself included):
+# max_depth counts NESTING_NODES along the deepest path, returns counts
+# ast.Return nodes and external_attrs counts ``name.attr`` accesses.
+FunctionStats = namedtuple("FunctionStats", ["max_depth", "returns", "external_attrs", "body_length"])
+
+
+def compute_function_stats(tree):
+    """Compute FunctionStats for every FunctionDef in one post-order pass.
+
+    Each node's depth and counts are folded into its parent when it is left,
+    so the cost is linear in the size of the tree however deeply functions are
+    nested. Iterative, so deep trees don't hit the recursion limit.
+    """
+    stats = {}
+    # frame: [node, children, deepest child, returns, external attributes]
+    stack = [[tree, ast.iter_child_nodes(tree), 0, 0, 0]]
+    while stack:
+        frame = stack[-1]
+        child = next(frame[1], None)
+        if child is not None:
+            stack.append([child, ast.iter_child_nodes(child), 0, 0, 0])
+            continue
+        stack.pop()
+        node, _, depth, returns, external_attrs = frame
+        if isinstance(node, NESTING_NODES):
+            depth += 1
+        if isinstance(node, ast.Return):
+            returns += 1
+        elif isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name):
+            external_attrs += 1
+        if isinstance(node, ast.FunctionDef):
+            stats[node] = FunctionStats(depth, returns, external_attrs, len(node.body))
+        if stack:
+            parent = stack[-1]
+            if depth > parent[2]:
+                parent[2] = depth
+            parent[3] += returns
+            parent[4] += external_attrs
+    return stats
+
+
+class Detector:
+    """A single smell/metric check fed by DetectorEngine.
+
+    Subclasses list the AST node classes they care about in ``node_types``,
+    get every matching node through ``visit`` during the shared traversal and
+    append their findings in ``report`` once the traversal is done.
+    Whole-subtree aggregates of a function are available through
+    ``self.engine.function_stats(node)`` instead of walking it again, and
+    the file's shared ParsedSource (radon results, line offsets) through
+    ``self.engine.source``.
+    """
+
+    node_types = ()
+    engine = None
+
+    def visit(self, node):
+        pass
+
+    def report(self, smells, metrics):
+        pass
+
+
+class DetectorEngine:
+    """Walks a tree once and hands each node to every interested detector.
+
+    With ``timings`` (a detector.timing.Timings) the time spent in each
+    detector's ``visit`` and ``report`` is charged to its class name.
+    """
+
+    def __init__(self, detectors, timings=None):
+        self.detectors = list(detectors)
+        self.timings = timings if timings is not None and timings.enabled else None
+        self._handlers = {}
+        self.source = None
+        for detector in self.detectors:
+            detector.engine = self
+
+    def function_stats(self, node):
+        # Built on first use for the source being run, then shared by every
+        # detector and every function in it.
+        return self.source.function_stats[node]
+
+    def _handlers_for(self, node_type):
+        handlers = self._handlers.get(node_type)
+        if handlers is None:
+            handlers = [d.visit if self.timings is None else self._timed(d.visit, type(d).__name__)
+                        for d in self.detectors if issubclass(node_type, d.node_types)]
+            self._handlers[node_type] = handlers
+        return handlers
+
+    def _timed(self, visit, name):
+        seconds = self.timings.seconds
+        clock = time.perf_counter
+
+        def timed_visit(node):
+            start = clock()
+            visit(node)
+            seconds[name] += clock() - start
+        return timed_visit
+
+    def run(self, source):
+        """Feed every node of ``source`` (a detector.parsed_source.ParsedSource) to the detectors."""
+        # ast.walk order is kept so every detector sees nodes in the same
+        # order as the per-smell walks it replaces.
+        self.source = source
+        handlers = self._handlers
+        for node in ast.walk(source.tree):
+            node_type = type(node)
+            visits = handlers.get(node_type)
+            if visits is None:
+                visits = self._handlers_for(node_type)
+            for visit in visits:
+                visit(node)
+
+    def report(self, smells, metrics):
+        for detector in self.detectors:
+            if self.timings is None:
+                detector.report(smells, metrics)
+            else:
+                with self.timings.stage(type(detector).__name__):
+                    detector.report(smells, metrics)
@@ -0,0 +1,395 @@
+import atexit
+import hashlib
+import json
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+from datetime import date, timedelta
+from pathlib import PurePosixPath
+
+REPORT_DB = os.getenv("REPORT_DB", os.path.join(".smell_cache", "reports.sqlite3"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    repo TEXT NOT NULL,
+    commit_sha TEXT NOT NULL,
+    analyzed_at REAL NOT NULL,
+    metadata TEXT NOT NULL,
+    duplicates TEXT NOT NULL,
+    history INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (repo, commit_sha)
+);
+CREATE TABLE IF NOT EXISTS files (
+    repo TEXT NOT NULL,
+    commit_sha TEXT NOT NULL,
+    path TEXT NOT NULL,
+    language TEXT NOT NULL,
+    result_key TEXT,
+    error TEXT,
+    PRIMARY KEY (repo, commit_sha, path)
+);
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS smells (
+    repo TEXT NOT NULL,
+    commit_sha TEXT NOT NULL,
+    path TEXT NOT NULL,
+    smell_type TEXT NOT NULL,
+    count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS commits (
+    repo TEXT NOT NULL,
+    commit_sha TEXT NOT NULL,
+    committed_at INTEGER NOT NULL,
+    position INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (repo, commit_sha)
+);
+CREATE TABLE IF NOT EXISTS blob_results (
+    blob_sha TEXT NOT NULL,
+    analyzer TEXT NOT NULL,
+    result_key TEXT,
+    error TEXT,
+    PRIMARY KEY (blob_sha, analyzer)
+);
+CREATE INDEX IF NOT EXISTS reports_by_time ON reports (repo, analyzed_at);
+CREATE INDEX IF NOT EXISTS commits_by_time ON commits (repo, committed_at);
+CREATE INDEX IF NOT EXISTS smells_by_type ON smells (repo, smell_type, commit_sha);
+CREATE INDEX IF NOT EXISTS smells_by_path ON smells (repo, commit_sha, path);
+"""
+# Smells listing their occurrences: "Feature Envy (>5 external calls): 3 - [...]", "Data Clumps (...): 2 sets - [...]".
+LISTED_COUNT = re.compile(r": (\d+)(?: sets)? - ")
+# JavaScript smells that only tally their occurrences: "Unused Variables: 16 variables", "Unnecessary Semicolons: 4 found".
+TALLIED_COUNT = re.compile(r": (\d+) (?:variables|occurrences|blocks|blocks repeated|chains|found)$")
+METRIC_NAME = re.compile(r"\w+")
+# Start of the period a commit time falls in, as an ISO date; weeks start on Monday.
+PERIODS = {
+    "day": "date(c.committed_at, 'unixepoch')",
+    "week": "date(c.committed_at, 'unixepoch', '-6 days', 'weekday 1')",
+    "month": "date(c.committed_at, 'unixepoch', 'start of month')",
+}
+# Ids per "IN (...)" lookup, below SQLite's host parameter limit.
+LOOKUP_BATCH = 500
+
+# Newest first: analyses by the time they ran, then history snapshots (never newer than an analysis) by commit.
+NEWEST_FIRST = "ORDER BY r.history, CASE WHEN r.history THEN c.position ELSE r.analyzed_at END DESC"
+
+StoredResult = namedtuple("StoredResult", "key data error smells")
+
+
+def compact(value):
+    return json.dumps(value, separators=(",", ":"))
+
+
+def smell_type(smell):
+    """"High Complexity Functions (>10): 3 - [...]" -> "High Complexity Functions"."""
+    return re.split(r" \(|:", smell, maxsplit=1)[0].strip()
+
+
+def smell_count(smell):
+    """Occurrences a smell string reports.
+
+    Smells that give a measurement of one thing ("Large File (>500 lines):
+    812 lines", "Too Many Parameters (>4): 6 parameters", a nesting depth, a
+    comment count) count once, whatever the number.
+    """
+    match = LISTED_COUNT.search(smell) or TALLIED_COUNT.search(smell)
+    return int(match.group(1)) if match else 1
+
+
+def stored_result(data=None, error=None):
+    """One file's analysis in stored form: the compact JSON of its smells and metrics, its key and ``(type, count)`` per smell."""
+    if error is not None:
+        return StoredResult(None, None, error, ())
+    payload = compact({"smells": data["smells"], "metrics": data["metrics"]})
+    return StoredResult(hashlib.sha1(payload.encode("utf-8")).hexdigest(), payload, None,
+                        tuple((smell_type(smell), smell_count(smell)) for smell in data["smells"]))
+
+
+def next_period(start, interval):
+    if interval == "day":
+        return start + timedelta(days=1)
+    if interval == "week":
+        return start + timedelta(days=7)
+    return (start.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+
+def path_range(folder):
+    """``(low, high)`` bounds of the paths under ``folder``, so a prefix match can use the path index."""
+    prefix = folder.rstrip("/") + "/"
+    return prefix, prefix[:-1] + chr(ord("/") + 1)
+
+
+class ReportStore:
+    """SQLite store of analysis reports, one per repo and commit.
+
+    Each analyzed file is a row keyed by repo, commit and path that points to
+    its smells and metrics, kept once per distinct result as compact JSON, so
+    an unchanged file costs a row per commit and not another copy of its
+    report. Every smell is also indexed by type, which makes "files with this
+    smell" and per-type totals cheap to query.
+
+    The smell history (detector.history) adds the commit time of each commit
+    and the result of every analyzed blob, so a blob is analyzed once across
+    all commits and runs; ``series`` aggregates the dated commits over time.
+
+    ``save`` and the other ``save_*`` methods only queue their rows: a
+    background thread writes everything queued in one transaction, so the
+    analysis never waits on the disk. ``flush`` blocks until everything
+    queued so far is written.
+    """
+
+    def __init__(self, path=REPORT_DB):
+        self.path = os.path.abspath(path)
+        self._queue = queue.Queue()
+        self._writer = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            # Readers keep going while the writer commits.
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def save(self, repo_url, commit, entries, duplicates, metadata):
+        """Queue the report of ``commit``: file entries (see detector.app.file_entry), repo-wide duplicates and metadata."""
+        files = [(entry["path"], entry["language"], stored_result(entry, entry.get("error"))) for entry in entries]
+        self.save_files(repo_url, commit, files, duplicates, metadata)
+
+    def save_files(self, repo_url, commit, files, duplicates, metadata, dated=None):
+        """Queue a report whose files are already ``(path, language, StoredResult)``.
+
+        A report ``dated`` with ``(commit time, mainline position)`` is a smell
+        history snapshot: it never counts as the latest report of the repo
+        while one from an actual analysis exists.
+        """
+        self._enqueue(self._write_report, repo_url, commit, time.time(), files, compact(duplicates), compact(metadata),
+                      dated)
+
+    def save_commit_dates(self, repo_url, dates):
+        """Queue ``{commit: (commit time, mainline position)}`` of commits that already have a report.
+
+        The position is the commit's index along the first-parent chain, so
+        it orders commits even when their times don't (same second, rebases,
+        skewed clocks).
+        """
+        self._enqueue(self._write_commit_dates, repo_url, dates)
+
+    def save_blob_results(self, results):
+        """Queue ``[(blob sha, analyzer, StoredResult)]``, looked up again with ``blob_results``."""
+        self._enqueue(self._write_blob_results, results)
+
+    def _enqueue(self, write, *args):
+        self._queue.put((write, args))
+        with self._lock:
+            if self._writer is None or not self._writer.is_alive():
+                self._writer = threading.Thread(target=self._write_loop, name="report-writer", daemon=True)
+                self._writer.start()
+
+    def flush(self):
+        self._queue.join()
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                conn = self._connect()
+                with conn:
+                    for write, args in batch:
+                        write(conn, *args)
+            except sqlite3.Error as e:
+                print(f"[-] Could not write {len(batch)} report(s) to {self.path}: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    @staticmethod
+    def _write_results(conn, results):
+        conn.executemany("INSERT OR IGNORE INTO results VALUES (?, ?)",
+                         {result.key: result.data for result in results if result.key is not None}.items())
+
+    def _write_report(self, conn, repo_url, commit, analyzed_at, files, duplicates, metadata, dated):
+        key = (repo_url, commit)
+        conn.execute("DELETE FROM files WHERE repo = ? AND commit_sha = ?", key)
+        conn.execute("DELETE FROM smells WHERE repo = ? AND commit_sha = ?", key)
+        conn.execute("INSERT OR REPLACE INTO reports VALUES (?, ?, ?, ?, ?, ?)",
+                     (repo_url, commit, analyzed_at, metadata, duplicates, int(dated is not None)))
+        if dated is not None:
+            self._write_commit_dates(conn, repo_url, {commit: dated})
+        self._write_results(conn, [result for _, _, result in files])
+        conn.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?)",
+                         [(repo_url, commit, path, language, result.key, result.error)
+                          for path, language, result in files])
+        conn.executemany("INSERT INTO smells VALUES (?, ?, ?, ?, ?)",
+                         [(repo_url, commit, path, smell, count)
+                          for path, _, result in files for smell, count in result.smells])
+
+    @staticmethod
+    def _write_commit_dates(conn, repo_url, dates):
+        conn.executemany("INSERT OR REPLACE INTO commits VALUES (?, ?, ?, ?)",
+                         [(repo_url, commit, committed_at, position)
+                          for commit, (committed_at, position) in dates.items()])
+
+    def _write_blob_results(self, conn, results):
+        self._write_results(conn, [result for _, _, result in results])
+        conn.executemany("INSERT OR REPLACE INTO blob_results VALUES (?, ?, ?, ?)",
+                         [(blob_sha, analyzer, result.key, result.error) for blob_sha, analyzer, result in results])
+
+    def blob_results(self, analyzer, blob_shas):
+        """``{blob sha: StoredResult}`` of the given blobs that were analyzed with ``analyzer`` before."""
+        conn = self._connect()
+        shas = list(blob_shas)
+        found = {}
+        for start in range(0, len(shas), LOOKUP_BATCH):
+            chunk = shas[start:start + LOOKUP_BATCH]
+            rows = conn.execute(
+                "SELECT b.blob_sha, b.error, r.data FROM blob_results b LEFT JOIN results r ON r.key = b.result_key "
+                f"WHERE b.analyzer = ? AND b.blob_sha IN ({','.join('?' * len(chunk))})", [analyzer] + chunk)
+            for blob_sha, error, data in rows:
+                found[blob_sha] = stored_result(None if data is None else json.loads(data), error)
+        return found
+
+    def dated_commits(self, repo_url):
+        """Commits of ``repo_url`` whose report is dated, i.e. part of the smell history."""
+        return {commit for commit, in self._connect().execute("SELECT commit_sha FROM commits WHERE repo = ?",
+                                                              (repo_url,))}
+
+    def series(self, repo_url, smell=None, metric=None, interval="week", path=None, since=None, until=None):
+        """Time series of a smell total (or the sum of a metric) over the dated commits of ``repo_url``.
+
+        Every ``interval`` ("day", "week" or "month") takes the state of its
+        last commit along the mainline: the total count of ``smell`` (all smells when None) or the
+        sum of ``metric`` (e.g. "total_lines") over the files, only those
+        under ``path`` when given. ``since``/``until`` bound the commit times
+        (unix seconds). Periods without commits repeat the previous value.
+        Returns ``[{"period", "commit", "committed_at", "value"}, ...]``, oldest first.
+        """
+        if interval not in PERIODS:
+            raise ValueError(f"Unknown interval {interval!r}; use one of {', '.join(PERIODS)}")
+        if metric is not None and not METRIC_NAME.fullmatch(metric):
+            raise ValueError(f"Invalid metric name {metric!r}")
+        params = [repo_url, since or 0, until if until is not None else 2 ** 62]
+        latest = (f"SELECT period, commit_sha, committed_at FROM ("
+                  f"SELECT {PERIODS[interval]} AS period, c.commit_sha, c.committed_at, ROW_NUMBER() OVER ("
+                  f"PARTITION BY {PERIODS[interval]} ORDER BY c.position DESC) AS rank FROM commits c "
+                  f"WHERE c.repo = ? AND c.committed_at BETWEEN ? AND ?) WHERE rank = 1")
+        path_filter = ""
+        if path:
+            low, high = path_range(path)
+            path_filter = " AND (t.path = ? OR (t.path >= ? AND t.path < ?))"
+        if metric is None:
+            query = (f"SELECT l.period, l.commit_sha, l.committed_at, COALESCE(SUM(t.count), 0) FROM ({latest}) l "
+                     f"LEFT JOIN smells t ON t.repo = ? AND t.commit_sha = l.commit_sha"
+                     f"{' AND t.smell_type = ?' if smell else ''}{path_filter}")
+            params.append(repo_url)
+            if smell:
+                params.append(smell)
+        else:
+            query = (f"SELECT l.period, l.commit_sha, l.committed_at, "
+                     f"COALESCE(SUM(json_extract(r.data, '$.metrics.{metric}')), 0) FROM ({latest}) l "
+                     f"LEFT JOIN files t ON t.repo = ? AND t.commit_sha = l.commit_sha{path_filter} "
+                     f"LEFT JOIN results r ON r.key = t.result_key")
+            params.append(repo_url)
+        if path:
+            params += [path.rstrip("/"), low, high]
+        rows = self._connect().execute(query + " GROUP BY l.period ORDER BY l.period", params).fetchall()
+
+        points = []
+        for period, commit, committed_at, value in rows:
+            start = date.fromisoformat(period)
+            while points and next_period(date.fromisoformat(points[-1]["period"]), interval) < start:
+                # No commits in that period: the code stayed as it was.
+                gap = next_period(date.fromisoformat(points[-1]["period"]), interval)
+                points.append({**points[-1], "period": gap.isoformat()})
+            points.append({"period": period, "commit": commit, "committed_at": committed_at, "value": value})
+        return points
+
+    def commits(self, repo_url):
+        """Stored reports of ``repo_url``, newest first: ``[{"commit", "analyzed_at", "history", "files"}, ...]``.
+
+        Analyses come first, most recent first, then the smell history
+        snapshots from the newest commit back.
+        """
+        rows = self._connect().execute(
+            "SELECT r.commit_sha, r.analyzed_at, r.history, "
+            "(SELECT COUNT(*) FROM files f WHERE f.repo = r.repo AND f.commit_sha = r.commit_sha) FROM reports r "
+            "LEFT JOIN commits c ON c.repo = r.repo AND c.commit_sha = r.commit_sha "
+            f"WHERE r.repo = ? {NEWEST_FIRST}", (repo_url,))
+        return [{"commit": commit, "analyzed_at": analyzed_at, "history": bool(history), "files": files}
+                for commit, analyzed_at, history, files in rows]
+
+    def load(self, repo_url, commit=None, path=None, smell=None):
+        """The stored report of ``commit`` (the latest one when None, see ``commits``), or None if there is none.
+
+        Returns ``{"commit", "analyzed_at", "files", "clones", "near_duplicates", "metadata"}``
+        where ``files`` lists entries with ``path``, ``language``, ``file`` and
+        ``smells``/``metrics`` (or ``error``), ordered by path. ``path`` keeps
+        only that file or the files under that folder, ``smell`` only the files
+        with a smell of that type (e.g. "Large Functions").
+        """
+        conn = self._connect()
+        if commit is None:
+            row = conn.execute("SELECT r.commit_sha, r.analyzed_at, r.metadata, r.duplicates FROM reports r "
+                               "LEFT JOIN commits c ON c.repo = r.repo AND c.commit_sha = r.commit_sha "
+                               f"WHERE r.repo = ? {NEWEST_FIRST} LIMIT 1", (repo_url,)).fetchone()
+        else:
+            row = conn.execute("SELECT commit_sha, analyzed_at, metadata, duplicates FROM reports "
+                               "WHERE repo = ? AND commit_sha = ?", (repo_url, commit)).fetchone()
+        if row is None:
+            return None
+        commit, analyzed_at, metadata, duplicates = row
+
+        query = ("SELECT f.path, f.language, f.error, r.data FROM files f "
+                 "LEFT JOIN results r ON r.key = f.result_key WHERE f.repo = ? AND f.commit_sha = ?")
+        params = [repo_url, commit]
+        if path:
+            low, high = path_range(path)
+            query += " AND (f.path = ? OR (f.path >= ? AND f.path < ?))"
+            params += [path.rstrip("/"), low, high]
+        if smell:
+            query += (" AND f.path IN (SELECT s.path FROM smells s WHERE s.repo = f.repo "
+                      "AND s.commit_sha = f.commit_sha AND s.smell_type = ?)")
+            params.append(smell)
+
+        files = []
+        for file_path, language, error, data in conn.execute(query + " ORDER BY f.path", params):
+            entry = {"language": language, "path": file_path, "file": PurePosixPath(file_path).name}
+            if error is not None:
+                entry["error"] = error
+            else:
+                entry.update(json.loads(data))
+            files.append(entry)
+        return {"commit": commit, "analyzed_at": analyzed_at, "files": files,
+                **json.loads(duplicates), "metadata": json.loads(metadata)}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def report_store():
+    """The process-wide ReportStore at REPORT_DB, created on first use."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ReportStore()
+            # Reports still queued when the process exits are written first.
+            atexit.register(_store.flush)
+    return _store
@@ -0,0 +1,173 @@
+"""Where analysis time goes: per-stage and per-detector timers, and Prometheus histograms of them.
+
+A ``Timings`` object sums the seconds spent in named stages (clone,
+discovery, analysis, report write, ...) and per detector. Per-file detector
+timings are measured in the worker that analyzed the file and merged into
+the run's Timings, whose totals end up in the report metadata. Finished runs
+are recorded in process-wide histograms that ``render_metrics`` serves in the
+Prometheus text format.
+
+``ANALYSIS_TIMING=0`` turns all of it off: stages and laps become no-ops and
+no timings are reported.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+
+TIMING = os.getenv("ANALYSIS_TIMING", "1") != "0"
+# Upper bounds (seconds) of the histogram buckets, +Inf is implied.
+BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+
+class Timings:
+    """Seconds per named stage, summed when a stage runs more than once."""
+
+    def __init__(self, enabled=None):
+        self.enabled = TIMING if enabled is None else enabled
+        self.seconds = defaultdict(float)
+        self._last = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - start
+
+    def lap(self, name=None):
+        """Charge the time since the previous lap to ``name``; without a name only restart the lap clock.
+
+        For code that runs as one straight sequence of steps, like
+        analyze_js_source, where wrapping each step in a block would only
+        add indentation.
+        """
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if name is not None:
+            self.seconds[name] += now - self._last
+        self._last = now
+
+    def iterate(self, name, iterable):
+        """Yield from ``iterable``, charging to ``name`` only the time spent producing items, not consuming them."""
+        if not self.enabled:
+            yield from iterable
+            return
+        iterator = iter(iterable)
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    self.seconds[name] += time.perf_counter() - start
+                yield item
+        finally:
+            # A consumer that stops early must still shut ``iterable`` down (e.g. its process pool).
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    def add(self, seconds, prefix=""):
+        """Merge ``{name: seconds}`` (e.g. one file's detector timings) into these."""
+        for name, value in seconds.items():
+            self.seconds[prefix + name] += value
+
+    def as_dict(self):
+        return {name: round(value, 6) for name, value in sorted(self.seconds.items())}
+
+
+class _Histogram:
+    def __init__(self, name, help_text, labels):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.series = {}  # label values -> [bucket counts, sum, count]
+
+    def observe(self, label_values, value):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [[0] * len(BUCKETS), 0.0, 0]
+        index = bisect_left(BUCKETS, value)
+        if index < len(BUCKETS):
+            series[0][index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self, lines):
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} histogram")
+        for label_values, (buckets, total, count) in sorted(self.series.items()):
+            labels = ",".join(f'{label}="{_escape(value)}"' for label, value in zip(self.labels, label_values))
+            prefix = labels + "," if labels else ""
+            cumulative = 0
+            for bound, bucket in zip(BUCKETS, buckets):
+                cumulative += bucket
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {count}')
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {total}")
+            lines.append(f"{self.name}_count{suffix} {count}")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+_lock = threading.Lock()
+_stage_seconds = _Histogram("code_smells_stage_seconds", "Time per analysis spent in each pipeline stage.", ("stage",))
+_detector_seconds = _Histogram("code_smells_detector_seconds",
+                               "Time per analysis spent in each detector, summed over the analyzed files.",
+                               ("language", "detector"))
+_request_seconds = _Histogram("code_smells_request_seconds", "Time spent serving each endpoint.",
+                              ("endpoint", "stage"))
+
+
+def record_analysis(timings):
+    """Add one finished analysis run to the process-wide histograms."""
+    if not timings.enabled:
+        return
+    with _lock:
+        for name, seconds in timings.seconds.items():
+            if name.startswith("detector."):
+                _, language, detector = name.split(".", 2)
+                _detector_seconds.observe((language, detector), seconds)
+            else:
+                _stage_seconds.observe((name,), seconds)
+
+
+def record_request(endpoint, stage, seconds):
+    if not TIMING:
+        return
+    with _lock:
+        _request_seconds.observe((endpoint, stage), seconds)
+
+
+def report_timings(timings):
+    """The ``metadata["timings"]`` block: pipeline stages and per-detector totals, in seconds."""
+    stages = {}
+    detectors = {}
+    for name, seconds in timings.as_dict().items():
+        if name.startswith("detector."):
+            detectors[name[len("detector."):]] = seconds
+        else:
+            stages[name] = seconds
+    return {"stages": stages, "detectors": detectors}
+
+
+def render_metrics():
+    """All histograms in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        for histogram in (_stage_seconds, _detector_seconds, _request_seconds):
+            histogram.render(lines)
+    return "\n".join(lines) + "\n"
@@ -1,112 +1,194 @@
-import ast
-import astor
-import textwrap
-from collections import defaultdict
 import re
+from bisect import bisect_left, insort
+from detector.js_lexer import IdentifierIndex, tokenize, COMMENT, NAME, NUMBER, PUNCT
+
+
+class Rewrite:
+    """Edits to one JavaScript source, by character offset, applied together in one pass.
+
+    The source is tokenized once and every refactoring adds its edits against
+    that original text, so none of them rescans the file or sees (and
+    mangles) what another one wrote. ``apply`` skips any edit that overlaps
+    an earlier-added one, wherever either starts, so refactorings added first
+    take precedence. ``prelude`` holds declarations to put above the code.
+    """
+
+    def __init__(self, code):
+        self.code = code
+        self.tokens = tokenize(code)
+        self.identifiers = IdentifierIndex(self.tokens)
+        self.edits = []      # (start, end, order added, replacement)
+        self.prelude = []
+
+    def replace(self, start, end, text):
+        self.edits.append((start, end, len(self.edits), text))
+
+    def replace_names(self, replacements):
+        """Replace every occurrence of the identifiers in ``replacements`` (name -> text)."""
+        for name, text in replacements.items():
+            for start in self.identifiers.positions.get(name, ()):
+                self.replace(start, start + len(name), text)
+
+    def replace_texts(self, replacements):
+        """Replace every occurrence of the code fragments in ``replacements`` (text -> text), matched in one scan."""
+        if not replacements:
+            return
+        pattern = re.compile("|".join(re.escape(text) for text in sorted(replacements, key=len, reverse=True)))
+        for match in pattern.finditer(self.code):
+            self.replace(match.start(), match.end(), replacements[match.group()])
+
+    def apply(self):
+        # Kept (start, end) ranges, sorted; they don't overlap, so their ends are sorted too.
+        # Insertions (start == end) only conflict with a range strictly around them.
+        kept = []
+        edits = []
+        for start, end, order, text in self.edits:
+            i = bisect_left(kept, (end,))
+            if i and kept[i - 1][1] > start:
+                continue  # overlaps an edit added earlier
+            insort(kept, (start, end))
+            edits.append((start, end, order, text))
+        parts = list(self.prelude)
+        last = 0
+        for start, end, _, text in sorted(edits):
+            parts.append(self.code[last:start])
+            parts.append(text)
+            last = end
+        parts.append(self.code[last:])
+        return "".join(parts)
+
+
+def _code_tokens(rewrite):
+    """Non-comment tokens with the previous one, so a property after "." can be told from a variable."""
+    previous = None
+    for token in rewrite.tokens:
+        if token.kind == COMMENT:
+            continue
+        yield token, previous
+        previous = token
+
+
+def _apply(edit, code, details):
+    rewrite = Rewrite(code)
+    edit(rewrite, details)
+    return rewrite.apply()
 
 # Refactoring Functions
+# ``edit_*`` add their edits to a Rewrite; ``refactor_*`` apply one of them to code on its own.
+
+def edit_global_variables(rewrite, global_vars):
+    global_vars = set(global_vars)
+    for token, previous in _code_tokens(rewrite):
+        if token.kind != NAME or token.value not in global_vars:
+            continue
+        if previous is not None and previous.kind == PUNCT and previous.value == ".":
+            continue  # a property, not the global
+        if previous is not None and previous.value in ("var", "const"):
+            rewrite.replace(previous.start, previous.start + len(previous.value), "let")  # Use let instead of var/const
+        elif previous is None or previous.value != "let":
+            # Access global variable through the `window` object
+            rewrite.replace(token.start, token.start + len(token.value), f"window.{token.value}")
 
 def refactor_global_variables(code, global_vars):
-    for var in global_vars:
-        # Refactor global variables by enclosing them inside an object or passing them as parameters
-        code = re.sub(rf'\b{var}\b', f'window.{var}', code)  # Access global variable through the `window` object
-        code = code.replace(f"var {var}", f"let {var}")  # Use let instead of var
-        code = code.replace(f"const {var}", f"let {var}")  # If const, change to let for mutability
-    return code
+    return _apply(edit_global_variables, code, global_vars)
 
-def refactor_magic_numbers(code, magic_numbers):
+def _constant_name(num):
+    # "3.14" -> NUM_3_14_VALUE, a valid identifier
+    return "NUM_" + re.sub(r"\W", "_", num) + "_VALUE"
+
+def edit_magic_numbers(rewrite, magic_numbers):
     # Replace magic numbers with constants for better readability
-    constants = {num: f"const {num}_VALUE = {num};" for num in set(magic_numbers)}  # Create constants
-    constant_declarations = "\n".join(constants.values())  # Form the declarations block
-    code = constant_declarations + "\n\n" + code  # Add constants at the top of the code
-    
-    for num in set(magic_numbers):
-        code = code.replace(str(num), f"{num}_VALUE")  # Replace magic numbers in the code with the defined constants
-    return code
+    magic_numbers = sorted({str(num) for num in magic_numbers})
+    if not magic_numbers:
+        return
+    constants = {num: _constant_name(num) for num in magic_numbers}
+    rewrite.prelude.append("\n".join(f"const {name} = {num};" for num, name in constants.items()) + "\n\n")
+    for token in rewrite.tokens:
+        if token.kind == NUMBER and token.value in constants:
+            rewrite.replace(token.start, token.start + len(token.value), constants[token.value])
+
+def refactor_magic_numbers(code, magic_numbers):
+    return _apply(edit_magic_numbers, code, magic_numbers)
+
+def edit_duplicate_code(rewrite, duplicate_blocks):
+    # Replace duplicated blocks with function calls
+    rewrite.replace_texts({'\n'.join(block): f"refactored_function_{index}()"
+                           for index, block in reversed(list(enumerate(duplicate_blocks)))})
 
 def refactor_duplicate_code(code, duplicate_blocks):
-    for block in duplicate_blocks:
-        block_str = '\n'.join(block)
-        function_name = f"refactored_function_{duplicate_blocks.index(block)}"
-        function_code = f"function {function_name}() {{\n{block_str}\n}}"
-        code = code.replace(block_str, f"{function_name}()")  # Replace duplicated blocks with function calls
-    return code
+    return _apply(edit_duplicate_code, code, duplicate_blocks)
+
+def edit_unused_variables(rewrite, unused_vars):
+    # Comment out every occurrence of the unused variables
+    rewrite.replace_names({var: f"// {var} (Unused variable)" for var in unused_vars})
 
 def refactor_unused_variables(code, unused_vars):
-    for var in unused_vars:
-        # Check if variable is declared but not used and comment it out
-        code = re.sub(rf'\b{var}\b', f"// {var} (Unused variable)", code)
-    return code
+    return _apply(edit_unused_variables, code, unused_vars)
+
+def edit_callback_hell(rewrite, nested_callbacks):
+    # Extract nested callbacks into separate async functions and call those instead
+    names = {}
+    for index, callback in enumerate(nested_callbacks):
+        if callback in names:
+            continue
+        names[callback] = f"handleNestedCallback{index}"
+        async_callback = callback.replace("function", "async function")
+        rewrite.prelude.append(f"async function {names[callback]}() {{\n{async_callback}\n}};\n")
+    rewrite.replace_texts(names)
 
 def refactor_callback_hell(code, nested_callbacks):
-    for callback in nested_callbacks:
-        # Refactor nested callbacks to use async/await or extract them into separate functions
-        code = code.replace(callback, callback.replace("function", "async function"))  # Convert callbacks to async functions
-        nested_function_name = f"handleNestedCallback{nested_callbacks.index(callback)}"
-        code = code.replace(callback, nested_function_name)  # Replace callback with function call
-        code = f"async function {nested_function_name}() {{\n{callback}\n}};\n" + code  # Define the new async function
-    return code
+    return _apply(edit_callback_hell, code, nested_callbacks)
+
+def edit_dead_code_variables(rewrite, unused_vars):
+    rewrite.replace_names({var: f"// {var} (Dead code - unused variable)" for var in unused_vars})
 
 def refactor_dead_code_variables(code, unused_vars):
-    for var in unused_vars:
-        code = re.sub(rf'\b{var}\b', f"// {var} (Dead code - unused variable)", code)
-    return code
+    return _apply(edit_dead_code_variables, code, unused_vars)
+
+def edit_excessive_comments(rewrite, details=None):
+    # Remove the comments; "//" and "/*" inside strings and regexes are left alone
+    for token in rewrite.tokens:
+        if token.kind == COMMENT:
+            rewrite.replace(token.start, token.start + len(token.value), "")
 
 def refactor_excessive_comments(code):
-    # Remove excessive comments or unnecessary explanations from the code
-    code = re.sub(r'//.*', '', code)  # Remove single-line comments
-    code = re.sub(r'/\*.*?\*/', '', code, flags=re.DOTALL)  # Remove multi-line comments
-    return code
+    return _apply(edit_excessive_comments, code, None)
+
+def edit_large_functions(rewrite, functions_to_refactor):
+    # Add a comment above large functions indicating they need refactoring
+    functions_to_refactor = set(functions_to_refactor)
+    for token, previous in _code_tokens(rewrite):
+        if token.kind == NAME and token.value in functions_to_refactor and previous is not None \
+                and previous.value == "function":
+            rewrite.replace(previous.start, previous.start, "// TODO: Refactor large function\n")
 
 def refactor_large_functions(code, functions_to_refactor):
-    for fn_name in functions_to_refactor:
-        # Add a comment at the top of large functions indicating they need refactoring
-        code = re.sub(rf"def {fn_name}\s*\(", f"# TODO: Refactor large function\n\ndef {fn_name}(", code)
-    return code
+    return _apply(edit_large_functions, code, functions_to_refactor)
+
+# Smell -> the refactoring for it, in the order their edits take precedence
+SMELL_EDITS = [
+    ("Global Variables Found", edit_global_variables),
+    ("Magic Numbers Found", edit_magic_numbers),
+    ("Duplicate Code", edit_duplicate_code),
+    ("Unused Variables", edit_unused_variables),
+    ("Deep Nesting", edit_callback_hell),  # Refactor Callback Hell (Deep Nesting)
+    ("Dead Code Variables", edit_dead_code_variables),
+    ("Large Functions", edit_large_functions),
+]
 
 # Base Function to Apply Refactorings
 def refactor_js_code(code, smells):
     """
     This function accepts the main code and a dictionary of detected smells
     and applies the relevant refactoring functions.
-    """
-    
-    # Refactor Global Variables
-    if "Global Variables Found" in smells:
-        global_vars = smells["Global Variables Found"]["details"]
-        code = refactor_global_variables(code, global_vars)
-
-    # Refactor Magic Numbers
-    if "Magic Numbers Found" in smells:
-        magic_numbers = smells["Magic Numbers Found"]["details"]
-        code = refactor_magic_numbers(code, magic_numbers)
-
-    # Refactor Duplicate Code
-    if "Duplicate Code" in smells:
-        duplicate_blocks = smells["Duplicate Code"]["details"]
-        code = refactor_duplicate_code(code, duplicate_blocks)
-
-    # Refactor Unused Variables
-    if "Unused Variables" in smells:
-        unused_vars = smells["Unused Variables"]["details"]
-        code = refactor_unused_variables(code, unused_vars)
-
-    # Refactor Callback Hell (Deep Nesting)
-    if "Deep Nesting" in smells:
-        nested_callbacks = smells["Deep Nesting"]["details"]
-        code = refactor_callback_hell(code, nested_callbacks)
-
-    # Refactor Dead Code Variables
-    if "Dead Code Variables" in smells:
-        dead_code_vars = smells["Dead Code Variables"]["details"]
-        code = refactor_dead_code_variables(code, dead_code_vars)
 
+    The code is tokenized once, every refactoring adds its edits against it
+    and all of them are applied in a single pass.
+    """
+    rewrite = Rewrite(code)
+    for smell, edit in SMELL_EDITS:
+        if smell in smells:
+            edit(rewrite, smells[smell]["details"])
     # Refactor Excessive Comments
-    code = refactor_excessive_comments(code)
-
-    # Refactor Large Functions
-    if "Large Functions" in smells:
-        large_functions = smells["Large Functions"]["details"]
-        code = refactor_large_functions(code, large_functions)
-
-    return code
+    edit_excessive_comments(rewrite)
+    return rewrite.apply()
@@ -0,0 +1,81 @@
+"""Cache of LLM refactoring answers, so identical requests don't go back to the model.
+
+Two tiers: a small in-process LRU answers repeated clicks in microseconds,
+and an on-disk store (the same content-addressed layout as the analysis
+cache) shares answers across restarts and worker processes. The key covers
+everything that shapes the answer: the code, the smell list, the prompt
+template and the model parameters. Entries expire after LLM_CACHE_TTL seconds.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from detector.cache import AnalysisCache
+
+# Seconds a cached answer is served; 0 turns the cache off.
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "86400"))
+# Answers kept in memory per process.
+LLM_CACHE_ENTRIES = int(os.getenv("LLM_CACHE_ENTRIES", "256"))
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", os.path.join(".smell_cache", "llm"))
+LLM_CACHE_MAX_BYTES = int(float(os.getenv("LLM_CACHE_MAX_MB", "64")) * 1024 * 1024)
+# The disk tier is pruned to its size bound every this many writes.
+PRUNE_EVERY = 50
+
+
+class ResponseCache:
+    """In-process LRU in front of an on-disk store, both with a TTL. Thread-safe."""
+
+    def __init__(self, ttl=LLM_CACHE_TTL, max_entries=LLM_CACHE_ENTRIES, directory=LLM_CACHE_DIR,
+                 max_bytes=LLM_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.enabled = ttl > 0
+        self.max_entries = max_entries
+        self._memory = OrderedDict()  # key -> (created, value), most recently used last
+        self._lock = threading.Lock()
+        self._disk = AnalysisCache(directory, max_bytes if self.enabled else 0)
+
+    @staticmethod
+    def key(code, smells, template, params):
+        payload = json.dumps({"code": code, "smells": smells, "template": template, "params": params},
+                             sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _fresh(self, created):
+        return time.time() - created < self.ttl
+
+    def get(self, key):
+        """Return ``(value, tier)`` with tier "memory" or "disk", or ``(None, None)`` on a miss."""
+        if not self.enabled:
+            return None, None
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if self._fresh(entry[0]):
+                    self._memory.move_to_end(key)
+                    return entry[1], "memory"
+                del self._memory[key]
+
+        stored = self._disk.get(key)
+        if stored is None or not self._fresh(stored["created"]):
+            return None, None
+        self._remember(key, stored["created"], stored["value"])
+        return stored["value"], "disk"
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        created = time.time()
+        self._remember(key, created, value)
+        self._disk.put(key, {"created": created, "value": value})
+        if self._disk.writes % PRUNE_EVERY == 0:
+            self._disk.prune()
+
+    def _remember(self, key, created, value):
+        with self._lock:
+            self._memory[key] = (created, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
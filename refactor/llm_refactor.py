@@ -0,0 +1,331 @@
+"""Prompting the LLM to refactor code, one smelly function/class at a time for large files.
+
+A whole large file doesn't fit in the model's output budget, and one long
+answer is slow. ``plan_chunks`` splits a file into top-level units
+(functions and classes from the AST for Python, brace-delimited
+declarations for JavaScript) and keeps the ones with smells; each of those is
+refactored on its own, with bounded parallelism, and ``refactor_in_chunks``
+stitches the answers back into the untouched rest of the file. An answer that
+doesn't parse (Python) or balance its braces (JavaScript) is dropped and the
+original unit kept.
+"""
+import ast
+import os
+import re
+import textwrap
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from detector.js_analyzer import analyze_js_source
+from detector.js_lexer import tokenize, BraceIndex, COMMENT, NAME, PUNCT
+from detector.py_analyzer import analyze_py_source
+
+# Files up to this many lines are sent whole; a single call is cheaper than several.
+LLM_CHUNK_MIN_LINES = int(os.getenv("LLM_CHUNK_MIN_LINES", "150"))
+# Classes longer than this are split into their methods, and neighbouring
+# smelly units are sent together up to this many lines.
+LLM_CHUNK_MAX_LINES = int(os.getenv("LLM_CHUNK_MAX_LINES", "300"))
+# Chunks sent to the model at the same time.
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "4"))
+
+# Smells that describe the file as a whole (or relations between units), so
+# analyzing a unit on its own says nothing about them.
+FILE_LEVEL_SMELLS = frozenset([
+    "Large File", "Low Maintainability Index", "Global Variables", "Data Clumps", "Duplicate Code",
+    "Shotgun Surgery", "Global Variables Found", "Low Comment Density", "Inconsistent Naming Found",
+    "Duplicate Code Blocks", "Unnecessary Semicolons",
+])
+
+FENCE = "```"
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+# ``start``/``end``: 0-based line range [start, end) of the unit; ``indent``:
+# leading whitespace of its first line, stripped before it is sent.
+Chunk = namedtuple("Chunk", "name start end indent smells")
+
+
+def build_prompt(template, code, smells):
+    smell_text = "\n".join([f"{i+1}. {smell}" for i, smell in enumerate(smells)])
+    return template.replace("{input_code}", code).replace("{smells}", smell_text)
+
+
+class CodeStream:
+    """Pulls the code out of the model's answer while it is still arriving.
+
+    ``feed`` takes the next piece of the answer and returns the code that is
+    certain so far; ``close`` returns the rest. The ``<think>`` reasoning
+    preamble is dropped and the first fenced block is passed through without
+    its fences and language tag. Backticks that may become the closing fence
+    and trailing whitespace are held back until the next piece decides them.
+    An answer without fences is code as a whole, so it only comes out at
+    ``close``; so does everything when the reasoning is never closed.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._state = "preamble"  # -> "text" -> "tag" -> "code" -> "done"
+        self._started = False     # code was emitted (its leading whitespace is stripped)
+
+    def feed(self, piece):
+        self._buffer += piece
+        if self._state == "preamble":
+            head = self._buffer.lstrip()
+            if head.startswith(THINK_OPEN):
+                end = head.find(THINK_CLOSE)
+                if end == -1:
+                    return ""
+                self._buffer = head[end + len(THINK_CLOSE):]
+            elif THINK_OPEN.startswith(head):
+                return ""
+            self._state = "text"
+        if self._state == "text":
+            start = self._buffer.find(FENCE)
+            if start == -1:
+                return ""
+            self._buffer = self._buffer[start + len(FENCE):]
+            self._state = "tag"
+        if self._state == "tag":
+            tag = re.match(r"\w*", self._buffer).end()
+            if tag == len(self._buffer):
+                return ""
+            if self._buffer[tag] == "\n":
+                self._buffer = self._buffer[tag + 1:]
+            self._state = "code"
+        if self._state == "code":
+            end = self._buffer.find(FENCE)
+            if end != -1:
+                self._state = "done"
+                return self._emit(self._buffer[:end], final=True)
+            return self._emit(self._buffer, final=False)
+        return ""
+
+    def close(self):
+        if self._state in ("preamble", "text"):
+            self._state = "done"
+            return self._buffer.strip()
+        if self._state == "code":
+            # No closing fence: the answer was cut off, keep what there is.
+            self._state = "done"
+            return self._emit(self._buffer, final=True)
+        self._state = "done"
+        return ""
+
+    def _emit(self, text, final):
+        if not self._started:
+            text = text.lstrip()
+        if final:
+            self._buffer = ""
+            code = text.rstrip()
+        else:
+            backticks = len(text) - len(text.rstrip("`"))
+            code = text[:len(text) - min(backticks, len(FENCE) - 1)].rstrip()
+            self._buffer = text[len(code):]
+        if code:
+            self._started = True
+        return code
+
+
+def extract_code_from_response(response_text):
+    stream = CodeStream()
+    return stream.feed(response_text) + stream.close()
+
+
+def smell_type(smell):
+    """"Large Functions (>100 lines): 1 - [...]" -> "Large Functions"."""
+    return re.split(r" \(|:", smell, maxsplit=1)[0].strip()
+
+
+def python_units(code):
+    """``(name, start, end)`` line ranges of the top-level functions and classes (methods of long classes)."""
+    tree = ast.parse(code)
+    units = []
+
+    def add(node, prefix=""):
+        start = min([node.lineno] + [d.lineno for d in node.decorator_list]) - 1
+        units.append((prefix + node.name, start, node.end_lineno))
+
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef) and node.end_lineno - node.lineno + 1 > LLM_CHUNK_MAX_LINES:
+            for child in node.body:
+                if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    add(child, f"{node.name}.")
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            add(node)
+    return units
+
+
+def _js_unit_name(header):
+    names = [token.value for token in header if token.kind == NAME
+             and token.value not in ("export", "default", "async", "function", "class", "const", "let", "var")]
+    return names[0] if names else "(anonymous)"
+
+
+def js_units(code):
+    """``(name, start, end)`` line ranges of top-level statements that define a function or class.
+
+    A statement ends at a ";" outside parentheses or at the "}" closing a
+    function/class body, so declarations, ``const f = () => {...}`` and
+    calls like ``app.get("/", function () {...});`` are all units.
+    """
+    tokens = [token for token in tokenize(code) if token.kind != COMMENT]
+    braces = BraceIndex(tokens)
+    units = []
+    start = 0           # token index where the current statement starts
+    parens = 0
+    defines = False     # the statement contains function/class/=>
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        end = None
+        if token.kind == NAME and token.value in ("function", "class"):
+            defines = True
+        elif token.kind == PUNCT:
+            value = token.value
+            if value == "=>":
+                defines = True
+            elif value in ("(", "["):
+                parens += 1
+            elif value in (")", "]"):
+                parens = max(0, parens - 1)
+            elif value == ";" and parens == 0:
+                end = i
+            elif value == "{":
+                close = braces.closing(i)
+                if close is None:
+                    break
+                previous = tokens[i - 1] if i else None
+                i = close
+                if parens == 0 and defines:
+                    end = close + 1 if close + 1 < len(tokens) and tokens[close + 1].value == ";" else close
+                    i = end
+                elif parens == 0 and previous is not None and (
+                        previous.value == ")" or (previous.kind == NAME and previous.value in ("else", "try", "finally", "do"))):
+                    # if/for/while/try blocks end their statement
+                    start = close + 1
+        if end is not None:
+            if defines:
+                units.append((_js_unit_name(tokens[start:end]), tokens[start].line - 1, tokens[end].line))
+            start = end + 1
+            defines = False
+        i += 1
+    return units
+
+
+def _unit_smells(language, text, name, smells):
+    """The requested smells that apply to one unit: found by analyzing it alone, or naming it."""
+    wanted = {smell_type(smell) for smell in smells} - FILE_LEVEL_SMELLS
+    found = []
+    try:
+        if language == "python":
+            unit_smells, _ = analyze_py_source(textwrap.dedent(text))
+        else:
+            unit_smells, _ = analyze_js_source(text)
+        found = [smell for smell in unit_smells if smell_type(smell) in wanted]
+    except Exception:
+        pass
+    short_name = name.rsplit(".", 1)[-1]
+    mentioned = re.compile(rf"'{re.escape(short_name)}[(']")
+    for smell in smells:
+        if mentioned.search(smell) and smell not in found:
+            found.append(smell)
+    return sorted(found)
+
+
+def plan_chunks(code, language, smells):
+    """The smelly units of ``code`` as Chunks, or None when the file should be sent whole.
+
+    Whole means: a short file, a language without a splitter, code that
+    doesn't parse, or smells that no single unit accounts for.
+    """
+    lines = code.splitlines(keepends=True)
+    if len(lines) <= LLM_CHUNK_MIN_LINES or language not in ("python", "javascript"):
+        return None
+    try:
+        units = python_units(code) if language == "python" else js_units(code)
+    except SyntaxError:
+        return None
+
+    chunks = []
+    last_end = 0
+    for name, start, end in sorted(units, key=lambda unit: unit[1]):
+        if start < last_end:
+            continue  # shares a line with the previous unit
+        text = "".join(lines[start:end])
+        unit_smells = _unit_smells(language, text, name, smells)
+        if unit_smells:
+            indent = re.match(r"[ \t]*", lines[start]).group()
+            previous = chunks[-1] if chunks else None
+            if (previous is not None and previous.indent == indent
+                    and end - previous.start <= LLM_CHUNK_MAX_LINES):
+                # Every call pays the model's start-up latency: neighbours share one.
+                chunks[-1] = Chunk(f"{previous.name.split('..')[0]}..{name}", previous.start, end, indent,
+                                   sorted(set(previous.smells) | set(unit_smells)))
+            else:
+                chunks.append(Chunk(name, start, end, indent, unit_smells))
+        last_end = end
+    return chunks or None
+
+
+def _accept(language, original, answer):
+    """The answer, re-indented like the original unit, or None if it is not usable code."""
+    if not answer.strip():
+        return None
+    if language == "python":
+        answer = textwrap.dedent(answer)
+        try:
+            ast.parse(answer)
+        except SyntaxError:
+            return None
+        answer = textwrap.indent(answer, original.indent)
+    else:
+        tokens = tokenize(answer)
+        opens = sum(1 for token in tokens if token.kind == PUNCT and token.value == "{")
+        closes = sum(1 for token in tokens if token.kind == PUNCT and token.value == "}")
+        if opens != closes or len(BraceIndex(tokens).pairs) != opens:
+            return None
+    return answer if answer.endswith("\n") else answer + "\n"
+
+
+def iter_chunk_pieces(code, language, chunks, refactor_unit, workers=LLM_CONCURRENCY):
+    """Refactor each chunk with ``refactor_unit(code, smells)`` and yield the new file in order.
+
+    ``refactor_unit`` gets the unit's dedented source and its smells and
+    returns the refactored source (it is where the LLM call and its cache
+    live). Yields ``(text, replaced)``: the lines before a chunk right away,
+    then the chunk (its answer, or the original when the answer is unusable)
+    once its answer is in, while later chunks are still being refactored.
+    """
+    lines = code.splitlines(keepends=True)
+    chunks = sorted(chunks, key=lambda chunk: chunk.start)
+
+    def run(chunk):
+        try:
+            return refactor_unit(textwrap.dedent("".join(lines[chunk.start:chunk.end])), chunk.smells)
+        except Exception as e:
+            print(f"[-] Refactoring {chunk.name} failed: {e}")
+            return None
+
+    pool = ThreadPoolExecutor(max_workers=max(1, min(workers, len(chunks))))
+    futures = [pool.submit(run, chunk) for chunk in chunks]
+    try:
+        position = 0
+        for chunk, future in zip(chunks, futures):
+            yield "".join(lines[position:chunk.start]), False
+            answer = future.result()
+            accepted = _accept(language, chunk, answer) if answer is not None else None
+            if accepted is None:
+                yield "".join(lines[chunk.start:chunk.end]), False
+            else:
+                yield accepted, True
+            position = chunk.end
+        yield "".join(lines[position:]), False
+    finally:
+        # A reader that stops early (client gone) shouldn't wait for the chunks it won't read.
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def refactor_in_chunks(code, language, chunks, refactor_unit, workers=LLM_CONCURRENCY):
+    """The whole result of iter_chunk_pieces: ``(refactored code, number of chunks replaced)``."""
+    pieces = list(iter_chunk_pieces(code, language, chunks, refactor_unit, workers))
+    return "".join(text for text, _ in pieces), sum(1 for _, replaced in pieces if replaced)
@@ -1,12 +1,19 @@
 import ast
 import astor
+import copy
 import textwrap
 from collections import defaultdict
 import re
 
 
+# Tree refactorings come in two forms: ``transform_*(tree, details)`` edits a
+# parsed module, ``refactor_*(code, details)`` applies it to source on its own.
+def _round_trip(transform, code, details):
+    return astor.to_source(transform(ast.parse(code), details))
+
+
 # Refactor: Deeply Nested Functions
-def refactor_deeply_nested_functions(code, details=None):
+def transform_deeply_nested_functions(tree, details=None):
     class FunctionUnnester(ast.NodeTransformer):
         def __init__(self):
             self.new_funcs = []
@@ -22,15 +29,17 @@ def refactor_deeply_nested_functions(code, details=None):
             node.body = new_body
             return node
 
-    tree = ast.parse(code)
     unnester = FunctionUnnester()
     tree = unnester.visit(tree)
     tree.body.extend(unnester.new_funcs)
     ast.fix_missing_locations(tree)
-    return astor.to_source(tree)
+    return tree
+
+def refactor_deeply_nested_functions(code, details=None):
+    return _round_trip(transform_deeply_nested_functions, code, details)
 
 # Refactor: Too Many Returns
-def refactor_too_many_returns(code, details=None):
+def transform_too_many_returns(tree, details=None):
     class ReturnMerger(ast.NodeTransformer):
         def visit_FunctionDef(self, node):
             return_nodes = [n for n in ast.walk(node) if isinstance(n, ast.Return)]
@@ -57,10 +66,12 @@ def refactor_too_many_returns(code, details=None):
             node.body = new_func_body
             return node
 
-    tree = ast.parse(code)
     tree = ReturnMerger().visit(tree)
     ast.fix_missing_locations(tree)
-    return astor.to_source(tree)
+    return tree
+
+def refactor_too_many_returns(code, details=None):
+    return _round_trip(transform_too_many_returns, code, details)
 
 
 # Refactor: Long Lambdas
@@ -110,7 +121,7 @@ def refactor_feature_envy(code, details):
     return code
 
 # Refactor: Large Classes (split methods to helpers)
-def refactor_large_classes(code, details=None):
+def transform_large_classes(tree, details=None):
     class SplitLargeClass(ast.NodeTransformer):
         def visit_ClassDef(self, node):
             if len(node.body) > 12:
@@ -126,14 +137,16 @@ def refactor_large_classes(code, details=None):
                 return [node, helper_class]
             return node
 
-    tree = ast.parse(code)
     tree = SplitLargeClass().visit(tree)
     ast.fix_missing_locations(tree)
-    return astor.to_source(tree)
+    return tree
+
+def refactor_large_classes(code, details=None):
+    return _round_trip(transform_large_classes, code, details)
 
 
 # Refactor: High Complexity Functions (detects many branches)
-def refactor_high_complexity(code, details):
+def transform_high_complexity(tree, details):
     class ComplexityReducer(ast.NodeTransformer):
         def visit_FunctionDef(self, node):
             branch_count = sum(isinstance(n, (ast.If, ast.For, ast.While)) for n in ast.walk(node))
@@ -141,12 +154,14 @@ def refactor_high_complexity(code, details):
                 node.body.insert(0, ast.Expr(value=ast.Str(s='Refactor: high complexity')))
             return node
 
-    tree = ast.parse(code)
     tree = ComplexityReducer().visit(tree)
-    return astor.to_source(tree)
+    return tree
+
+def refactor_high_complexity(code, details):
+    return _round_trip(transform_high_complexity, code, details)
 
 # Refactor: Low Maintainability (replace chained expressions)
-def refactor_low_maintainability(code, details):
+def transform_low_maintainability(tree, details):
     class ExpressionUnfolder(ast.NodeTransformer):
         def visit_BinOp(self, node):
             if isinstance(node.left, ast.BinOp):
@@ -154,15 +169,15 @@ def refactor_low_maintainability(code, details):
                 return ast.BinOp(left=temp, op=node.op, right=node.right)
             return node
 
-    tree = ast.parse(code)
     tree = ExpressionUnfolder().visit(tree)
-    return astor.to_source(tree)
+    return tree
 
-# Dummy implementations for missing functions
+def refactor_low_maintainability(code, details):
+    return _round_trip(transform_low_maintainability, code, details)
 
-def refactor_useless_exceptions(code, details=None):
-    tree = ast.parse(code)
+# Dummy implementations for missing functions
 
+def transform_useless_exceptions(tree, details=None):
     class ExceptionHandlerFixer(ast.NodeTransformer):
         def visit_Try(self, node):
             self.generic_visit(node)
@@ -179,12 +194,13 @@ def refactor_useless_exceptions(code, details=None):
 
     fixed_tree = ExceptionHandlerFixer().visit(tree)
     ast.fix_missing_locations(fixed_tree)
-    return astor.to_source(fixed_tree)
+    return fixed_tree
 
+def refactor_useless_exceptions(code, details=None):
+    return _round_trip(transform_useless_exceptions, code, details)
 
-def refactor_dead_code_variables(code, details=None):
-    tree = ast.parse(code)
-    
+
+def transform_dead_code_variables(tree, details=None):
     class DeadCodeVariableRemover(ast.NodeTransformer):
         def visit_Assign(self, node):
             targets = [target.id for target in node.targets if isinstance(target, ast.Name)]
@@ -194,23 +210,25 @@ def refactor_dead_code_variables(code, details=None):
 
     tree = DeadCodeVariableRemover().visit(tree)
     ast.fix_missing_locations(tree)
-    return astor.to_source(tree)
+    return tree
 
-def refactor_excessive_comments(code, details=None):
-    tree = ast.parse(code)
-    
+def refactor_dead_code_variables(code, details=None):
+    return _round_trip(transform_dead_code_variables, code, details)
+
+def transform_excessive_comments(tree, details=None):
     class CommentRemover(ast.NodeTransformer):
         def visit_Comment(self, node):
             return None  # Removes comments completely
 
     tree = CommentRemover().visit(tree)
     ast.fix_missing_locations(tree)
-    return astor.to_source(tree)
+    return tree
 
+def refactor_excessive_comments(code, details=None):
+    return _round_trip(transform_excessive_comments, code, details)
 
-def refactor_large_functions(code, details=None):
-    tree = ast.parse(code)
-    
+
+def transform_large_functions(tree, details=None):
     class LargeFunctionSplitter(ast.NodeTransformer):
         def visit_FunctionDef(self, node):
             if len(node.body) > 20:
@@ -218,7 +236,7 @@ def refactor_large_functions(code, details=None):
                 new_func_name = f"{node.name}_helper"
                 helper_func = ast.FunctionDef(
                     name=new_func_name,
-                    args=node.args,
+                    args=copy.deepcopy(node.args),  # its own copy: later refactorings edit parameters in place
                     body=node.body[10:],  # The second half of the function
                     decorator_list=[]
                 )
@@ -229,11 +247,13 @@ def refactor_large_functions(code, details=None):
 
     tree = LargeFunctionSplitter().visit(tree)
     ast.fix_missing_locations(tree)
-    return astor.to_source(tree)
+    return tree
 
-def refactor_data_clumps(code, details=None):
+def refactor_large_functions(code, details=None):
+    return _round_trip(transform_large_functions, code, details)
+
+def transform_data_clumps(tree, details=None):
     # Detects repeated parameter groups and refactors them into a dataclass
-    tree = ast.parse(code)
 
     class DataClumpExtractor(ast.NodeTransformer):
         def visit_FunctionDef(self, node):
@@ -255,12 +275,17 @@ def refactor_data_clumps(code, details=None):
 
     tree = DataClumpExtractor().visit(tree)
     ast.fix_missing_locations(tree)
-    return astor.to_source(tree)
+    return tree
+
+def refactor_data_clumps(code, details=None):
+    return _round_trip(transform_data_clumps, code, details)
 
 def refactor_shotgun_surgery(code, details=None):
-    for loc in details:
-        # Add a comment indicating the location is affected by shotgun surgery
-        code = code.replace(loc, f"# Shotgun surgery: Refactor to group related logic\n{loc}")
+    # details is the smell description: "... - [('name', calls), ...]"
+    for name in re.findall(r"\('(\w+)', \d+\)", details or ""):
+        # Add a comment above the definition of each function called from too many places
+        code = re.sub(rf"^([ \t]*)def {name}\(", rf"\1# Shotgun surgery: Refactor to group related logic\n\1def {name}(",
+                      code, flags=re.MULTILINE)
     return code
 
 
@@ -305,15 +330,108 @@ REFACTOR_FUNCTIONS = {
     "large_file": refactor_large_file,
 }
 
+# Refactorings that work on the tree; the others in REFACTOR_FUNCTIONS edit the source text
+TREE_TRANSFORMS = {
+    "useless_exceptions": transform_useless_exceptions,
+    "dead_code_variables": transform_dead_code_variables,
+    "large_classes": transform_large_classes,
+    "too_many_returns": transform_too_many_returns,
+    "large_functions": transform_large_functions,
+    "data_clumps": transform_data_clumps,
+    "high_complexity_functions": transform_high_complexity,
+    "low_maintainability": transform_low_maintainability,
+    "deeply_nested_functions": transform_deeply_nested_functions,
+}
+
+def _smell_type(smell_description):
+    for keyword, smell_type in SMELL_KEYWORDS.items():
+        if keyword in smell_description:
+            return smell_type
+    return None
+
+def _refactor_step(code, smell_type, details):
+    try:
+        return REFACTOR_FUNCTIONS[smell_type](code, details)
+    except Exception as e:
+        print(f"Error while refactoring {smell_type}: {e}")
+        return code
+
+def _refactor_steps(code, steps):
+    """Apply each refactoring to the source on its own (tree ones parse and regenerate every time)."""
+    for smell_type, details in steps:
+        code = _refactor_step(code, smell_type, details)
+    return code
+
+# astor doubles the backslashes in f-string expressions every time it writes them
+F_STRING = re.compile(r"""(?<![\w'"])[rRbBuU]?[fF][rR]?['"]""")
+
+def _escapes_in_f_strings(tree):
+    """Whether a string inside an f-string expression of ``tree`` is written with a backslash."""
+    for node in ast.walk(tree):
+        if isinstance(node, ast.FormattedValue):
+            for inner in ast.walk(node):
+                if isinstance(inner, ast.Constant) and isinstance(inner.value, (str, bytes)) \
+                        and "\\" in repr(inner.value):
+                    return True
+    return False
+
+def _round_trips(source, tree):
+    """Whether ``source``, which astor wrote for ``tree``, parses and astor writes it back unchanged."""
+    reparsed = ast.parse(source)
+    if not F_STRING.search(source) or not _escapes_in_f_strings(tree):
+        return True  # only those f-strings change when written again
+    return astor.to_source(reparsed) == source
+
+def _regenerate(code, tree, steps):
+    """Source of ``tree``, which is ``code`` with the tree refactorings ``steps`` applied.
+
+    Applied one by one, every refactoring after the first parses what astor
+    wrote for the previous one. Where that isn't the same tree (astor can't
+    write every tree, e.g. a body emptied by dead code removal) the result
+    differs, so then ``steps`` are redone one by one.
+    """
+    try:
+        source = astor.to_source(tree)
+        if len(steps) > 1 and not _round_trips(source, tree):
+            return _refactor_steps(code, steps)
+        return source
+    except Exception:
+        return _refactor_steps(code, steps)
+
 def refactor_python_code(code: str, smell_list: list) -> str:
-    for smell_description in smell_list:
-        for keyword, smell_type in SMELL_KEYWORDS.items():
-            if keyword in smell_description:
-                refactor_fn = REFACTOR_FUNCTIONS.get(smell_type)
-                if refactor_fn:
-                    try:
-                        code = refactor_fn(code, smell_description)
-                    except Exception as e:
-                        print(f"Error while refactoring {smell_type}: {e}")
-                break
+    """Apply the refactoring of each smell in ``smell_list``, in order.
+
+    A run of tree refactorings parses the code once, transforms the same tree
+    and regenerates the source once; text refactorings get the source
+    regenerated so far. The result is the same as applying each refactoring
+    to the source on its own: when one fails halfway through a shared tree,
+    the run is redone that way.
+    """
+    steps = [(smell_type, smell_description) for smell_description in smell_list
+             for smell_type in [_smell_type(smell_description)] if smell_type in REFACTOR_FUNCTIONS]
+    tree = None
+    pending = []  # tree refactorings applied to ``tree`` but not yet to ``code``
+    for smell_type, details in steps:
+        transform = TREE_TRANSFORMS.get(smell_type)
+        if transform is None:
+            if pending:
+                code = _regenerate(code, tree, pending)
+                tree, pending = None, []
+            code = _refactor_step(code, smell_type, details)
+            continue
+        if tree is None:
+            try:
+                tree = ast.parse(code)
+            except Exception as e:
+                print(f"Error while refactoring {smell_type}: {e}")
+                continue
+        pending.append((smell_type, details))
+        try:
+            tree = transform(tree, details)
+        except Exception:
+            # The tree may be half transformed.
+            code = _refactor_steps(code, pending)
+            tree, pending = None, []
+    if pending:
+        code = _regenerate(code, tree, pending)
     return code
@@ -1,38 +1,117 @@
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, Response, request, jsonify
 from flask_cors import CORS
-from detector.app import analyze_repo
+from detector.jobs import JobManager, JobQueueFull
+from detector.timing import record_request, render_metrics
+import threading
 import traceback
+import time
+import json
+from datetime import datetime, timedelta, timezone
 from dotenv import load_dotenv
 import os
-from langchain_groq import ChatGroq
-from langchain.schema import HumanMessage
 import re
-from refactor.js_refactor import refactor_js_code
-from refactor.py_refactor import refactor_python_code
+
+# GitPython, radon, astor and langchain take most of the startup time, so the
+# analysis, refactoring and LLM modules are imported by the routes that use
+# them, on their first request; importing this module stays cheap.
 
 load_dotenv()  # loads .env file
-ref = ChatGroq(
-    temperature=0.6,
-    max_tokens=4096,
-    groq_api_key=os.getenv("GROQ_API_KEY"),  # Fetch API key securely from environment
-    model_name="deepseek-r1-distill-llama-70b"  # Model name for ChatGroq
-)
-
-app = Flask(__name__)
-CORS(app, resources={r"/analyze": {"origins": "*"}})
-CORS(app, resources={r"/refactor_code_ref": {"origins": "http://localhost:8000"}})
-app.config['JSONIFY_PRETTYPRINT_REGULAR'] = False
-app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024
-
-@app.route("/analyze", methods=["POST"])
+# Everything that shapes the model's answer; also part of the response cache key.
+LLM_PARAMS = {
+    "temperature": 0.6,
+    "max_tokens": 4096,
+    "model_name": "deepseek-r1-distill-llama-70b"  # Model name for ChatGroq
+}
+_llm = None
+_refactor_cache = None
+_lazy_lock = threading.Lock()
+
+def get_llm():
+    """The ChatGroq client, built on first use."""
+    global _llm
+    with _lazy_lock:
+        if _llm is None:
+            from langchain_groq import ChatGroq
+            _llm = ChatGroq(
+                groq_api_key=os.getenv("GROQ_API_KEY"),  # Fetch API key securely from environment
+                **LLM_PARAMS
+            )
+    return _llm
+
+def get_refactor_cache():
+    global _refactor_cache
+    with _lazy_lock:
+        if _refactor_cache is None:
+            from refactor.llm_cache import ResponseCache
+            _refactor_cache = ResponseCache()
+    return _refactor_cache
+
+api = Blueprint("api", __name__)
+
+def create_app():
+    """The Flask app; WSGI servers load it with ``server:create_app()``."""
+    app = Flask(__name__)
+    CORS(app, resources={r"/analyze": {"origins": "*"}})
+    CORS(app, resources={r"/jobs": {"origins": "*"}})
+    CORS(app, resources={r"/source": {"origins": "*"}})
+    CORS(app, resources={r"/reports": {"origins": "*"}})
+    CORS(app, resources={r"/reports/commits": {"origins": "*"}})
+    CORS(app, resources={r"/history": {"origins": "*"}})
+    CORS(app, resources={r"/history/series": {"origins": "*"}})
+    CORS(app, resources={r"/refactor_code_ref": {"origins": "http://localhost:8000"}})
+    CORS(app, resources={r"/refactor_code_ref/stream": {"origins": "http://localhost:8000"}})
+    app.config['JSONIFY_PRETTYPRINT_REGULAR'] = False
+    app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024
+    app.register_blueprint(api)
+    return app
+
+def iter_analysis(repo_url):
+    from detector.app import iter_repo_analysis
+    from detector.incremental import INCREMENTAL_ANALYSIS, iter_repo_analysis_incremental
+    if INCREMENTAL_ANALYSIS:
+        return iter_repo_analysis_incremental(repo_url)
+    return iter_repo_analysis(repo_url)
+
+def lean_analysis(events):
+    """Like collect_analysis, but files carry their path instead of their source."""
+    from detector.app import build_report
+    entries = []
+    results = {}
+    for event, payload in events:
+        if event == "file":
+            entries.append(payload)
+        elif event == "done":
+            results = payload
+    report, smell_report = build_report(entries, include_code=False)
+    return {"python": report, "javascript": smell_report, "clones": results.get("clones", []),
+            "near_duplicates": results.get("near_duplicates", []), "metadata": results.get("metadata", {})}
+
+def iter_history(repo_url, since=None):
+    from detector.history import iter_history
+    return iter_history(repo_url, since)
+
+jobs = JobManager(iter_analysis)
+history_jobs = JobManager(iter_history)
+COMMIT_SHA = re.compile(r"[0-9a-f]{40}|[0-9a-f]{64}")
+
+@api.route("/analyze", methods=["POST"])
 def analyze():
+    from detector.app import analyze_repo
+    from detector.incremental import INCREMENTAL_ANALYSIS, analyze_repo_incremental
     try:
         data = request.get_json()
         repo_url = data.get("repo_url")
         if not repo_url:
             return jsonify({"error": "Missing 'repo_url' in request body"}), 400
 
-        results = analyze_repo(repo_url)
+        started = time.perf_counter()
+        if not data.get("include_code", True):
+            # Lean mode: sources are fetched from /source when needed.
+            results = lean_analysis(iter_analysis(repo_url))
+        elif INCREMENTAL_ANALYSIS:
+            results = analyze_repo_incremental(repo_url)
+        else:
+            results = analyze_repo(repo_url)
 
         # Transform results to include just the file names as keys
         transformed = {
@@ -44,26 +123,258 @@ def analyze():
                 os.path.basename(path): details
                 for path, details in results["javascript"].items()
             },
+            "clones": results.get("clones", []),
+            "near_duplicates": results.get("near_duplicates", []),
             "metadata": results.get("metadata", {})
         }
+        record_request("/analyze", "analysis", time.perf_counter() - started)
 
-        return jsonify(transformed)
+        started = time.perf_counter()
+        response = jsonify(transformed)
+        record_request("/analyze", "serialize", time.perf_counter() - started)
+        return response
 
     except Exception as e:
         print(f"[SERVER ERROR] {traceback.format_exc()}")  # Optional: log full traceback
         return jsonify({"error": f"Backend error: {str(e)}"}), 500
 
-def extract_code_from_response(response_text):
-    code_blocks = re.findall(r"```(?:\w*\n)?(.*?)```", response_text, re.DOTALL)
-    if code_blocks:
-        return code_blocks[0].strip()
-    return response_text.strip()
+@api.route("/analyze/stream", methods=["POST"])
+def analyze_stream():
+    """Same analysis as /analyze, streamed as NDJSON while it runs.
+
+    Records: one "start" with the file counts, one "file" (or "file_error")
+    per file as soon as it is analyzed, then "done" with the repo-wide duplicates and metadata. A
+    failure after the stream has started is sent as a final "error" record.
+    With ``"include_code": false`` file records leave out the source.
+    """
+    data = request.get_json()
+    repo_url = data.get("repo_url")
+    if not repo_url:
+        return jsonify({"error": "Missing 'repo_url' in request body"}), 400
+
+    include_code = data.get("include_code", True)
+    events = iter_analysis(repo_url)
+
+    def generate():
+        try:
+            for event, payload in events:
+                if event == "start":
+                    payload = {"metadata": payload}
+                elif event == "done":
+                    # files were already sent
+                    payload = {key: value for key, value in payload.items() if key not in ("python", "javascript")}
+                elif not include_code:
+                    payload = {key: value for key, value in payload.items() if key != "code"}
+                yield json.dumps({"type": event, **payload}) + "\n"
+        except Exception as e:
+            print(f"[SERVER ERROR] {traceback.format_exc()}")
+            yield json.dumps({"type": "error", "error": f"Backend error: {str(e)}"}) + "\n"
+
+    return Response(generate(), mimetype="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+
+@api.route("/jobs", methods=["POST"])
+def create_job():
+    """Queue an analysis and return its id right away (202); poll /jobs/<id> for progress."""
+    data = request.get_json()
+    repo_url = data.get("repo_url")
+    if not repo_url:
+        return jsonify({"error": "Missing 'repo_url' in request body"}), 400
+    try:
+        job = jobs.submit(repo_url)
+    except JobQueueFull as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "30"}
+
+    status_url = f"/jobs/{job.id}"
+    body = job.to_dict()
+    body.update({"status_url": status_url, "result_url": f"{status_url}/result"})
+    return jsonify(body), 202, {"Location": status_url}
+
+def find_job(job_id):
+    return jobs.get(job_id) or history_jobs.get(job_id)
+
+@api.route("/jobs/<job_id>", methods=["GET"])
+def job_status(job_id):
+    job = find_job(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job id"}), 404
+    return jsonify(job.to_dict())
+
+@api.route("/jobs/<job_id>/result", methods=["GET"])
+def job_result(job_id):
+    """The finished report, in the same shape as /analyze; 202 with the status while still running."""
+    job = find_job(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job id"}), 404
+    if job.status == "failed":
+        return jsonify({"error": f"Backend error: {job.error}"}), 500
+    if job.status != "done":
+        return jsonify(job.to_dict()), 202
+    return jsonify(job.result)
+
+@api.route("/source", methods=["GET"])
+def source():
+    """Source of one file by ``repo_url``, ``commit`` and ``path``, optionally ``start``-``end`` lines (1-based, inclusive).
+
+    A commit's file never changes, so the response is cacheable forever and
+    its ETag is the blob id (plus the line range).
+    """
+    repo_url = request.args.get("repo_url")
+    commit = request.args.get("commit", "").lower()
+    path = request.args.get("path")
+    if not repo_url or not path:
+        return jsonify({"error": "Missing 'repo_url' or 'path' query parameter"}), 400
+    if not COMMIT_SHA.fullmatch(commit):
+        return jsonify({"error": "'commit' must be a full commit sha"}), 400
+    try:
+        start = int(request.args.get("start", 1))
+        end = int(request.args["end"]) if "end" in request.args else None
+    except ValueError:
+        return jsonify({"error": "'start' and 'end' must be line numbers"}), 400
+    if start < 1 or (end is not None and end < start):
+        return jsonify({"error": "Invalid line range"}), 400
+
+    from detector.app import decode_source
+    from detector.incremental import read_source
+    try:
+        blob_sha, content = read_source(repo_url, commit, path)
+    except FileNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        print(f"[SERVER ERROR] {traceback.format_exc()}")
+        return jsonify({"error": f"Backend error: {str(e)}"}), 500
+
+    code = decode_source(content)
+    etag = blob_sha
+    if start > 1 or end is not None:
+        code = "".join(code.splitlines(keepends=True)[start - 1:end])
+        etag = f"{blob_sha}:{start}-{end or ''}"
+
+    response = Response(code, mimetype="text/plain")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response.make_conditional(request)
+
+@api.route("/reports", methods=["GET"])
+def stored_report():
+    """A stored report by ``repo_url`` and ``commit`` (the latest analyzed one when left out), without re-analysis.
+
+    Same shape as /analyze with ``"include_code": false``. ``path`` keeps only
+    that file or folder, ``smell`` only files with that smell type (e.g.
+    "Large Functions"); ``metadata`` also carries ``analyzed_at``.
+    """
+    repo_url = request.args.get("repo_url")
+    commit = request.args.get("commit", "").lower() or None
+    if not repo_url:
+        return jsonify({"error": "Missing 'repo_url' query parameter"}), 400
+    if commit is not None and not COMMIT_SHA.fullmatch(commit):
+        return jsonify({"error": "'commit' must be a full commit sha"}), 400
 
-@app.route('/refactor_code_ref', methods=['POST'])
+    from detector.app import build_report
+    from detector.report_store import report_store
+    stored = report_store().load(repo_url, commit, request.args.get("path"), request.args.get("smell"))
+    if stored is None:
+        return jsonify({"error": "No stored report for this repository and commit"}), 404
+
+    report, smell_report = build_report([entry for entry in stored["files"] if "error" not in entry], include_code=False)
+    metadata = {**stored["metadata"], "commit": stored["commit"], "analyzed_at": stored["analyzed_at"]}
+    return jsonify({"python": report, "javascript": smell_report, "clones": stored["clones"],
+                    "near_duplicates": stored["near_duplicates"], "metadata": metadata})
+
+@api.route("/reports/commits", methods=["GET"])
+def stored_commits():
+    """Commits of ``repo_url`` with a stored report, newest first."""
+    repo_url = request.args.get("repo_url")
+    if not repo_url:
+        return jsonify({"error": "Missing 'repo_url' query parameter"}), 400
+    from detector.report_store import report_store
+    return jsonify({"repo": repo_url, "commits": report_store().commits(repo_url)})
+
+@api.route("/history", methods=["POST"])
+def record_history():
+    """Queue a walk over the commits of ``repo_url`` made ``since`` (default HISTORY_SINCE) that fills the smell history.
+
+    Returns a job (202) like /jobs; its progress counts the distinct file
+    versions to analyze. Query the result with /history/series.
+    """
+    data = request.get_json()
+    repo_url = data.get("repo_url")
+    if not repo_url:
+        return jsonify({"error": "Missing 'repo_url' in request body"}), 400
+    from detector.history import SINCE
+    since = data.get("since")
+    if since is not None and not SINCE.fullmatch(since):
+        return jsonify({"error": "'since' must be a date like 2024-06-01 or '6 months ago'"}), 400
+    try:
+        job = history_jobs.submit(repo_url, since=since)
+    except JobQueueFull as e:
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "30"}
+
+    status_url = f"/jobs/{job.id}"
+    body = job.to_dict()
+    body.update({"status_url": status_url, "result_url": f"{status_url}/result"})
+    return jsonify(body), 202, {"Location": status_url}
+
+@api.route("/history/series", methods=["GET"])
+def history_series():
+    """Time series of a smell total (``smell``, all smells when left out) or a metric sum (``metric``) from the smell history.
+
+    One point per ``interval`` (day, week or month; default week) with the
+    state of its last commit, for the whole repo or the file/folder ``path``,
+    optionally between the dates ``since`` and ``until`` (YYYY-MM-DD, UTC).
+    """
+    repo_url = request.args.get("repo_url")
+    if not repo_url:
+        return jsonify({"error": "Missing 'repo_url' query parameter"}), 400
+    try:
+        since, until = (datetime.strptime(request.args[name], "%Y-%m-%d").replace(tzinfo=timezone.utc)
+                        if name in request.args else None for name in ("since", "until"))
+    except ValueError:
+        return jsonify({"error": "'since' and 'until' must be dates (YYYY-MM-DD)"}), 400
+
+    from detector.report_store import report_store
+    options = {name: request.args.get(name) for name in ("smell", "metric", "path")}
+    interval = request.args.get("interval", "week")
+    try:
+        points = report_store().series(repo_url, interval=interval,
+                                       since=since and int(since.timestamp()),
+                                       until=until and int((until + timedelta(days=1)).timestamp()) - 1, **options)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"repo": repo_url, "interval": interval, **options, "points": points})
+
+@api.route("/metrics", methods=["GET"])
+def metrics():
+    """Prometheus histograms of pipeline stage, detector and request timings (empty with ANALYSIS_TIMING=0)."""
+    return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+def llm_refactor(code, smells, template):
+    """Refactor ``code`` with the LLM, or serve the answer to an identical earlier request.
+
+    Returns ``(refactored code, cache tier)``; the tier is None when the model was called.
+    """
+    from refactor.llm_refactor import build_prompt, extract_code_from_response
+    refactor_cache = get_refactor_cache()
+    # Same code, smells, prompt and model: serve the earlier answer.
+    cache_key = refactor_cache.key(code, smells, template, LLM_PARAMS)
+    refactored_code, tier = refactor_cache.get(cache_key)
+    if refactored_code is not None:
+        return refactored_code, tier
+
+    from langchain.schema import HumanMessage
+    response = get_llm().invoke([HumanMessage(content=build_prompt(template, code, smells))])
+    full_response = response.content if hasattr(response, 'content') else str(response)
+    refactored_code = extract_code_from_response(full_response)
+    refactor_cache.put(cache_key, refactored_code)
+    return refactored_code, None
+
+@api.route('/refactor_code_ref', methods=['POST'])
 def refactor_code_ref():
+    from detector.git_source import language_of
+    from refactor.llm_refactor import plan_chunks, refactor_in_chunks
     data = request.get_json()
     input_code = data.get("code", "")
     input_smells = data.get("fileSmells", [])
+    language = language_of(data.get("filename") or "")
 
     # print(input_smells)
 
@@ -74,24 +385,103 @@ def refactor_code_ref():
         with open("refactor.txt", "r") as file:
             text_template = file.read()
 
-        smell_text = "\n".join([f"{i+1}. {smell}" for i, smell in enumerate(input_smells)])
+        chunks = plan_chunks(input_code, language, input_smells) if language else None
+        if chunks is None:
+            refactored_code, tier = llm_refactor(input_code, input_smells, text_template)
+            return jsonify({"refactored_code": refactored_code}), 200, {"X-Refactor-Cache": f"hit-{tier}" if tier else "miss"}
 
-        text = (
-            text_template
-            .replace("{input_code}", input_code)
-            .replace("{smells}", smell_text)
-        )
-        
-        text = text.replace("{input_code}", input_code)
-
-        response = ref.invoke([HumanMessage(content=text)])
-        full_response = response.content if hasattr(response, 'content') else str(response)
-        refactored_code = extract_code_from_response(full_response)
-        return jsonify({"refactored_code": refactored_code})
+        # Large file: only its smelly functions/classes go to the model, a few at a time.
+        refactored_code, replaced = refactor_in_chunks(
+            input_code, language, chunks, lambda code, smells: llm_refactor(code, smells, text_template)[0])
+        return jsonify({"refactored_code": refactored_code}), 200, {"X-Refactor-Chunks": f"{replaced}/{len(chunks)}"}
 
     except Exception as e:
         print(f"Error: {traceback.format_exc()}")
         return jsonify({"error": str(e)}), 500
 
+def iter_llm_refactor(code, smells, template, outcome):
+    """Like llm_refactor, but yields the refactored code piece by piece as the model writes it.
+
+    Sets ``outcome["cache"]`` to the cache tier, or None when the model was called.
+    """
+    from refactor.llm_refactor import CodeStream, build_prompt
+    refactor_cache = get_refactor_cache()
+    cache_key = refactor_cache.key(code, smells, template, LLM_PARAMS)
+    refactored_code, outcome["cache"] = refactor_cache.get(cache_key)
+    if refactored_code is not None:
+        yield refactored_code
+        return
+
+    from langchain.schema import HumanMessage
+    stream = CodeStream()
+    pieces = []
+    for message in get_llm().stream([HumanMessage(content=build_prompt(template, code, smells))]):
+        piece = stream.feed(message.content if hasattr(message, 'content') else str(message))
+        if piece:
+            pieces.append(piece)
+            yield piece
+    piece = stream.close()
+    if piece:
+        pieces.append(piece)
+        yield piece
+    # Only a complete answer is cached: a client that disconnects stops this generator early.
+    refactor_cache.put(cache_key, "".join(pieces))
+
+@api.route('/refactor_code_ref/stream', methods=['POST'])
+def refactor_code_stream():
+    """Same refactoring as /refactor_code_ref, streamed as NDJSON while the model writes it.
+
+    Records: "code" records carrying the next piece of the refactored code
+    (reasoning and code fences already stripped) to append to the previous
+    ones, then "done" with ``cache`` ("hit-memory", "hit-disk" or "miss")
+    or, for a file refactored in chunks, ``chunks`` (replaced/total). A
+    failure after the stream has started is sent as a final "error" record.
+    """
+    from detector.git_source import language_of
+    from refactor.llm_refactor import iter_chunk_pieces, plan_chunks
+    data = request.get_json()
+    input_code = data.get("code", "")
+    input_smells = data.get("fileSmells", [])
+    language = language_of(data.get("filename") or "")
+    if not input_code.strip():
+        return jsonify({"error": "No code provided"}), 400
+
+    def generate():
+        started = time.perf_counter()
+        first = True
+        try:
+            with open("refactor.txt", "r") as file:
+                text_template = file.read()
+
+            chunks = plan_chunks(input_code, language, input_smells) if language else None
+            if chunks is None:
+                outcome = {}
+                pieces = ((piece, False) for piece in iter_llm_refactor(input_code, input_smells, text_template, outcome))
+            else:
+                pieces = iter_chunk_pieces(input_code, language, chunks,
+                                           lambda code, smells: llm_refactor(code, smells, text_template)[0])
+
+            replaced = 0
+            for text, chunk_replaced in pieces:
+                replaced += chunk_replaced
+                if not text:
+                    continue
+                if first:
+                    record_request("/refactor_code_ref/stream", "first_code", time.perf_counter() - started)
+                    first = False
+                yield json.dumps({"type": "code", "text": text}) + "\n"
+
+            if chunks is None:
+                done = {"cache": f"hit-{outcome['cache']}" if outcome["cache"] else "miss"}
+            else:
+                done = {"chunks": f"{replaced}/{len(chunks)}"}
+            record_request("/refactor_code_ref/stream", "total", time.perf_counter() - started)
+            yield json.dumps({"type": "done", **done}) + "\n"
+        except Exception as e:
+            print(f"Error: {traceback.format_exc()}")
+            yield json.dumps({"type": "error", "error": str(e)}) + "\n"
+
+    return Response(generate(), mimetype="application/x-ndjson", headers={"X-Accel-Buffering": "no"})
+
 if __name__ == "__main__":
-    app.run(port=5000, debug=True, host='0.0.0.0')
\ No newline at end of file
+    create_app().run(port=5000, debug=True, host='0.0.0.0')
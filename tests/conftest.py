@@ -0,0 +1,53 @@
+import os
+
+import git
+import pytest
+
+from detector import incremental, report_store
+
+AUTHOR = git.Actor("Test", "test@example.com")
+
+
+class Remote:
+    """A bare repository plus a working clone that commits and pushes to it."""
+
+    def __init__(self, root):
+        self.url = os.path.join(root, "remote.git")
+        git.Repo.init(self.url, bare=True).close()
+        self.work = git.Repo.clone_from(self.url, os.path.join(root, "work"))
+
+    def write(self, path, code):
+        target = os.path.join(self.work.working_dir, *path.split("/"))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "w", encoding="utf-8", newline="\n") as f:
+            f.write(code)
+        self.work.index.add([path])
+
+    def remove(self, path):
+        self.work.index.remove([path], working_tree=True)
+
+    def rename(self, old, new):
+        self.work.git.mv(old, new)
+
+    def push(self, message, date=None):
+        """Commit what is staged, at ``date`` ("2024-01-01T09:00:00+0000") when given, and push it."""
+        self.work.index.commit(message, author=AUTHOR, committer=AUTHOR, author_date=date, commit_date=date)
+        self.work.git.push("origin", "HEAD:refs/heads/master")
+        return self.work.head.commit.hexsha
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    """A report store and repo state directory of the test's own."""
+    monkeypatch.setattr(incremental, "STATE_DIR", str(tmp_path / "state"))
+    store = report_store.ReportStore(str(tmp_path / "reports.sqlite3"))
+    monkeypatch.setattr(report_store, "_store", store)
+    yield store
+    store.flush()
+
+
+@pytest.fixture
+def bare_remote(tmp_path):
+    remote = Remote(str(tmp_path))
+    yield remote
+    remote.work.close()
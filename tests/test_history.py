@@ -0,0 +1,116 @@
+"""Smell history of a local bare repository with dated commits, and its weekly series."""
+from detector.app import collect_analysis
+from detector.cache import AnalysisCache
+from detector.history import iter_history
+from detector.jobs import JobManager
+
+
+def many_returns(name, param):
+    """A function with four returns: "Too Many Returns (>3)", and its parameter counts as a global."""
+    return (f"def {name}({param}):\n"
+            + "".join(f"    if {param} == {i}:\n        return {i}\n" for i in range(3))
+            + f"    return {param}\n\n\n")
+
+
+NESTED_JS = (
+    "// nested checks\n"
+    "function check(a) {\n"
+    "  if (a) {\n"
+    "    if (a.b) {\n"
+    "      if (a.b.c) {\n"
+    "        if (a.b.c.d) {\n"
+    "          return a.b.c.d * 42 + 7;\n"
+    "        }\n"
+    "      }\n"
+    "    }\n"
+    "  }\n"
+    "  return 0;\n"
+    "}\n"
+)
+
+
+def walk(url):
+    return collect_analysis(iter_history(url, "2023-12-31", workers=1, cache=AnalysisCache(max_bytes=0)))
+
+
+def build_history(remote):
+    # app.py: Too Many Returns 1, Global Variables 1 -> 2 smells.
+    # ui.js: Deep Nesting (5 levels) 1, Magic Numbers 2, Long Chained Calls 2, Duplicate Code Blocks 1 -> 6 smells.
+    remote.write("app.py", many_returns("one", "x"))
+    remote.write("static/ui.js", NESTED_JS)
+    remote.push("Add app and ui", "2024-01-01T09:00:00+0000")                   # week of 01-01: 8
+    # app.py: Too Many Returns 2, Global Variables 2 -> 4 smells.
+    remote.write("app.py", many_returns("one", "x") + many_returns("two", "y"))
+    remote.push("Add two", "2024-01-03T09:00:00+0000")                          # week of 01-01: 10
+    remote.remove("static/ui.js")
+    remote.push("Drop ui", "2024-01-15T09:00:00+0000")                          # week of 01-15: 4
+    # Same second as the previous commit: only the mainline order tells them apart.
+    remote.write("app.py", many_returns("one", "x"))
+    return remote.push("Drop two", "2024-01-15T09:00:00+0000")                  # week of 01-15: 2
+
+
+def values(points):
+    return [(point["period"], point["value"]) for point in points]
+
+
+def test_history_walks_every_mainline_commit(store, bare_remote):
+    head = build_history(bare_remote)
+    metadata = walk(bare_remote.url)["metadata"]
+    assert metadata["commit"] == head
+    assert metadata["commits"] == metadata["new_commits"] == 4
+    # Versions: app.py x3 (the last is the first again), ui.js x1.
+    assert metadata["blobs"] == 3
+    assert metadata["python_files"] + metadata["js_files"] == 3
+    assert len(store.dated_commits(bare_remote.url)) == 4
+
+
+def test_weekly_series_of_all_smells_and_one_type(store, bare_remote):
+    head = build_history(bare_remote)
+    walk(bare_remote.url)
+    points = store.series(bare_remote.url, interval="week")
+    # The week without commits repeats the previous one.
+    assert values(points) == [("2024-01-01", 10), ("2024-01-08", 10), ("2024-01-15", 2)]
+    assert points[-1]["commit"] == head
+    assert values(store.series(bare_remote.url, smell="Too Many Returns", interval="week")) == [
+        ("2024-01-01", 2), ("2024-01-08", 2), ("2024-01-15", 1)]
+    # A measurement counts once, not as its nesting depth.
+    assert values(store.series(bare_remote.url, smell="Deep Nesting", interval="week")) == [
+        ("2024-01-01", 1), ("2024-01-08", 1), ("2024-01-15", 0)]
+    assert values(store.series(bare_remote.url, interval="week", path="static")) == [
+        ("2024-01-01", 6), ("2024-01-08", 6), ("2024-01-15", 0)]
+
+
+def test_second_walk_reuses_the_history(store, bare_remote):
+    build_history(bare_remote)
+    walk(bare_remote.url)
+    bare_remote.write("app.py", many_returns("one", "x") + many_returns("three", "z"))
+    bare_remote.push("Add three", "2024-01-22T09:00:00+0000")
+    metadata = walk(bare_remote.url)["metadata"]
+    assert metadata["new_commits"] == 1
+    assert metadata["python_files"] + metadata["js_files"] == 1
+    assert values(store.series(bare_remote.url, interval="week"))[-1] == ("2024-01-22", 4)
+
+
+def test_history_routes(store, bare_remote, monkeypatch):
+    import server
+
+    build_history(bare_remote)
+    history_jobs = JobManager(iter_history, workers=1)
+    monkeypatch.setattr(server, "history_jobs", history_jobs)
+    client = server.create_app().test_client()
+    try:
+        response = client.post("/history", json={"repo_url": bare_remote.url, "since": "2023-12-31"})
+        assert response.status_code == 202
+        history_jobs._pool.submit(lambda: None).result()  # the single worker has finished the walk
+    finally:
+        history_jobs._pool.shutdown(wait=True)
+    assert client.get(f"/jobs/{response.get_json()['job_id']}").get_json()["status"] == "done"
+
+    response = client.get("/history/series", query_string={
+        "repo_url": bare_remote.url, "smell": "Too Many Returns", "since": "2024-01-08", "until": "2024-01-31"})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert (body["interval"], body["smell"]) == ("week", "Too Many Returns")
+    assert values(body["points"]) == [("2024-01-15", 1)]
+    assert client.get("/history/series", query_string={"repo_url": bare_remote.url, "interval": "year"}) \
+        .status_code == 400
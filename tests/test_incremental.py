@@ -0,0 +1,103 @@
+"""Incremental analysis against local bare repositories, checked against a full analyze_repo run."""
+import pytest
+
+from detector.app import analyze_repo
+from detector.cache import AnalysisCache
+from detector.incremental import analyze_repo_incremental
+
+SOURCES = {
+    "app.py": "def total(items):\n    result = 0\n    for item in items:\n        result += item * 42\n    return result\n",
+    "pkg/helpers.py": "import os\n\n\ndef home():\n    return os.path.expanduser('~')\n",
+    "static/ui.js": "function show(value) {\n  console.log(value * 7);\n  return value;\n}\n",
+}
+
+
+@pytest.fixture
+def remote(store, bare_remote):
+    for path, code in SOURCES.items():
+        bare_remote.write(path, code)
+    bare_remote.push("Initial commit")
+    return bare_remote
+
+
+def analyze(url):
+    # No content cache, so whatever is reused comes from the incremental state.
+    return analyze_repo_incremental(url, workers=1, cache=AnalysisCache(max_bytes=0))
+
+
+def assert_matches_full_analysis(result, url):
+    full = analyze_repo(url, workers=1, cache=AnalysisCache(max_bytes=0))
+    for key in ("python", "javascript", "clones", "near_duplicates"):
+        assert result[key] == full[key]
+    assert result["metadata"]["commit"] == full["metadata"]["commit"]
+
+
+def test_first_run_analyzes_everything(remote):
+    result = analyze(remote.url)
+    assert result["metadata"]["base_commit"] is None
+    assert result["metadata"]["reanalyzed_files"] == len(SOURCES)
+    assert_matches_full_analysis(result, remote.url)
+
+
+def test_unchanged_head_reuses_every_file(remote):
+    first = analyze(remote.url)
+    result = analyze(remote.url)
+    assert result["metadata"]["base_commit"] == first["metadata"]["commit"]
+    assert result["metadata"]["reanalyzed_files"] == 0
+    assert_matches_full_analysis(result, remote.url)
+
+
+def test_added_file(remote):
+    analyze(remote.url)
+    remote.write("pkg/extra.py", "def extra(a, b, c, d, e, f):\n    return a + b + c + d + e + f\n")
+    head = remote.push("Add a file")
+    result = analyze(remote.url)
+    assert result["metadata"]["commit"] == head
+    assert result["metadata"]["reanalyzed_files"] == 1
+    assert "extra.py" in result["python"]
+    assert_matches_full_analysis(result, remote.url)
+
+
+def test_modified_file(remote):
+    analyze(remote.url)
+    remote.write("static/ui.js", SOURCES["static/ui.js"] + "var unused = 3600;\n")
+    remote.push("Modify a file")
+    result = analyze(remote.url)
+    assert result["metadata"]["reanalyzed_files"] == 1
+    assert result["javascript"]["ui.js"]["code"].endswith("var unused = 3600;\n")
+    assert_matches_full_analysis(result, remote.url)
+
+
+def test_deleted_file(remote):
+    analyze(remote.url)
+    remote.remove("pkg/helpers.py")
+    remote.push("Delete a file")
+    result = analyze(remote.url)
+    assert result["metadata"]["reanalyzed_files"] == 0
+    assert "helpers.py" not in result["python"]
+    assert_matches_full_analysis(result, remote.url)
+
+
+def test_renamed_file(remote):
+    analyze(remote.url)
+    remote.rename("pkg/helpers.py", "pkg/paths.py")
+    remote.push("Rename a file")
+    result = analyze(remote.url)
+    # Renames count as a delete plus an add.
+    assert result["metadata"]["reanalyzed_files"] == 1
+    assert "helpers.py" not in result["python"] and "paths.py" in result["python"]
+    assert_matches_full_analysis(result, remote.url)
+
+
+def test_all_changes_in_one_push(remote):
+    analyze(remote.url)
+    remote.write("pkg/extra.py", "def extra():\n    return 1\n")
+    remote.write("app.py", SOURCES["app.py"] + "\n\nLIMIT = 99\n")
+    remote.remove("static/ui.js")
+    remote.rename("pkg/helpers.py", "pkg/paths.py")
+    remote.push("Add, modify, delete and rename")
+    result = analyze(remote.url)
+    assert result["metadata"]["reanalyzed_files"] == 3
+    assert sorted(result["python"]) == ["app.py", "extra.py", "paths.py"]
+    assert result["javascript"] == {}
+    assert_matches_full_analysis(result, remote.url)
@@ -0,0 +1,51 @@
+"""Background analysis jobs."""
+import threading
+
+from detector.jobs import JobManager
+
+
+class BlockingAnalysis:
+    """An analysis that stays running until ``release`` is set."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = []
+
+    def __call__(self, repo_url, **options):
+        self.calls.append((repo_url, options))
+        yield "start", {"python_files": 1, "js_files": 0}
+        self.release.wait(5)
+        yield "file", {}
+        yield "done", {"metadata": {"repo": repo_url, **options}}
+
+
+def test_active_job_is_shared_only_with_the_same_options():
+    analysis = BlockingAnalysis()
+    manager = JobManager(analysis, workers=4)
+    try:
+        default = manager.submit("https://example.com/repo.git")
+        assert manager.submit("https://example.com/repo.git") is default
+        recent = manager.submit("https://example.com/repo.git", since="1 month ago")
+        assert recent is not default
+        assert manager.submit("https://example.com/repo.git", since="1 month ago") is recent
+        assert manager.submit("https://example.com/repo.git", since="1 year ago") is not recent
+        assert manager.submit("https://example.com/other.git") is not default
+    finally:
+        analysis.release.set()
+        manager._pool.shutdown(wait=True)
+    assert default.result == {"metadata": {"repo": "https://example.com/repo.git"}}
+    assert recent.result == {"metadata": {"repo": "https://example.com/repo.git", "since": "1 month ago"}}
+    assert len(analysis.calls) == 4
+
+
+def test_finished_job_is_not_reused():
+    analysis = BlockingAnalysis()
+    analysis.release.set()
+    manager = JobManager(analysis, workers=1)
+    try:
+        first = manager.submit("https://example.com/repo.git")
+        manager._pool.submit(lambda: None).result()  # the single worker has finished the job
+        assert first.status == "done"
+        assert manager.submit("https://example.com/repo.git") is not first
+    finally:
+        manager._pool.shutdown(wait=True)
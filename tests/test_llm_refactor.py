@@ -0,0 +1,183 @@
+"""Chunk planning, answer checks and stitching of chunked LLM refactoring, with the benchmark's fake model."""
+import os
+
+import pytest
+
+from benchmarks.bench_llm_chunks import FakeLLM
+from refactor import llm_refactor
+from refactor.llm_refactor import Chunk, _accept, build_prompt, extract_code_from_response, js_units, plan_chunks, \
+    refactor_in_chunks
+
+with open(os.path.join(os.path.dirname(os.path.dirname(__file__)), "refactor.txt"), "r") as f:
+    TEMPLATE = f.read()
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    # Every file in these tests is chunked, and units longer than 8 lines are not grouped with a neighbour.
+    monkeypatch.setattr(llm_refactor, "LLM_CHUNK_MIN_LINES", 5)
+    monkeypatch.setattr(llm_refactor, "LLM_CHUNK_MAX_LINES", 8)
+
+
+def python_function(name, body_lines=2):
+    return f"def {name}(a, b):\n" + "".join(f"    a += b * {i}\n" for i in range(body_lines)) + "    return a\n"
+
+
+def smell(name):
+    """A unit-level smell naming ``name``, the way the detectors report them."""
+    return f"Long Parameter List: 1 - ['{name}(a, b)']"
+
+
+def echo(llm):
+    return lambda unit, unit_smells: extract_code_from_response(llm.invoke(build_prompt(TEMPLATE, unit, unit_smells)))
+
+
+PYTHON = (
+    "import os\n"                                 # 0
+    "\n"
+    + python_function("alpha")                    # 2-5
+    + python_function("beta")                     # 6-9
+    + "\n"
+    + python_function("gamma")                    # 11-14
+    + "\n"
+    + "class Service:\n"                          # 16-28, longer than LLM_CHUNK_MAX_LINES
+    + "    def start(self):\n"
+    + "        return 1\n"
+    + "\n"
+    + "    @staticmethod\n"                       # 20
+    + "    def stop(a, b):\n"
+    + "        a += b\n"
+    + "        return a\n"
+    + "\n"
+    + "    def state(self):\n"
+    + "        return 3\n"
+    + "\n"
+    + "    limit = 10\n"
+    + "\n"
+    + python_function("delta")                    # 30-33
+)
+
+JAVASCRIPT = (
+    "'use strict';\n"                              # 0
+    "var registry = {};\n"
+    "function load(items, config) {\n"            # 2-5
+    "  if (items) { return config; }\n"
+    "  return {};\n"
+    "}\n"
+    "const save = (items) => {\n"                  # 6-8
+    "  return items.map(function (item) { return item; });\n"
+    "};\n"
+    "if (registry) {\n"                            # 9-11, not a unit
+    "  registry.ready = true;\n"
+    "}\n"
+    "app.get('/', function handler(req, res) {\n"  # 12-14
+    "  res.send('ok');\n"
+    "});\n"
+)
+
+
+def test_python_units_come_from_the_ast():
+    chunks = plan_chunks(PYTHON, "python", [smell("gamma"), smell("delta")])
+    assert [(chunk.name, chunk.start, chunk.end, chunk.indent) for chunk in chunks] == [
+        ("gamma", 11, 15, ""), ("delta", 30, 34, "")]
+    assert chunks[0].smells == [smell("gamma")]
+
+
+def test_python_long_class_is_split_into_methods():
+    chunks = plan_chunks(PYTHON, "python", [smell("stop")])
+    # The decorator belongs to the method.
+    assert [(chunk.name, chunk.start, chunk.end, chunk.indent) for chunk in chunks] == [
+        ("Service.stop", 20, 24, "    ")]
+
+
+def test_neighbours_are_grouped_up_to_the_max_lines():
+    chunks = plan_chunks(PYTHON, "python", [smell("alpha"), smell("beta"), smell("gamma")])
+    # alpha and beta fit in 8 lines; adding gamma (line 15) would not.
+    assert [(chunk.name, chunk.start, chunk.end) for chunk in chunks] == [("alpha..beta", 2, 10), ("gamma", 11, 15)]
+    assert chunks[0].smells == sorted([smell("alpha"), smell("beta")])
+
+
+def test_units_with_another_indent_are_not_grouped():
+    chunks = plan_chunks(PYTHON, "python", [smell("state"), smell("delta")])
+    assert [chunk.name for chunk in chunks] == ["Service.state", "delta"]
+
+
+def test_javascript_units_are_brace_delimited_statements():
+    # The if block is a statement but defines nothing; the call with a callback is named after its callee.
+    assert js_units(JAVASCRIPT) == [("load", 2, 6), ("save", 6, 9), ("app", 12, 15)]
+    chunks = plan_chunks(JAVASCRIPT, "javascript", [smell("save"), smell("app")])
+    assert [(chunk.name, chunk.start, chunk.end) for chunk in chunks] == [("save", 6, 9), ("app", 12, 15)]
+
+
+def test_javascript_neighbours_are_grouped():
+    chunks = plan_chunks(JAVASCRIPT, "javascript", [smell("load"), smell("save")])
+    assert [(chunk.name, chunk.start, chunk.end) for chunk in chunks] == [("load..save", 2, 9)]
+
+
+def test_files_that_are_sent_whole():
+    assert plan_chunks("def f():\n    return 1\n", "python", [smell("f")]) is None  # short
+    assert plan_chunks(PYTHON + "def broken(:\n", "python", [smell("alpha")]) is None  # doesn't parse
+    assert plan_chunks(PYTHON, "java", [smell("alpha")]) is None  # no splitter
+    assert plan_chunks(PYTHON, "python", ["Large File: 1 - [400 lines]"]) is None  # file-level smell only
+
+
+def test_accept_rejects_python_that_does_not_parse():
+    chunk = Chunk("alpha", 2, 6, "", [])
+    assert _accept("python", chunk, "def alpha(a, b:\n    return a\n") is None
+    assert _accept("python", chunk, "   \n") is None
+    assert _accept("python", chunk, "def alpha(a, b):\n    return a") == "def alpha(a, b):\n    return a\n"
+
+
+def test_accept_indents_python_like_the_unit():
+    chunk = Chunk("Service.stop", 20, 24, "    ", [])
+    assert _accept("python", chunk, "def stop(a, b):\n    return a + b\n") == \
+        "    def stop(a, b):\n        return a + b\n"
+
+
+def test_accept_rejects_javascript_with_unbalanced_braces():
+    chunk = Chunk("load", 2, 6, "", [])
+    assert _accept("javascript", chunk, "function load(items) {\n  if (items) {\n  return 1;\n}\n") is None
+    assert _accept("javascript", chunk, "function load(items) }\n  return 1;\n{\n") is None
+    # Braces inside strings and comments don't count.
+    answer = "function load(items) {\n  return '{' + items; // }\n}\n"
+    assert _accept("javascript", chunk, answer) == answer
+
+
+@pytest.mark.parametrize("language, code, smells", [
+    ("python", PYTHON, [smell("alpha"), smell("gamma"), smell("stop"), smell("delta")]),
+    ("javascript", JAVASCRIPT, [smell("load"), smell("app")]),
+])
+def test_echoed_chunks_stitch_back_into_the_same_file(language, code, smells):
+    chunks = plan_chunks(code, language, smells)
+    result, replaced = refactor_in_chunks(code, language, chunks, echo(FakeLLM(0, 0, 4096)))
+    assert result == code
+    assert replaced == len(chunks)
+
+
+def test_answers_replace_only_their_line_range():
+    chunks = plan_chunks(PYTHON, "python", [smell("gamma"), smell("stop")])
+
+    def rename(unit, unit_smells):
+        return unit.replace("def gamma", "def gamma_renamed").replace("a += b\n", "a -= b\n")
+
+    result, replaced = refactor_in_chunks(PYTHON, "python", chunks, rename)
+    expected = PYTHON.replace("def gamma", "def gamma_renamed").replace("        a += b\n", "        a -= b\n")
+    assert result == expected
+    assert replaced == 2
+
+
+def test_unusable_answers_keep_the_original_unit():
+    chunks = plan_chunks(PYTHON, "python", [smell("alpha"), smell("gamma"), smell("delta")])
+    truncated = FakeLLM(0, 0, 20)  # cut off inside the code block
+
+    def refactor_unit(unit, unit_smells):
+        if "def gamma" in unit:
+            raise RuntimeError("rate limited")
+        if "def delta" in unit:
+            return extract_code_from_response(truncated.invoke(build_prompt(TEMPLATE, unit, unit_smells)))
+        return unit.replace("return a\n", "return a + 1\n")
+
+    result, replaced = refactor_in_chunks(PYTHON, "python", chunks, refactor_unit)
+    assert replaced == 1
+    assert result == PYTHON.replace(python_function("alpha"), python_function("alpha").replace("return a\n",
+                                                                                                "return a + 1\n"))
@@ -0,0 +1,48 @@
+"""Rule-based Python refactorings."""
+from detector.py_analyzer import analyze_py_source
+from refactor.py_refactor import refactor_python_code, refactor_shotgun_surgery
+
+CALLED_OFTEN = (
+    "def log(message):\n"
+    "    print(message)\n"
+    "\n"
+    "\n"
+    "class Job:\n"
+    "    def run(self):\n"
+    "        pass\n"
+    "\n"
+    "    def log(self):\n"
+    "        pass\n"
+    "\n"
+    "\n"
+    "def main():\n"
+    + "".join(f"    log('step {i}')\n" for i in range(11))
+)
+NOTE = "# Shotgun surgery: Refactor to group related logic\n"
+
+
+def shotgun_smell(code):
+    return next(smell for smell in analyze_py_source(code)[0] if smell.startswith("Shotgun Surgery"))
+
+
+def test_shotgun_surgery_annotates_the_functions_named_in_the_smell():
+    smell = shotgun_smell(CALLED_OFTEN)
+    assert smell == "Shotgun Surgery (Function called >10 times): 1 - [('log', 11)]"
+    result = refactor_shotgun_surgery(CALLED_OFTEN, smell)
+    # Definitions only, at their own indentation; the calls are left alone.
+    assert result == CALLED_OFTEN.replace("def log(message)", NOTE + "def log(message)").replace(
+        "    def log(self)", "    " + NOTE + "    def log(self)")
+    assert result.count(NOTE) == 2
+
+
+def test_shotgun_surgery_without_named_functions_changes_nothing():
+    assert refactor_shotgun_surgery(CALLED_OFTEN, "Shotgun Surgery (Function called >10 times): 0 - []") \
+        == CALLED_OFTEN
+    assert refactor_shotgun_surgery(CALLED_OFTEN, None) == CALLED_OFTEN
+
+
+def test_shotgun_surgery_output_grows_with_the_named_functions_only():
+    # Each character of the description used to be inserted before each of its occurrences.
+    code = "".join(f"def f{i}(a):\n    return a\n\n" for i in range(50)) + "def main():\n" + "    f1(1)\n" * 11
+    result = refactor_python_code(code, [shotgun_smell(code)])
+    assert len(result) == len(code) + len(NOTE)
@@ -0,0 +1,69 @@
+"""Report store: how smell strings are counted."""
+import os
+import re
+
+import pytest
+
+from detector.report_store import smell_count, smell_type, stored_result
+
+ROOT = os.path.dirname(os.path.dirname(__file__))
+
+# One string per smells.append in the analyzers, with its (type, count).
+PYTHON_SMELLS = [
+    ("High Complexity Functions (>10): 2 - ['parse(14)', 'walk(12)']", "High Complexity Functions", 2),
+    ("Low Maintainability Index (<20): 12.35", "Low Maintainability Index", 1),
+    ("Large File (>500 lines): 812 lines", "Large File", 1),
+    ("Deeply Nested Functions (>3): 1 - ['walk(5)']", "Deeply Nested Functions", 1),
+    ("Large Functions (>100 lines): 2 - ['main(140)', 'run(120)']", "Large Functions", 2),
+    ("Feature Envy (>5 external calls): 3 - ['a(6)', 'b(7)', 'c(9)']", "Feature Envy", 3),
+    ("Data Clumps (Repeated params): 2 sets - [['a', 'b', 'c'], ['x', 'y', 'z']]", "Data Clumps", 2),
+    ("Dead Code Variables (Unused): 4 - ['a', 'b', 'c', 'd']", "Dead Code Variables", 4),
+    ("Shotgun Surgery (Function called >10 times): 1 - [('log', 11)]", "Shotgun Surgery", 1),
+    ("Long Lambdas (>3 elements): 2 - lines [4, 9]", "Long Lambdas", 2),
+    ("Useless Exceptions (Try-Pass): 3 - lines [10, 20, 30]", "Useless Exceptions", 3),
+    ("Duplicate Code (Identical functions): 2 sets - [['a', 'b'], ['c', 'd', 'e']]", "Duplicate Code", 2),
+    ("Large Classes (>10 methods): 1 - ['Parser(14)']", "Large Classes", 1),
+    ("Too Many Returns (>3): 2 - ['a(4)', 'b(6)']", "Too Many Returns", 2),
+    ("Global Variables (Not in function/class): 5 - ['A', 'B', 'C', 'D', 'E']", "Global Variables", 5),
+    ("Too Many Parameters (>5): 1 - ['build(8)']", "Too Many Parameters", 1),
+]
+JS_SMELLS = [
+    ("Global Variables Found: 3 variables", "Global Variables Found", 3),
+    ("Too Many Parameters (>4): 6 parameters", "Too Many Parameters", 1),
+    ("Long Function (>50 lines): 120 lines", "Long Function", 1),
+    ("Large File (>300 lines): 812 lines", "Large File", 1),
+    ("Console Log Overuse (≥10 logs): 14 logs", "Console Log Overuse", 1),
+    ("Deep Nesting (>=4 levels): 6 levels", "Deep Nesting", 1),
+    ("Magic Numbers Found: 12 occurrences", "Magic Numbers Found", 12),
+    ("Duplicate Code Blocks: 2 blocks repeated", "Duplicate Code Blocks", 2),
+    ("Unused Variables: 16 variables", "Unused Variables", 16),
+    ("Long Chained Calls Found: 3 chains", "Long Chained Calls Found", 3),
+    ("Inconsistent Naming Found: Mixed camelCase and snake_case (4 snake, 30 camel)", "Inconsistent Naming Found", 1),
+    ("Callback Hell Detected: 5 nested functions", "Callback Hell Detected", 1),
+    ("Low Comment Density (<2%): 0 comments", "Low Comment Density", 1),
+    ("Empty Catch Blocks Found: 2 blocks", "Empty Catch Blocks Found", 2),
+    ("Unnecessary Semicolons: 4 found", "Unnecessary Semicolons", 4),
+]
+
+
+@pytest.mark.parametrize("smell, expected_type, expected_count", PYTHON_SMELLS + JS_SMELLS)
+def test_smell_type_and_count(smell, expected_type, expected_count):
+    assert smell_type(smell) == expected_type
+    assert smell_count(smell) == expected_count
+
+
+@pytest.mark.parametrize("module, cases", [("py_analyzer.py", PYTHON_SMELLS), ("js_analyzer.py", JS_SMELLS)])
+def test_every_smell_format_is_covered(module, cases):
+    with open(os.path.join(ROOT, "detector", module), "r", encoding="utf-8") as f:
+        source = f.read()
+    # The literal text of each smell up to its first substitution.
+    formats = re.findall(r'smells\.append\(f"([^{"]*)', source)
+    assert len(formats) == len(cases)
+    for prefix in formats:
+        assert any(smell.startswith(prefix) for smell, _, _ in cases), prefix
+
+
+def test_stored_result_counts_each_smell():
+    result = stored_result({"smells": [smell for smell, _, _ in JS_SMELLS], "metrics": {"total_lines": 812}})
+    assert dict(result.smells) == {smell_type: count for _, smell_type, count in JS_SMELLS}
+    assert stored_result(error="boom").smells == ()